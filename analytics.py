@@ -0,0 +1,154 @@
+"""Registration analytics for the admin dashboard, read from rollup tables.
+
+``registration_daily`` holds per-day counts (UTC days, as stored in
+registration_date and approved_date) and ``registration_references`` the
+count per reference. Triggers on event_registrations keep both current (see
+migration 6 in migrations.py), so ``summary`` reads one row per day and the
+top references instead of scanning the registrations.
+
+``rebuild_rollups`` recomputes both tables from event_registrations. The
+migration uses it to backfill; run it by hand after editing the database
+outside the app with triggers disabled, or if ``check`` reports a difference.
+
+    python analytics.py rebuild [DATABASE]
+    python analytics.py check [DATABASE]     # exit 1 if the rollups disagree with the registrations
+"""
+import argparse
+import sqlite3
+import sys
+from datetime import datetime, timedelta, timezone
+
+TOP_REFERENCES = 10
+
+# Same counting rules as the triggers (migration 6); a blank voucher is no voucher, as in registrations.py
+_DAILY_FROM_REGISTRATIONS = '''
+    SELECT day, SUM(registered), SUM(approved), SUM(with_voucher), SUM(approvals)
+    FROM (
+        SELECT IFNULL(date(registration_date), '') AS day, 1 AS registered,
+               CASE WHEN is_approved THEN 1 ELSE 0 END AS approved,
+               COALESCE(voucher_number, '') != '' AS with_voucher, 0 AS approvals
+        FROM event_registrations
+        UNION ALL
+        SELECT IFNULL(date(approved_date), ''), 0, 0, 0, 1
+        FROM event_registrations WHERE approved_date IS NOT NULL AND is_approved
+    )
+    GROUP BY day
+'''
+_REFERENCES_FROM_REGISTRATIONS = '''
+    SELECT lower(trim(IFNULL(reference, ''))), COUNT(*), SUM(CASE WHEN is_approved THEN 1 ELSE 0 END)
+    FROM event_registrations
+    GROUP BY 1
+'''
+
+
+def rebuild_rollups(connection):
+    """Recomputes the rollup tables from event_registrations. Runs in the caller's transaction."""
+    connection.execute('DELETE FROM registration_daily')
+    connection.execute(f'''
+        INSERT INTO registration_daily (day, registered, approved, with_voucher, approvals)
+        {_DAILY_FROM_REGISTRATIONS}
+    ''')
+    connection.execute('DELETE FROM registration_references')
+    connection.execute(f'''
+        INSERT INTO registration_references (reference, registrations, approved)
+        {_REFERENCES_FROM_REGISTRATIONS}
+    ''')
+
+
+def differences(connection):
+    """Returns the rollup rows that disagree with a fresh count, as (table, key, stored, expected)."""
+    found = []
+    checks = [
+        ('registration_daily', 'SELECT day, registered, approved, with_voucher, approvals FROM registration_daily',
+         _DAILY_FROM_REGISTRATIONS),
+        ('registration_references', 'SELECT reference, registrations, approved FROM registration_references',
+         _REFERENCES_FROM_REGISTRATIONS),
+    ]
+    for table, stored_query, expected_query in checks:
+        stored = {row[0]: tuple(row[1:]) for row in connection.execute(stored_query)}
+        expected = {row[0]: tuple(row[1:]) for row in connection.execute(expected_query)}
+        for key in sorted(stored.keys() | expected.keys()):
+            if stored.get(key) != expected.get(key):
+                found.append((table, key, stored.get(key), expected.get(key)))
+    return found
+
+
+def summary(db, days=30, top=TOP_REFERENCES, today=None):
+    """Totals, the last ``days`` days (oldest first, days without registrations included) and top references.
+
+    Reads the rollup tables only: the work grows with the number of days and
+    references, not with the number of registrations.
+    """
+    totals = db.execute('''
+        SELECT IFNULL(SUM(registered), 0), IFNULL(SUM(approved), 0), IFNULL(SUM(with_voucher), 0)
+        FROM registration_daily
+    ''').fetchone()
+    registered, approved, with_voucher = totals[0], totals[1], totals[2]
+
+    today = today or datetime.now(timezone.utc).date()
+    first = today - timedelta(days=days - 1)
+    stored = {
+        row[0]: row for row in db.execute('''
+            SELECT day, registered, approved, with_voucher, approvals
+            FROM registration_daily WHERE day >= ? AND day <= ? ORDER BY day
+        ''', (first.isoformat(), today.isoformat()))
+    }
+    series = []
+    for offset in range(days):
+        day = (first + timedelta(days=offset)).isoformat()
+        row = stored.get(day)
+        series.append({
+            'day': day,
+            'registered': row[1] if row else 0,
+            'approved': row[2] if row else 0,
+            'with_voucher': row[3] if row else 0,
+            'approvals': row[4] if row else 0,
+        })
+
+    references = db.execute('''
+        SELECT reference, registrations, approved FROM registration_references
+        ORDER BY registrations DESC, reference LIMIT ?
+    ''', (top,)).fetchall()
+    return {
+        'totals': {
+            'registrations': registered,
+            'approved': approved,
+            'approval_rate': approved / registered if registered else None,
+            'with_voucher': with_voucher,
+            'voucher_rate': with_voucher / registered if registered else None,
+        },
+        'days': series,
+        'top_references': [
+            {'reference': row[0], 'registrations': row[1], 'approved': row[2]} for row in references
+        ],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=['rebuild', 'check'])
+    parser.add_argument('database', nargs='?', default='database.db')
+    args = parser.parse_args()
+
+    connection = sqlite3.connect(args.database, timeout=30)
+    try:
+        if args.command == 'rebuild':
+            connection.execute('BEGIN IMMEDIATE')
+            rebuild_rollups(connection)
+            connection.commit()
+            days, references = (connection.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+                                for table in ('registration_daily', 'registration_references'))
+            print(f'Rebuilt {days} day(s) and {references} reference(s)')
+        else:
+            found = differences(connection)
+            for table, key, stored, expected in found:
+                print(f'{table} {key!r}: stored {stored}, expected {expected}')
+            if found:
+                sys.exit(f'{len(found)} rollup row(s) differ; run `python analytics.py rebuild`')
+            print('Rollups match the registrations')
+    finally:
+        connection.close()
+
+
+if __name__ == '__main__':
+    main()
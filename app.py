@@ -1,38 +1,270 @@
 import os
+import mimetypes
 import sqlite3
-from flask import Flask, render_template, request, redirect, url_for, flash, session, g, send_from_directory, make_response
-from werkzeug.utils import secure_filename
-import pandas as pd
-from reportlab.lib.pagesizes import letter, A4, landscape
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-from reportlab.lib import colors
-from io import BytesIO
+import json
+import time
+import sys
+import tempfile
+import subprocess
+import threading
+import functools
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from flask import Flask, Request, before_render_template, template_rendered, render_template, request, redirect, url_for, flash, session, g, abort, send_from_directory, send_file, make_response, jsonify, Response
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.security import safe_join
+from jinja2 import FileSystemBytecodeCache
+import migrations
+import registrations
+import metrics
+import sqlite_pool
+import exports
+import images
+import uploads
+import notice_index
+import assets
+import auth
+import analytics
+import backup
+from page_cache import render_cached_page, bump_data_version
 from datetime import datetime
 
 # --- App Configuration ---
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your_super_secret_key_here' # Change this!
+# Admin logins (see auth.py). The hash method sets how much CPU a login costs;
+# `python auth.py calibrate` suggests one for the host. Failed logins are
+# limited per client address and per username within a window of seconds;
+# a username's limit is higher so that strangers cannot easily lock admins out.
+# Each worker trusts a resolved admin session for AUTH_CACHE_TTL seconds.
+app.config['PASSWORD_HASH_METHOD'] = auth.DEFAULT_METHOD
+app.config['LOGIN_MAX_FAILURES_PER_ADDRESS'] = 10
+app.config['LOGIN_MAX_FAILURES_PER_USERNAME'] = 50
+app.config['LOGIN_FAILURE_WINDOW'] = 15 * 60
+app.config['AUTH_CACHE_TTL'] = 60
 app.config['UPLOAD_FOLDER'] = 'static/uploads'
 app.config['ALLOWED_EXTENSIONS'] = {'pdf'}
 app.config['ALLOWED_IMAGE_EXTENSIONS'] = {'jpg', 'jpeg', 'png', 'webp'}
 app.config['DATABASE'] = 'database.db'
+# SQLite connections are pooled per worker (see sqlite_pool.py). WAL lets the
+# public pages read while an admin or a registration writes; use 'DELETE' if
+# the database ever lives on a network file system. busy_timeout is in
+# milliseconds, a negative cache_size is in KiB, mmap_size in bytes, and
+# cached_statements is the number of prepared statements kept per connection.
+app.config['SQLITE_POOL_SIZE'] = 8
+app.config['SQLITE_JOURNAL_MODE'] = 'WAL'
+app.config['SQLITE_BUSY_TIMEOUT'] = 5000
+app.config['SQLITE_SYNCHRONOUS'] = 'NORMAL'
+app.config['SQLITE_CACHE_SIZE'] = -16000
+app.config['SQLITE_MMAP_SIZE'] = 64 * 1024 * 1024
+app.config['SQLITE_CACHED_STATEMENTS'] = 256
+# Upload limits in bytes: whole requests are refused up front from their
+# Content-Length, and each file is cut off as soon as it passes the limit for
+# its type.
+app.config['MAX_CONTENT_LENGTH'] = 25 * 1024 * 1024
+app.config['UPLOAD_SIZE_LIMITS'] = {'pdf': 20 * 1024 * 1024, 'image': 10 * 1024 * 1024}
+# Let the web server send /uploads files instead of a Python worker: set
+# USE_X_SENDFILE for Apache's mod_xsendfile, or UPLOAD_ACCEL_REDIRECT_PREFIX to
+# an nginx `internal` location that maps to the upload folder (e.g.
+# '/protected-uploads/'). The web server then also handles Range requests.
+app.config['USE_X_SENDFILE'] = False
+app.config['UPLOAD_ACCEL_REDIRECT_PREFIX'] = None
+# CSS/JS bundles (see assets.py): sources, and where the fingerprinted builds
+# are written and served from as /static/dist
+app.config['ASSET_SOURCE_FOLDER'] = assets.SOURCE_FOLDER
+app.config['ASSET_FOLDER'] = 'static/dist'
+# Live registration stream for the dashboard (Server-Sent Events). Off by
+# default: Passenger's Python workers serve one request at a time, so every
+# open dashboard tab would hold a whole worker (and a pooled connection) for up
+# to SSE_MAX_DURATION seconds and then reconnect, taking that worker away from
+# public traffic. Without it the dashboard polls the delta endpoint every 5 s,
+# which costs one short request (usually a 304). Turn it on only with spare
+# workers or a threaded server: one worker per admin tab.
+# How often each stream checks the change log, how often it sends a keep-alive,
+# and how long before the browser must reconnect (reconnecting frees the worker
+# and resumes from Last-Event-ID).
+app.config['SSE_ENABLED'] = False
+app.config['SSE_POLL_INTERVAL'] = 0.5
+app.config['SSE_HEARTBEAT_INTERVAL'] = 15
+app.config['SSE_MAX_DURATION'] = 300
+app.config['REGISTRATION_PAGE_SIZE'] = 50
+app.config['REGISTRATION_PAGE_SIZE_MAX'] = 200
+# Commit registrations submitted at the same time in one transaction, through a
+# writer thread per worker (see registrations.py). Worth it when a worker runs
+# several request threads; REGISTRATION_SUBMIT_TIMEOUT is how long, in seconds,
+# a request waits for its registration to be written.
+app.config['REGISTRATION_GROUP_COMMIT'] = False
+app.config['REGISTRATION_BATCH_SIZE'] = 100
+app.config['REGISTRATION_SUBMIT_TIMEOUT'] = 10
+# Most registrations one bulk request or voucher import may change
+app.config['REGISTRATION_BULK_MAX'] = 10000
+# Exports are built in a temp file that stays in memory up to this size and
+# spills to disk beyond it.
+app.config['EXPORT_SPOOL_MAX_SIZE'] = 1024 * 1024
+# Background exports: where finished files are kept (not publicly served), how
+# many worker processes build them, and when a job stuck in 'running' (its
+# worker was recycled) is given up on, in seconds.
+app.config['EXPORT_FOLDER'] = 'exports'
+app.config['EXPORT_WORKERS'] = 1
+app.config['EXPORT_JOB_TIMEOUT'] = 900
+# Import the export libraries when the worker starts instead of on the first
+# export. Trades a slower cold start for a faster first export.
+app.config['PRELOAD_EXPORTS'] = False
+# Compiled templates are kept here and shared by all workers, so a new worker
+# loads them instead of compiling them again (None turns this off).
+# PRELOAD_TEMPLATES compiles every template when the worker starts rather than
+# on its first request.
+app.config['TEMPLATE_CACHE_DIR'] = 'cache/templates'
+app.config['PRELOAD_TEMPLATES'] = False
+# Rendered copies of the static public pages, shared by all workers
+app.config['PAGE_CACHE_ENABLED'] = True
+app.config['PAGE_CACHE_DIR'] = 'cache/pages'
+app.config['PAGE_CACHE_MAX_AGE'] = 300
+# Pages built from the gallery and notices tables are re-rendered when an admin
+# changes them; the version tokens live here, and browsers keep such pages for
+# this many seconds before revalidating.
+app.config['DATA_VERSION_DIR'] = 'cache/versions'
+app.config['PAGE_CACHE_DATA_MAX_AGE'] = 0
+# Cached pages are also re-rendered when anything in these folders is added or
+# removed (e.g. image variants generated at deploy time).
+app.config['PAGE_CACHE_WATCH'] = [os.path.join(app.config['UPLOAD_FOLDER'], images.VARIANT_FOLDER),
+                                  app.config['ASSET_FOLDER']]
+# Request metrics (see metrics.py). Each worker writes its histograms to
+# METRICS_DIR at most every METRICS_FLUSH_INTERVAL seconds. /metrics serves all
+# workers' numbers in the Prometheus format to logged-in admins, or to scrapers
+# sending "Authorization: Bearer <METRICS_TOKEN>" when a token is set.
+app.config['METRICS_ENABLED'] = True
+app.config['METRICS_DIR'] = 'cache/metrics'
+app.config['METRICS_FLUSH_INTERVAL'] = 10
+app.config['METRICS_TOKEN'] = None
+# Admins can profile a single request by adding ?_profile=1 to its URL; the
+# sampled stacks are kept in PROFILE_DIR (newest PROFILE_KEEP reports) and
+# listed on /admin/metrics. PROFILE_INTERVAL is the sampling period in seconds.
+app.config['PROFILING_ENABLED'] = True
+app.config['PROFILE_DIR'] = 'cache/profiles'
+app.config['PROFILE_INTERVAL'] = 0.002
+app.config['PROFILE_KEEP'] = 20
+# Snapshots of the database (see backup.py), taken by a background thread in
+# whichever worker finds the last one BACKUP_INTERVAL seconds old (None turns
+# the thread off; `python backup.py snapshot` can run from cron instead).
+# Keeps the newest BACKUP_KEEP_RECENT snapshots plus the newest one of each of
+# the last BACKUP_KEEP_DAILY days.
+app.config['BACKUP_FOLDER'] = backup.DEFAULT_FOLDER
+app.config['BACKUP_INTERVAL'] = 60 * 60
+app.config['BACKUP_KEEP_RECENT'] = backup.KEEP_RECENT
+app.config['BACKUP_KEEP_DAILY'] = backup.KEEP_DAILY
 
 # --- Helper Functions ---
 
+_export_executor = None
+_index_executor = None
+_registration_writer = None
+_backup_scheduler = None
+_db_pool = None
+
+def get_db_pool():
+    """Returns this worker's connection pool, creating it on first use."""
+    global _db_pool
+    if _db_pool is None:
+        _db_pool = sqlite_pool.ConnectionPool.from_config(app.config)
+    return _db_pool
+
 def get_db():
-    """Opens a new database connection if there is none yet for the current application context."""
+    """Takes a pooled database connection for the current application context if it has none yet."""
     if 'db' not in g:
-        g.db = sqlite3.connect(app.config['DATABASE'])
-        g.db.row_factory = sqlite3.Row # Allows accessing columns by name
+        db = get_db_pool().acquire() # Rows allow accessing columns by name
+        # Counts and times the request's queries for the metrics
+        g.db = metrics.InstrumentedConnection(db) if app.config['METRICS_ENABLED'] else db
     return g.db
 
 @app.teardown_appcontext
 def close_db(error):
-    """Closes the database again at the end of the request."""
-    if hasattr(g, 'db'):
-        g.db.close()
+    """Returns the connection to the pool at the end of the request."""
+    db = g.pop('db', None)
+    if isinstance(db, metrics.InstrumentedConnection):
+        db = db.connection
+    if db is not None:
+        get_db_pool().release(db)
+
+@app.before_request
+def start_request_metrics():
+    g.request_started = time.perf_counter()
+    if app.config['PROFILING_ENABLED'] and request.args.get('_profile') and current_admin():
+        g.profiler = metrics.SamplingProfiler(threading.get_ident(), app.config['PROFILE_INTERVAL'])
+        g.profiler.start()
+
+@app.before_request
+def start_backup_scheduler():
+    """Starts this worker's backup thread on its first request (after any fork by the server)."""
+    if app.config['BACKUP_INTERVAL']:
+        get_backup_scheduler().start()
+
+@app.after_request
+def record_request_metrics(response):
+    """Records the request in this worker's metrics and stores its profile if one was taken."""
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.stop()
+        name = metrics.save_profile(
+            app.config['PROFILE_DIR'], request.endpoint or 'unmatched',
+            profiler.report(f'{request.method} {request.full_path} -> {response.status}'),
+            keep=app.config['PROFILE_KEEP']
+        )
+        response.headers['X-Profile'] = url_for('view_profile', name=name)
+    if app.config['METRICS_ENABLED'] and 'request_started' in g:
+        db = g.get('db')
+        instrumented = isinstance(db, metrics.InstrumentedConnection)
+        metrics.observe_request(
+            request.endpoint or 'unmatched', request.method, response.status_code,
+            time.perf_counter() - g.request_started, response.content_length,
+            db.queries if instrumented else 0, db.seconds if instrumented else 0.0
+        )
+        metrics.flush(app.config['METRICS_DIR'], app.config['METRICS_FLUSH_INTERVAL'])
+    return response
+
+@before_render_template.connect_via(app)
+def start_template_timer(sender, template, context, **extra):
+    g.setdefault('template_timers', []).append(time.perf_counter())
+
+@template_rendered.connect_via(app)
+def record_template_time(sender, template, context, **extra):
+    timers = g.get('template_timers')
+    if app.config['METRICS_ENABLED'] and timers:
+        metrics.observe('template_render_seconds', (('template', template.name),), time.perf_counter() - timers.pop())
+
+class UploadRequest(Request):
+    """Request that streams uploaded files straight to the upload folder.
+
+    Each file goes through uploads.UploadStream, which hashes it, sniffs its
+    type and stops at the size limit for its type while it is being received.
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        extension = filename.rsplit('.', 1)[1].lower() if filename and '.' in filename else ''
+        limits = app.config['UPLOAD_SIZE_LIMITS']
+        if extension in app.config['ALLOWED_EXTENSIONS']:
+            max_size = limits['pdf']
+        elif extension in app.config['ALLOWED_IMAGE_EXTENSIONS']:
+            max_size = limits['image']
+        else:
+            max_size = min(limits.values())
+        return uploads.UploadStream(app.config['UPLOAD_FOLDER'], max_size)
+
+app.request_class = UploadRequest
+
+def init_schema():
+    """Applies pending schema migrations (see migrations.py)."""
+    connection = get_db_pool().connect()
+    try:
+        migrations.migrate(connection)
+        # Indexes built with an older tokenizer (see notice_index.FTS_TOKENIZE)
+        if not notice_index.index_is_current(connection):
+            notice_index.rebuild_index(connection, stale_only=True)
+        uploads.register_existing(connection, app.config['UPLOAD_FOLDER'])
+        # Notices uploaded before indexing existed, or whose worker was recycled mid-job
+        if notice_index.pending_files(connection, app.config['UPLOAD_FOLDER']):
+            get_index_executor().submit(run_index_process)
+    finally:
+        connection.close()
 
 def allowed_file(filename):
     """Checks if the file extension is allowed."""
@@ -44,91 +276,289 @@ def allowed_image_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_IMAGE_EXTENSIONS']
 
+def current_admin():
+    """Username of the admin logged in to this session, or None.
+
+    Resolved once per request, and from this worker's cache unless the user
+    was last looked up more than AUTH_CACHE_TTL seconds ago.
+    """
+    if 'admin' not in g:
+        user_id = session.get('user_id')
+        g.admin = None
+        if user_id is not None:
+            g.admin = auth.resolve_identity(
+                lambda user_id: get_db().execute('SELECT username, password FROM users WHERE id = ?', (user_id,)).fetchone(),
+                user_id, session.get('auth'), app.config['AUTH_CACHE_TTL']
+            )
+    return g.admin
+
+def login_required(view=None, *, api=False):
+    """Lets only logged-in admins through to a view.
+
+    Others are sent to the login page, or get a 401 JSON error with api=True.
+    """
+    if view is None:
+        return functools.partial(login_required, api=api)
+
+    @functools.wraps(view)
+    def wrapped(*args, **kwargs):
+        if current_admin() is None:
+            if api:
+                return {'error': 'Unauthorized'}, 401
+            return redirect(url_for('admin_login'))
+        return view(*args, **kwargs)
+    return wrapped
+
+def login_limits(username):
+    """The failed-login limits that apply to this request, as auth.retry_after expects them."""
+    window = app.config['LOGIN_FAILURE_WINDOW']
+    return [
+        (f'address:{request.remote_addr}', app.config['LOGIN_MAX_FAILURES_PER_ADDRESS'], window),
+        (f'username:{username}', app.config['LOGIN_MAX_FAILURES_PER_USERNAME'], window),
+    ]
+
+@app.template_global()
+def responsive_image(filename, alt, sizes='100vw', class_='', eager=False):
+    """Renders an image from the upload folder as a <picture> with resized WebP/AVIF variants.
+
+    sizes is the image's displayed width (the HTML sizes attribute). Pass
+    eager=True for the main image above the fold; everything else loads lazily.
+    """
+    return images.render_responsive_image(
+        app.config['UPLOAD_FOLDER'],
+        lambda name: url_for('uploaded_file', filename=name),
+        filename, alt, sizes=sizes, class_=class_, eager=eager
+    )
+
+@app.template_global()
+def asset_url(name):
+    """URL of a fingerprinted CSS/JS bundle, e.g. asset_url('layout.css'); see assets.py."""
+    built = assets.built_file(app.config['ASSET_SOURCE_FOLDER'], app.config['ASSET_FOLDER'], name)
+    return url_for('asset', filename=built)
+
+def registration_to_dict(reg):
+    """Converts an event_registrations row into the JSON shape used by the dashboard."""
+    return {
+        'id': reg['id'],
+        'full_name': reg['full_name'],
+        'mobile_number': reg['mobile_number'],
+        'address': reg['address'],
+        'reference': reg['reference'],
+        'voucher_number': reg['voucher_number'],
+        'is_approved': bool(reg['is_approved']),
+        'registration_date': reg['registration_date']
+    }
+
+def get_export_executor():
+    """Returns this worker's export pool, starting it on first use.
+
+    Each pool thread runs one job in a fresh ``python exports.py`` process, so a
+    large export never competes with requests for this worker's memory or GIL,
+    and nothing forks a copy of a running web worker.
+    """
+    global _export_executor
+    if _export_executor is None:
+        _export_executor = ThreadPoolExecutor(
+            max_workers=app.config['EXPORT_WORKERS'],
+            thread_name_prefix='export'
+        )
+    return _export_executor
+
+def run_export_process(job_id):
+    """Runs export job job_id in a child process and waits for it to finish."""
+    subprocess.run([
+        sys.executable, os.path.abspath(exports.__file__), 'run-job',
+        os.path.abspath(app.config['DATABASE']),
+        os.path.abspath(app.config['EXPORT_FOLDER']),
+        str(job_id)
+    ], check=False)
+
+def get_backup_scheduler():
+    """Returns this worker's database snapshot scheduler (see backup.py)."""
+    global _backup_scheduler
+    if _backup_scheduler is None:
+        _backup_scheduler = backup.Scheduler(
+            app.config['DATABASE'], app.config['BACKUP_FOLDER'], app.config['BACKUP_INTERVAL'],
+            keep_recent=app.config['BACKUP_KEEP_RECENT'], keep_daily=app.config['BACKUP_KEEP_DAILY'],
+            logger=app.logger
+        )
+    return _backup_scheduler
+
+def get_index_executor():
+    """Returns this worker's single-thread pool for notice PDF indexing."""
+    global _index_executor
+    if _index_executor is None:
+        _index_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='notice-index')
+    return _index_executor
+
+def run_index_process():
+    """Indexes (and precompresses) new notice PDFs in a child process, then refreshes /notices."""
+    subprocess.run([
+        sys.executable, os.path.abspath(notice_index.__file__), 'pending',
+        os.path.abspath(app.config['DATABASE']),
+        os.path.abspath(app.config['UPLOAD_FOLDER'])
+    ], check=False)
+    with app.app_context():
+        bump_data_version('notices')
+
+def get_registration_writer():
+    """Returns this worker's group-commit writer for registrations, creating it on first use."""
+    global _registration_writer
+    if _registration_writer is None:
+        _registration_writer = registrations.RegistrationWriter(
+            get_db_pool().connect, batch_size=app.config['REGISTRATION_BATCH_SIZE']
+        )
+    return _registration_writer
+
+def submit_registration(full_name, address, mobile_number, reference):
+    """Stores a registration and returns True, or False if the mobile number is already registered.
+
+    Raises FutureTimeoutError when the group-commit writer did not get to the
+    registration in time; it is then withdrawn, so it is never stored.
+    """
+    if app.config['REGISTRATION_GROUP_COMMIT']:
+        future = get_registration_writer().submit(full_name, address, mobile_number, reference)
+        try:
+            return future.result(timeout=app.config['REGISTRATION_SUBMIT_TIMEOUT'])
+        except FutureTimeoutError:
+            if future.cancel():
+                raise
+            # The writer is committing it right now
+            return future.result()
+    db = get_db()
+    inserted = registrations.insert_registration(db, full_name, address, mobile_number, reference)
+    db.commit()
+    return inserted
+
+def export_job_to_dict(job):
+    """Converts an export_jobs row into the JSON shape polled by the dashboard."""
+    total = job['rows_total']
+    return {
+        'id': job['id'],
+        'kind': job['kind'],
+        'status': job['status'],
+        'rows_done': job['rows_done'],
+        'rows_total': total,
+        'progress': 1.0 if job['status'] == 'done' else (job['rows_done'] / total if total else 0.0),
+        'error': job['error'],
+        'download_url': url_for('download_export_job', job_id=job['id']) if job['status'] == 'done' else None
+    }
+
+def prefix_range(prefix):
+    """Returns bounds so that ``column >= low AND column < high`` matches values starting with prefix.
+
+    Unlike LIKE 'x%', a range can always be answered from an index.
+    """
+    return prefix, prefix + '\U0010ffff'
+
+def get_registration_cursor(db):
+    """Returns the id of the latest entry in the registration change log (0 if empty)."""
+    return db.execute('SELECT COALESCE(MAX(id), 0) FROM registration_changes').fetchone()[0]
+
 # --- Public-Facing Routes ---
 
 @app.route('/')
 def home():
-    db = get_db()
-    gallery_images = db.execute('SELECT id, title, filename FROM gallery WHERE is_active = 1 ORDER BY sort_order ASC, timestamp DESC').fetchall()
-    return render_template('public/index.html', gallery_images=gallery_images)
+    def context():
+        db = get_db()
+        gallery_images = db.execute('SELECT id, title, filename FROM gallery WHERE is_active = 1 ORDER BY sort_order ASC, timestamp DESC').fetchall()
+        return {'gallery_images': gallery_images}
+    return render_cached_page('public/index.html', data=('gallery',), context=context)
 
 @app.route('/about')
 def about():
-    return render_template('public/about.html')
+    return render_cached_page('public/about.html')
 
 @app.route('/about/group-of-chairman')
 def group_of_chairman():
-    return render_template('public/chairmanofgroup.html')
+    return render_cached_page('public/chairmanofgroup.html')
 
 @app.route('/about/founder')
 def founder():
-    return render_template('public/founder.html')
+    return render_cached_page('public/founder.html')
 
 @app.route('/about/cofounder')
 def cofounder():
-    return render_template('public/cofounder.html')
+    return render_cached_page('public/cofounder.html')
 
 @app.route('/about/chairman')
 def chairman():
-    return render_template('public/chairman.html')
+    return render_cached_page('public/chairman.html')
 
 @app.route('/about/board-of-directors')
 def board_of_directors():
-    return render_template('public/board_of_directors.html')
+    return render_cached_page('public/board_of_directors.html')
 
 @app.route('/about/company-profile')
 def company_profile():
-    return render_template('public/company_profile.html')
+    return render_cached_page('public/company_profile.html')
 
 @app.route('/about/managing-director')
 def managing_director():
-    return render_template('public/managing_director.html')
+    return render_cached_page('public/managing_director.html')
 
 @app.route('/about/cfo')
 def cfo():
-    return render_template('public/cfo.html')
+    return render_cached_page('public/cfo.html')
 
 @app.route('/about/dcfo')
 def dcfo():
-    return render_template('public/dcfo.html')
+    return render_cached_page('public/dcfo.html')
 
 @app.route('/about/cio')
 def cio():
-    return render_template('public/cio.html')
+    return render_cached_page('public/cio.html')
 
 @app.route('/about/board-member-1')
 def board_member_1():
-    return render_template('public/board_member_1.html')
+    return render_cached_page('public/board_member_1.html')
 
 @app.route('/about/board-member-2')
 def board_member_2():
-    return render_template('public/board_member_2.html')
+    return render_cached_page('public/board_member_2.html')
 
 @app.route('/about/board-member-3')
 def board_member_3():
-    return render_template('public/board_member_3.html')
+    return render_cached_page('public/board_member_3.html')
 
 @app.route('/about/software-engineer')
 def software_engineer():
-    return render_template('public/software_engineer.html')
+    return render_cached_page('public/software_engineer.html')
 
 @app.route('/services')
 def services():
-    return render_template('public/services.html')
+    return render_cached_page('public/services.html')
 
 @app.route('/enterprise')
 def enterprise():
-    return render_template('public/enterprise.html')
+    return render_cached_page('public/enterprise.html')
 
 @app.route('/notices')
 def notices():
-    db = get_db()
-    all_notices = db.execute('SELECT id, title, filename, summary, timestamp FROM notices ORDER BY timestamp DESC').fetchall()
-    return render_template('public/notices.html', notices=all_notices)
+    def context():
+        db = get_db()
+        all_notices = db.execute('''
+            SELECT n.id, n.title, n.filename, n.summary, n.timestamp, d.page_count, d.thumbnail
+            FROM notices n LEFT JOIN upload_documents d ON d.filename = n.filename
+            ORDER BY n.timestamp DESC
+        ''').fetchall()
+        return {'notices': all_notices}
+    return render_cached_page('public/notices.html', data=('notices',), context=context)
+
+@app.route('/notices/search')
+def search_notices():
+    """Full-text search over notice titles, summaries and PDF text (JSON)."""
+    query = request.args.get('q', '').strip()[:200]
+    results = notice_index.search_notices(get_db(), query) if query else []
+    for result in results:
+        result['url'] = url_for('uploaded_file', filename=result.pop('filename'))
+        thumbnail = result.pop('thumbnail')
+        result['thumbnail_url'] = url_for('uploaded_file', filename=thumbnail) if thumbnail else None
+    return jsonify({'query': query, 'results': results})
 
 @app.route('/contact')
 def contact():
-    return render_template('public/contact.html')
+    return render_cached_page('public/contact.html')
 
 @app.route('/event-registration', methods=['GET', 'POST'])
 def event_registration():
@@ -143,36 +573,117 @@ def event_registration():
             flash('Please fill in all required fields.', 'error')
             return render_template('public/event_registration.html')
         
+        mobile_number = registrations.normalize_mobile(mobile_number)
+        if mobile_number is None:
+            flash('Please enter a valid mobile number, e.g. 01712345678.', 'error')
+            return render_template('public/event_registration.html')
+        
         try:
-            db = get_db()
-            
-            # Check if mobile number already exists
-            existing_registration = db.execute(
-                'SELECT id FROM event_registrations WHERE mobile_number = ?',
-                (mobile_number,)
-            ).fetchone()
-            
-            if existing_registration:
+            # Atomic against another submission of the same number, in this
+            # worker or any other
+            if not submit_registration(full_name, address, mobile_number, reference):
                 flash('This mobile number is already registered. Each mobile number can only register once.', 'error')
                 return render_template('public/event_registration.html')
-            
-            db.execute(
-                'INSERT INTO event_registrations (full_name, address, mobile_number, reference) VALUES (?, ?, ?, ?)',
-                (full_name, address, mobile_number, reference)
-            )
-            db.commit()
             flash('Registration submitted successfully! Admin will assign a voucher number upon approval.', 'success')
             return redirect(url_for('event_registration'))
+        except FutureTimeoutError:
+            flash('We are receiving a lot of registrations right now and yours was not saved. '
+                  'Please try again in a minute.', 'error')
+            return render_template('public/event_registration.html')
         except Exception as e:
             flash('An error occurred while submitting your registration. Please try again.', 'error')
             return render_template('public/event_registration.html')
     
     return render_template('public/event_registration.html')
 
-@app.route('/uploads/<filename>')
+@app.errorhandler(RequestEntityTooLarge)
+def upload_too_large(error):
+    """Sends admins back to the form they uploaded from instead of a bare 413 page."""
+    if current_admin():
+        flash('The file is too large to upload.', 'danger')
+        return redirect(request.referrer or url_for('admin_dashboard'))
+    return error
+
+@app.route('/uploads/<path:filename>')
 def uploaded_file(filename):
-    """Provides a route to serve the uploaded PDF files."""
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    """Serves uploaded PDF files and images.
+
+    Supports Range/If-Range (PDF viewers fetch pages on demand), answers
+    If-None-Match with 304 using the content hash as ETag, prefers a
+    precompressed copy when the client accepts one, and hands the transfer to
+    the web server when sendfile offloading is configured.
+    """
+    path = safe_join(app.config['UPLOAD_FOLDER'], filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+    etag = uploads.name_etag(filename)
+    if etag is None:
+        blob = get_db().execute('SELECT sha256 FROM upload_blobs WHERE filename = ?', (filename,)).fetchone()
+        etag = blob['sha256'][:uploads.HASH_LENGTH] if blob else None
+
+    # Byte ranges refer to the file itself, so ranged requests get it uncompressed
+    served_path, encoding = path, None
+    if 'Range' not in request.headers:
+        served_path, encoding = uploads.precompressed(path, request.accept_encodings)
+    if etag is not None and encoding is not None:
+        etag = f'{etag}-{encoding}'
+
+    accel_prefix = app.config['UPLOAD_ACCEL_REDIRECT_PREFIX']
+    if app.config['USE_X_SENDFILE'] or accel_prefix:
+        if etag is None:
+            stat = os.stat(served_path)
+            etag = f'{stat.st_mtime_ns:x}-{stat.st_size:x}'
+        if request.if_none_match.contains(etag):
+            response = make_response('', 304)
+        else:
+            response = make_response('')
+            response.content_type = mimetype
+            if accel_prefix:
+                relative = os.path.relpath(served_path, app.config['UPLOAD_FOLDER']).replace(os.sep, '/')
+                response.headers['X-Accel-Redirect'] = accel_prefix.rstrip('/') + '/' + relative
+            else:
+                response.headers['X-Sendfile'] = os.path.abspath(served_path)
+        response.set_etag(etag)
+        response.cache_control.no_cache = True
+    else:
+        response = send_file(served_path, mimetype=mimetype, etag=etag if etag is not None else True, conditional=True)
+
+    if encoding is not None:
+        response.headers['Content-Encoding'] = encoding
+    if uploads.has_precompressed(path):
+        response.vary.add('Accept-Encoding')
+    if uploads.is_immutable(filename):
+        # Named after its contents, so this URL always returns the same bytes
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = 365 * 24 * 3600
+        response.cache_control.immutable = True
+    return response
+
+@app.route('/static/dist/<path:filename>')
+def asset(filename):
+    """Serves a CSS/JS bundle built by assets.py.
+
+    Bundles are named after their contents, so they are cached forever, and
+    are sent from their precompressed siblings when the client accepts one.
+    """
+    if not assets.is_built_name(filename):
+        abort(404)
+    path = os.path.join(app.config['ASSET_FOLDER'], filename)
+    if not os.path.isfile(path):
+        abort(404)
+    served_path, encoding = uploads.precompressed(path, request.accept_encodings)
+    response = send_file(os.path.abspath(served_path), mimetype=mimetypes.guess_type(filename)[0], conditional=True)
+    if encoding is not None:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.cache_control.no_cache = None
+    response.cache_control.public = True
+    response.cache_control.max_age = 365 * 24 * 3600
+    response.cache_control.immutable = True
+    return response
 
 @app.route('/robots.txt')
 def robots_txt():
@@ -183,30 +694,32 @@ def robots_txt():
 # No auto-generation needed
 
 @app.route('/admin/edit_registration/<int:registration_id>', methods=['POST'])
+@login_required
 def edit_registration(registration_id):
-    if 'username' not in session:
-        return redirect(url_for('admin_login'))
-    
     full_name = request.form['full_name']
     mobile_number = request.form['mobile_number']
     address = request.form.get('address', '')
     reference = request.form.get('reference', '')
-    voucher_number = request.form.get('voucher_number', '').strip()
+    # Blank means no voucher; NULL, because the column is UNIQUE and '' would count as a voucher
+    voucher_number = request.form.get('voucher_number', '').strip() or None
     is_approved = 1 if 'is_approved' in request.form else 0
     
-    try:
-        db = get_db()
-        
-        # Check if mobile number already exists for other registrations
-        existing_registration = db.execute(
-            'SELECT id FROM event_registrations WHERE mobile_number = ? AND id != ?',
-            (mobile_number, registration_id)
-        ).fetchone()
-        
-        if existing_registration:
-            flash('This mobile number is already registered by another user.', 'danger')
+    db = get_db()
+    stored = db.execute(
+        'SELECT mobile_number FROM event_registrations WHERE id = ?', (registration_id,)
+    ).fetchone()
+    # An unchanged number is kept as stored: migration 4 left numbers it could not
+    # normalize alone, and those rows must stay editable. A changed number is stored
+    # like new registrations so the uniqueness check compares like with like.
+    if stored is None or mobile_number.strip() != stored['mobile_number'].strip():
+        mobile_number = registrations.normalize_mobile(mobile_number)
+        if mobile_number is None:
+            flash('Please enter a valid mobile number.', 'danger')
             return redirect(url_for('admin_dashboard'))
-        
+    else:
+        mobile_number = stored['mobile_number']
+    
+    try:
         # Validate voucher number if provided
         if voucher_number:
             # Check if voucher number already exists for other registrations
@@ -238,16 +751,20 @@ def edit_registration(registration_id):
         
         db.commit()
         flash('Registration updated successfully!', 'success')
+    except sqlite3.IntegrityError as e:
+        db.rollback()
+        if 'mobile_number' in str(e):
+            flash('This mobile number is already registered by another user.', 'danger')
+        else:
+            flash('Error updating registration. Please try again.', 'danger')
     except Exception as e:
         flash('Error updating registration. Please try again.', 'danger')
     
     return redirect(url_for('admin_dashboard'))
 
 @app.route('/admin/approve_registration/<int:registration_id>', methods=['POST'])
+@login_required
 def approve_registration(registration_id):
-    if 'username' not in session:
-        return redirect(url_for('admin_login'))
-    
     try:
         db = get_db()
         
@@ -279,10 +796,8 @@ def approve_registration(registration_id):
     return redirect(url_for('admin_dashboard'))
 
 @app.route('/admin/delete_registration/<int:registration_id>', methods=['POST'])
+@login_required
 def delete_registration(registration_id):
-    if 'username' not in session:
-        return redirect(url_for('admin_login'))
-    
     db = get_db()
     try:
         db.execute('DELETE FROM event_registrations WHERE id = ?', (registration_id,))
@@ -294,38 +809,285 @@ def delete_registration(registration_id):
     return redirect(url_for('admin_dashboard'))
 
 @app.route('/admin/api/registrations')
+@login_required(api=True)
 def api_get_registrations():
-    """API endpoint to fetch latest event registrations for real-time updates"""
-    if 'username' not in session:
-        return {'error': 'Unauthorized'}, 401
+    """API endpoint to fetch event registrations for real-time updates.
+
+    Passing the ``cursor`` of a listing page (or of a previous answer) as
+    ``since`` returns only the registrations inserted, edited, approved or
+    deleted after it. Without a usable ``since`` the answer is just
+    ``{"reset": true, "cursor": ...}`` and the client reloads its pages, which
+    are paginated, rather than receive the whole table here. The ETag tracks
+    the cursor, so a poll with a matching If-None-Match gets an empty 304.
+    """
+    db = get_db()
+    cursor = get_registration_cursor(db)
+    etag = f'registrations-{cursor}'
+    
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+    
+    since = request.args.get('since', type=int)
+    oldest = db.execute('SELECT MIN(id) FROM registration_changes').fetchone()[0]
+    
+    # A cursor from the future (database restored) or one older than the pruned
+    # change log cannot be replayed, so the client is told to reload instead.
+    if since is None or since > cursor or (oldest is not None and since < oldest - 1):
+        payload = {'reset': True, 'cursor': cursor}
+    else:
+        changes = db.execute(
+            """SELECT c.registration_id, r.*
+               FROM (SELECT DISTINCT registration_id FROM registration_changes WHERE id > ? AND id <= ?) c
+               LEFT JOIN event_registrations r ON r.id = c.registration_id""",
+            (since, cursor)
+        ).fetchall()
+        payload = {
+            'registrations': [registration_to_dict(reg) for reg in changes if reg['id'] is not None],
+            'deleted': [reg['registration_id'] for reg in changes if reg['id'] is None],
+            'cursor': cursor,
+            'reset': False
+        }
+    
+    response = jsonify(payload)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+@app.route('/admin/api/registrations/page')
+@login_required(api=True)
+def api_registrations_page():
+    """Keyset-paginated, filtered registration listing for the dashboard table.
+
+    Rows come newest first. ``after`` is the ``next`` value of the previous page.
+    Filters: ``status`` (approved/pending), ``date_from``/``date_to`` (YYYY-MM-DD),
+    ``voucher`` and ``mobile`` prefixes and a ``name`` substring. ``cursor`` is the
+    change-log position taken before the query, for subscribing to later changes.
+    """
+    args = request.args
+    clauses = []
+    params = []
+    
+    status = args.get('status', '')
+    if status in ('approved', 'pending'):
+        clauses.append('is_approved = ?')
+        params.append(1 if status == 'approved' else 0)
+    
+    for name, op in (('date_from', '>= ?'), ('date_to', "< date(?, '+1 day')")):
+        value = args.get(name, '').strip()
+        if value:
+            try:
+                datetime.strptime(value, '%Y-%m-%d')
+            except ValueError:
+                return {'error': f'Invalid {name}, expected YYYY-MM-DD'}, 400
+            clauses.append(f'registration_date {op}')
+            params.append(value)
+    
+    for name, column in (('voucher', 'voucher_number'), ('mobile', 'mobile_number')):
+        value = args.get(name, '').strip()
+        if value:
+            clauses.append(f'{column} >= ? AND {column} < ?')
+            params.extend(prefix_range(value))
+    
+    name = args.get('name', '').strip()
+    if name:
+        escaped = name.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        clauses.append("full_name LIKE ? ESCAPE '\\'")
+        params.append(f'%{escaped}%')
+    
+    after = args.get('after', '')
+    if after:
+        after_date, _, after_id = after.rpartition('|')
+        if not after_date or not after_id.isdigit():
+            return {'error': 'Invalid after cursor'}, 400
+        clauses.append('(registration_date, id) < (?, ?)')
+        params.extend((after_date, int(after_id)))
+    
+    limit = args.get('limit', app.config['REGISTRATION_PAGE_SIZE'], type=int)
+    limit = max(1, min(limit, app.config['REGISTRATION_PAGE_SIZE_MAX']))
     
     db = get_db()
-    event_registrations = db.execute(
-        'SELECT * FROM event_registrations ORDER BY registration_date DESC'
+    cursor = get_registration_cursor(db)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    rows = db.execute(
+        f'SELECT * FROM event_registrations {where} ORDER BY registration_date DESC, id DESC LIMIT ?',
+        (*params, limit + 1)
     ).fetchall()
     
-    # Convert to list of dictionaries for JSON response
-    registrations_list = []
-    for reg in event_registrations:
-        registrations_list.append({
-            'id': reg['id'],
-            'full_name': reg['full_name'],
-            'mobile_number': reg['mobile_number'],
-            'address': reg['address'],
-            'reference': reg['reference'],
-            'voucher_number': reg['voucher_number'],
-            'is_approved': bool(reg['is_approved']),
-            'registration_date': reg['registration_date']
-        })
-    
-    return {'registrations': registrations_list}
+    next_after = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_after = f"{rows[-1]['registration_date']}|{rows[-1]['id']}"
+    
+    response = jsonify({
+        'registrations': [registration_to_dict(reg) for reg in rows],
+        'next': next_after,
+        'cursor': cursor
+    })
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+@app.route('/admin/api/registrations/analytics')
+@login_required(api=True)
+def api_registration_analytics():
+    """Registration counts for the dashboard charts, from the rollup tables (see analytics.py).
+
+    ``days`` (default 30, at most 366) is how many days the daily series
+    covers, ending today (UTC). The ETag follows the registration change log
+    and the date, so a poll with a matching If-None-Match gets an empty 304.
+    """
+    days = min(max(request.args.get('days', 30, type=int), 1), 366)
+    db = get_db()
+    etag = f"analytics-{get_registration_cursor(db)}-{days}-{time.strftime('%Y%m%d', time.gmtime())}"
+    
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+    else:
+        response = jsonify(analytics.summary(db, days=days))
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+@app.route('/admin/api/registrations/bulk', methods=['POST'])
+@login_required(api=True)
+def api_bulk_registrations():
+    """Approves, deletes or assigns vouchers to many registrations in one transaction.
+
+    Takes JSON: ``{"action": "approve" | "delete", "ids": [...]}`` or
+    ``{"action": "assign_vouchers", "vouchers": [{"id": 1, "voucher_number": "..."}, ...],
+    "approve": false}`` (entries may give ``mobile_number`` instead of ``id``).
+    Returns a JSON summary; voucher assignments are all or nothing, and a
+    batch with problems comes back as a 400 listing them.
+    """
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return {'error': 'Expected a JSON object'}, 400
+    action = payload.get('action')
+    items = payload.get('vouchers' if action == 'assign_vouchers' else 'ids')
+    if not isinstance(items, list) or not items:
+        return {'error': 'Nothing to do'}, 400
+    if len(items) > app.config['REGISTRATION_BULK_MAX']:
+        return {'error': f"At most {app.config['REGISTRATION_BULK_MAX']} registrations per request"}, 400
+    
+    db = get_db()
+    try:
+        if action == 'approve':
+            summary = registrations.approve_many(db, items)
+        elif action == 'delete':
+            summary = registrations.delete_many(db, items)
+        elif action == 'assign_vouchers':
+            if not all(isinstance(item, dict) for item in items):
+                return {'error': 'Each voucher entry must be an object'}, 400
+            summary = registrations.assign_vouchers(db, items, approve=bool(payload.get('approve')))
+        else:
+            return {'error': 'Unknown action'}, 400
+    except ValueError as e:
+        return {'error': str(e)}, 400
+    
+    return jsonify(summary), 200 if summary.get('ok', True) else 400
+
+@app.route('/admin/api/registrations/vouchers/import', methods=['POST'])
+@login_required(api=True)
+def api_import_vouchers():
+    """Assigns vouchers from an uploaded CSV or XLSX file of mobile numbers and voucher numbers.
+
+    Rows are matched to registrations by (normalized) mobile number. All or
+    nothing, like the assign_vouchers bulk action; ``approve`` also approves
+    the matched registrations. Returns a JSON summary.
+    """
+    file = request.files.get('file')
+    extension = file.filename.rsplit('.', 1)[-1].lower() if file and '.' in file.filename else ''
+    if extension not in registrations.VOUCHER_FILE_EXTENSIONS:
+        return {'error': 'Please upload a .csv or .xlsx file'}, 400
+    
+    file.stream.seek(0)
+    try:
+        assignments = registrations.read_voucher_file(file.stream, extension)
+    except Exception:
+        return {'error': 'The file could not be read'}, 400
+    if not assignments:
+        return {'error': 'The file has no rows'}, 400
+    if len(assignments) > app.config['REGISTRATION_BULK_MAX']:
+        return {'error': f"At most {app.config['REGISTRATION_BULK_MAX']} rows per import"}, 400
+    
+    summary = registrations.assign_vouchers(get_db(), assignments, approve='approve' in request.form)
+    return jsonify(summary), 200 if summary['ok'] else 400
+
+@app.route('/admin/api/registrations/stream')
+@login_required(api=True)
+def api_stream_registrations():
+    """Server-Sent Events stream of registration inserts, updates, approvals and deletes.
+
+    Every Passenger worker writes to the same change log, so each stream simply
+    tails that table. The client passes the cursor from ``api_get_registrations``
+    as ``since``; on reconnect the browser sends ``Last-Event-ID`` instead.
+    Answers 204 when SSE_ENABLED is off, which tells EventSource to stop
+    reconnecting; the dashboard then polls.
+    """
+    if not app.config['SSE_ENABLED']:
+        return '', 204
+    since = request.headers.get('Last-Event-ID', type=int)
+    if since is None:
+        since = request.args.get('since', type=int)
+    
+    pool = get_db_pool()
+    poll_interval = app.config['SSE_POLL_INTERVAL']
+    heartbeat_interval = app.config['SSE_HEARTBEAT_INTERVAL']
+    max_duration = app.config['SSE_MAX_DURATION']
+    
+    def generate():
+        # Not get_db(): the stream outlives the request's app context
+        db = pool.acquire()
+        try:
+            cursor = get_registration_cursor(db)
+            last_seen = cursor if since is None else since
+            oldest = db.execute('SELECT MIN(id) FROM registration_changes').fetchone()[0]
+            if last_seen > cursor or (oldest is not None and last_seen < oldest - 1):
+                yield f'event: reset\ndata: {json.dumps({"cursor": cursor})}\n\n'
+                return
+            
+            yield f'retry: 2000\nevent: ping\ndata: {json.dumps({"cursor": last_seen})}\n\n'
+            started = last_beat = time.monotonic()
+            while time.monotonic() - started < max_duration:
+                changes = db.execute(
+                    """SELECT c.id AS change_id, c.action, c.registration_id, r.*
+                       FROM registration_changes c
+                       LEFT JOIN event_registrations r ON r.id = c.registration_id
+                       WHERE c.id > ? ORDER BY c.id LIMIT 500""",
+                    (last_seen,)
+                ).fetchall()
+                for change in changes:
+                    last_seen = change['change_id']
+                    if change['action'] == 'delete':
+                        data = {'cursor': last_seen, 'id': change['registration_id']}
+                    elif change['id'] is None:
+                        continue  # Deleted since; its delete event follows
+                    else:
+                        data = {'cursor': last_seen, 'registration': registration_to_dict(change)}
+                    yield f'id: {last_seen}\nevent: {change["action"]}\ndata: {json.dumps(data)}\n\n'
+                
+                if changes:
+                    last_beat = time.monotonic()
+                elif time.monotonic() - last_beat >= heartbeat_interval:
+                    yield f'event: ping\ndata: {json.dumps({"cursor": last_seen})}\n\n'
+                    last_beat = time.monotonic()
+                time.sleep(poll_interval)
+        finally:
+            pool.release(db)
+    
+    response = Response(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
 # --- Admin Routes ---
 
 @app.route('/admin')
 def admin_redirect():
     """Redirects to the login page if not logged in, otherwise to the dashboard."""
-    if 'logged_in' not in session:
+    if current_admin() is None:
         return redirect(url_for('admin_login'))
     return redirect(url_for('admin_dashboard'))
 
@@ -336,167 +1098,183 @@ def admin_login():
         password = request.form['password']
         
         db = get_db()
-        user = db.execute('SELECT * FROM users WHERE username = ? AND password = ?', (username, password)).fetchone()
+        limits = login_limits(username)
+        # Refused before hashing anything, so floods of guesses stay cheap
+        wait = auth.retry_after(db, limits)
+        if wait:
+            flash(f'Too many failed logins. Please try again in {int(wait // 60) + 1} minute(s).', 'danger')
+            return render_template('admin/login.html'), 429, {'Retry-After': str(int(wait) + 1)}
+        
+        user = auth.authenticate(db, username, password, app.config['PASSWORD_HASH_METHOD'])
         
         if user:
-            session['logged_in'] = True
+            auth.clear_failures(db, [key for key, _, _ in limits])
+            session.clear()
+            session['user_id'] = user['id']
             session['username'] = user['username']
+            session['auth'] = auth.session_stamp(user['password'])
             flash('You were successfully logged in!', 'success')
             return redirect(url_for('admin_dashboard'))
         else:
+            auth.record_failure(db, limits)
             flash('Invalid username or password.', 'danger')
             
     return render_template('admin/login.html')
 
 @app.route('/admin/dashboard')
+@login_required
 def admin_dashboard():
-    if 'logged_in' not in session:
-        return redirect(url_for('admin_login'))
-    
     db = get_db()
     all_notices = db.execute('SELECT id, title, filename, summary, timestamp FROM notices ORDER BY timestamp DESC').fetchall()
     gallery_images = db.execute('SELECT id, title, filename, is_active, sort_order, timestamp FROM gallery ORDER BY sort_order ASC, timestamp DESC').fetchall()
-    event_registrations = db.execute('SELECT * FROM event_registrations ORDER BY registration_date DESC').fetchall()
-    return render_template('admin/dashboard.html', notices=all_notices, gallery_images=gallery_images, event_registrations=event_registrations)
+    # Registrations are loaded page by page from api_registrations_page
+    return render_template('admin/dashboard.html', notices=all_notices, gallery_images=gallery_images)
 
 @app.route('/admin/export/excel')
+@login_required
 def export_excel():
-    if 'logged_in' not in session:
-        return redirect(url_for('admin_login'))
-    
-    db = get_db()
-    event_registrations = db.execute('SELECT * FROM event_registrations ORDER BY registration_date DESC').fetchall()
-    
-    # Convert to list of dictionaries
-    data = []
-    for reg in event_registrations:
-        data.append({
-            'ID': reg['id'],
-            'Full Name': reg['full_name'],
-            'Mobile': reg['mobile_number'],
-            'Address': reg['address'],
-            'Reference': reg['reference'],
-            'Voucher': reg['voucher_number'],
-            'Status': 'Approved' if reg['is_approved'] else 'Pending',
-            'Registration Date': reg['registration_date']
-        })
-    
-    # Create DataFrame
-    df = pd.DataFrame(data)
-    
-    # Create Excel file in memory
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, sheet_name='Event Registrations', index=False)
-    
+    # Rows are streamed from the cursor into a write-only workbook
+    output = tempfile.SpooledTemporaryFile(max_size=app.config['EXPORT_SPOOL_MAX_SIZE'])
+    try:
+        exports.write_registrations_xlsx(get_db(), output)
+    except Exception:
+        output.close()
+        raise
+    size = output.tell()
     output.seek(0)
     
-    # Create response
-    response = make_response(output.getvalue())
-    response.headers['Content-Type'] = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    response.headers['Content-Disposition'] = f'attachment; filename=event_registrations_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
-    
+    response = send_file(
+        output,
+        mimetype=exports.XLSX_MIMETYPE,
+        as_attachment=True,
+        download_name=f'event_registrations_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
+    )
+    response.content_length = size
     return response
 
 @app.route('/admin/export/pdf')
+@login_required
 def export_pdf():
-    if 'logged_in' not in session:
-        return redirect(url_for('admin_login'))
+    # Pages are laid out one at a time from the cursor, see exports.write_registrations_pdf
+    output = tempfile.SpooledTemporaryFile(max_size=app.config['EXPORT_SPOOL_MAX_SIZE'])
+    try:
+        exports.write_registrations_pdf(get_db(), output)
+    except Exception:
+        output.close()
+        raise
+    size = output.tell()
+    output.seek(0)
     
-    db = get_db()
-    event_registrations = db.execute('SELECT * FROM event_registrations ORDER BY registration_date DESC').fetchall()
-    
-    # Create PDF in memory with landscape orientation for better table fit
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=landscape(A4), leftMargin=0.5*inch, rightMargin=0.5*inch, topMargin=0.5*inch, bottomMargin=0.5*inch)
-    
-    # Get styles
-    styles = getSampleStyleSheet()
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontName='Helvetica-Bold',  # Note: Google Sans would require font registration
-        fontSize=16,
-        spaceAfter=30,
-        alignment=1  # Center alignment
+    response = send_file(
+        output,
+        mimetype='application/pdf',
+        as_attachment=True,
+        download_name=f'event_registrations_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf'
     )
+    response.content_length = size
+    return response
+
+@app.route('/admin/export/<kind>/start', methods=['POST'])
+@login_required(api=True)
+def start_export_job(kind):
+    """Queues a background export, or returns an existing one for the same data.
+
+    A finished export whose data_version matches the current registration change
+    cursor is returned immediately; a queued or running one is shared.
+    """
+    if kind not in exports.EXPORT_FORMATS:
+        return {'error': 'Unknown export type'}, 404
     
-    # Build content
-    content = []
-    
-    # Add title
-    title = Paragraph("Event Registrations Report", title_style)
-    content.append(title)
-    content.append(Spacer(1, 12))
+    db = get_db()
+    # Jobs whose worker disappeared (e.g. the Passenger process was recycled)
+    db.execute(
+        "UPDATE export_jobs SET status = 'failed', error = 'Timed out', finished_at = CURRENT_TIMESTAMP "
+        "WHERE status IN ('queued', 'running') AND created_at < datetime('now', ?)",
+        (f"-{app.config['EXPORT_JOB_TIMEOUT']} seconds",)
+    )
+    db.commit()
     
-    # Add generation date
-    date_para = Paragraph(f"Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", styles['Normal'])
-    content.append(date_para)
-    content.append(Spacer(1, 20))
+    version = get_registration_cursor(db)
+    existing = db.execute(
+        "SELECT * FROM export_jobs WHERE kind = ? AND data_version = ? AND status IN ('queued', 'running', 'done') "
+        "ORDER BY id DESC LIMIT 1",
+        (kind, version)
+    ).fetchone()
+    if existing and (existing['status'] != 'done' or
+                     os.path.exists(os.path.join(app.config['EXPORT_FOLDER'], existing['filename']))):
+        return {'job': export_job_to_dict(existing)}
     
-    # Prepare table data
-    table_data = [['ID', 'Full Name', 'Mobile', 'Address', 'Reference', 'Voucher', 'Status', 'Registration Date']]
+    job_id = db.execute(
+        'INSERT INTO export_jobs (kind, data_version) VALUES (?, ?)', (kind, version)
+    ).lastrowid
+    db.commit()
+    get_export_executor().submit(run_export_process, job_id)
     
-    for reg in event_registrations:
-        # Wrap long text for better display in landscape mode
-        address = reg['address'] or ''
-        if len(address) > 60:
-            address = address[:57] + '...'
-        
-        full_name = reg['full_name'] or ''
-        if len(full_name) > 25:
-            full_name = full_name[:22] + '...'
-            
-        reference = reg['reference'] or ''
-        if len(reference) > 15:
-            reference = reference[:12] + '...'
-            
-        table_data.append([
-            str(reg['id']),
-            Paragraph(full_name, styles['Normal']),
-            reg['mobile_number'] or '',
-            Paragraph(address, styles['Normal']),
-            Paragraph(reference, styles['Normal']),
-            reg['voucher_number'] or '',
-            'Approved' if reg['is_approved'] else 'Pending',
-            reg['registration_date'].split(' ')[0] if reg['registration_date'] else ''
-        ])
-    
-    # Create table with optimized column widths for landscape A4
-    col_widths = [0.5*inch, 1.8*inch, 1.2*inch, 2.5*inch, 1.2*inch, 1.2*inch, 1*inch, 1.2*inch]
-    table = Table(table_data, colWidths=col_widths, repeatRows=1, rowHeights=None)
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
-        ('TOPPADDING', (0, 0), (-1, 0), 8),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 1), (-1, -1), 8),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
-        ('LEFTPADDING', (0, 0), (-1, -1), 6),
-        ('RIGHTPADDING', (0, 0), (-1, -1), 6),
-        ('TOPPADDING', (0, 1), (-1, -1), 6),
-        ('BOTTOMPADDING', (0, 1), (-1, -1), 6)
-    ]))
-    
-    content.append(table)
-    
-    # Build PDF
-    doc.build(content)
-    buffer.seek(0)
-    
-    # Create response
-    response = make_response(buffer.getvalue())
-    response.headers['Content-Type'] = 'application/pdf'
-    response.headers['Content-Disposition'] = f'attachment; filename=event_registrations_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf'
+    job = db.execute('SELECT * FROM export_jobs WHERE id = ?', (job_id,)).fetchone()
+    return {'job': export_job_to_dict(job)}, 202
+
+@app.route('/admin/export/jobs/<int:job_id>')
+@login_required(api=True)
+def export_job_status(job_id):
+    job = get_db().execute('SELECT * FROM export_jobs WHERE id = ?', (job_id,)).fetchone()
+    if not job:
+        return {'error': 'Export not found'}, 404
+    return {'job': export_job_to_dict(job)}
+
+@app.route('/admin/export/jobs/<int:job_id>/download')
+@login_required
+def download_export_job(job_id):
+    job = get_db().execute('SELECT * FROM export_jobs WHERE id = ?', (job_id,)).fetchone()
+    if not job or job['status'] != 'done':
+        flash('Export not found or not finished yet.', 'danger')
+        return redirect(url_for('admin_dashboard'))
     
+    extension, mimetype, _ = exports.EXPORT_FORMATS[job['kind']]
+    finished = datetime.strptime(job['finished_at'], '%Y-%m-%d %H:%M:%S')
+    return send_from_directory(
+        app.config['EXPORT_FOLDER'],
+        job['filename'],
+        mimetype=mimetype,
+        as_attachment=True,
+        download_name=f'event_registrations_{finished.strftime("%Y%m%d_%H%M%S")}.{extension}'
+    )
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Request metrics of all workers in the Prometheus text format (admins or METRICS_TOKEN only)."""
+    token = app.config['METRICS_TOKEN']
+    authorized = current_admin() is not None or (
+        token and request.headers.get('Authorization', '') == f'Bearer {token}'
+    )
+    if not authorized:
+        abort(404)
+    metrics.flush(app.config['METRICS_DIR'])
+    response = make_response(metrics.prometheus_text(metrics.collect(app.config['METRICS_DIR'])))
+    response.mimetype = 'text/plain'
+    response.headers['Content-Type'] = 'text/plain; version=0.0.4; charset=utf-8'
+    response.headers['Cache-Control'] = 'no-store'
     return response
 
+@app.route('/admin/metrics')
+@login_required
+def admin_metrics():
+    """Slowest routes and templates across all workers, plus the stored request profiles."""
+    metrics.flush(app.config['METRICS_DIR'])
+    merged = metrics.collect(app.config['METRICS_DIR'])
+    return render_template(
+        'admin/metrics.html',
+        routes=metrics.route_summary(merged),
+        templates=metrics.template_summary(merged),
+        profiles=metrics.list_profiles(app.config['PROFILE_DIR']),
+        profiling_enabled=app.config['PROFILING_ENABLED']
+    )
+
+@app.route('/admin/metrics/profiles/<name>')
+@login_required
+def view_profile(name):
+    """Shows one stored request profile as plain text."""
+    return send_from_directory(os.path.abspath(app.config['PROFILE_DIR']), name, mimetype='text/plain')
+
 @app.route('/admin/logout')
 def admin_logout():
     session.clear()
@@ -504,10 +1282,8 @@ def admin_logout():
     return redirect(url_for('admin_login'))
 
 @app.route('/admin/add', methods=['POST'])
+@login_required
 def add_notice():
-    if 'logged_in' not in session:
-        return redirect(url_for('admin_login'))
-
     title = request.form['title']
     summary = request.form.get('summary', '').strip()  # Get summary, default to empty string
     notice_date = request.form['notice_date']
@@ -521,17 +1297,14 @@ def add_notice():
         flash('No selected file', 'danger')
         return redirect(url_for('admin_dashboard'))
 
-    if file and allowed_file(file.filename):
-        filename = secure_filename(file.filename)
-        # To avoid overwriting files with the same name, you could append a timestamp
-        # from datetime import datetime
-        # filename = f"{datetime.now().strftime('%Y%m%d%H%M%S')}_{secure_filename(file.filename)}"
-        
-        file.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
-
+    if file and allowed_file(file.filename) and uploads.file_kind(file) == 'pdf':
+        # Stored under the hash of its contents, so same-named uploads never clash
         db = get_db()
+        filename = uploads.store_upload(db, app.config['UPLOAD_FOLDER'], file, file.filename.rsplit('.', 1)[1])
         db.execute('INSERT INTO notices (title, filename, summary, timestamp) VALUES (?, ?, ?, ?)', (title, filename, summary, notice_date))
         db.commit()
+        get_index_executor().submit(run_index_process)
+        bump_data_version('notices')
 
         flash('New notice has been successfully added!', 'success')
     else:
@@ -540,23 +1313,19 @@ def add_notice():
     return redirect(url_for('admin_dashboard'))
 
 @app.route('/admin/delete/<int:notice_id>', methods=['POST'])
+@login_required
 def delete_notice(notice_id):
-    if 'logged_in' not in session:
-        return redirect(url_for('admin_login'))
-
     db = get_db()
     notice = db.execute('SELECT * FROM notices WHERE id = ?', (notice_id,)).fetchone()
 
     if notice:
-        # Delete the file from the filesystem
-        try:
-            os.remove(os.path.join(app.config['UPLOAD_FOLDER'], notice['filename']))
-        except FileNotFoundError:
-            flash('File not found on server, but deleting from database.', 'warning')
-
-        # Delete the record from the database
+        # Delete the record from the database; the file goes too unless
+        # another notice or gallery image uses the same bytes
         db.execute('DELETE FROM notices WHERE id = ?', (notice_id,))
         db.commit()
+        for filename in uploads.collect_unused(db, app.config['UPLOAD_FOLDER']):
+            notice_index.delete_thumbnail(app.config['UPLOAD_FOLDER'], filename)
+        bump_data_version('notices')
         flash('Notice has been successfully deleted.', 'success')
     else:
         flash('Notice not found.', 'danger')
@@ -564,10 +1333,8 @@ def delete_notice(notice_id):
     return redirect(url_for('admin_dashboard'))
 
 @app.route('/admin/edit/<int:notice_id>', methods=['GET'])
+@login_required
 def edit_notice(notice_id):
-    if 'logged_in' not in session:
-        return redirect(url_for('admin_login'))
-
     db = get_db()
     notice = db.execute('SELECT * FROM notices WHERE id = ?', (notice_id,)).fetchone()
 
@@ -578,10 +1345,8 @@ def edit_notice(notice_id):
     return render_template('admin/edit_notice.html', notice=notice)
 
 @app.route('/admin/update/<int:notice_id>', methods=['POST'])
+@login_required
 def update_notice(notice_id):
-    if 'logged_in' not in session:
-        return redirect(url_for('admin_login'))
-
     db = get_db()
     notice = db.execute('SELECT * FROM notices WHERE id = ?', (notice_id,)).fetchone()
 
@@ -597,19 +1362,9 @@ def update_notice(notice_id):
     filename = notice['filename']  # Keep existing filename by default
     if 'pdf_file' in request.files:
         file = request.files['pdf_file']
-        if file and file.filename != '' and allowed_file(file.filename):
-            # Delete old file
-            try:
-                os.remove(os.path.join(app.config['UPLOAD_FOLDER'], notice['filename']))
-            except FileNotFoundError:
-                pass  # File doesn't exist, continue
-            
-            # Save new file
-            filename = secure_filename(file.filename)
-            # Make filename unique by adding timestamp
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_')
-            filename = timestamp + filename
-            file.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
+        if file and file.filename != '' and allowed_file(file.filename) and uploads.file_kind(file) == 'pdf':
+            # Save new file; the old one is removed below once unused
+            filename = uploads.store_upload(db, app.config['UPLOAD_FOLDER'], file, file.filename.rsplit('.', 1)[1])
 
     # Update the database
     db.execute(
@@ -617,15 +1372,18 @@ def update_notice(notice_id):
         (title, summary, filename, notice_date + ' 00:00:00', notice_id)
     )
     db.commit()
+    if filename != notice['filename']:
+        for unused in uploads.collect_unused(db, app.config['UPLOAD_FOLDER']):
+            notice_index.delete_thumbnail(app.config['UPLOAD_FOLDER'], unused)
+        get_index_executor().submit(run_index_process)
+    bump_data_version('notices')
     
     flash('Notice has been successfully updated.', 'success')
     return redirect(url_for('admin_dashboard'))
 
 @app.route('/admin/add_gallery_image', methods=['POST'])
+@login_required
 def add_gallery_image():
-    if 'logged_in' not in session:
-        return redirect(url_for('admin_login'))
-
     title = request.form['image_title']
     sort_order = request.form.get('sort_order', 0)
     
@@ -638,20 +1396,19 @@ def add_gallery_image():
         flash('No selected file', 'danger')
         return redirect(url_for('admin_dashboard'))
 
-    if file and allowed_image_file(file.filename):
-        filename = secure_filename(file.filename)
-        # Add timestamp to avoid filename conflicts
-        from datetime import datetime
-        timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-        name, ext = os.path.splitext(filename)
-        filename = f"{timestamp}_{name}{ext}"
-        
-        file.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
-
+    if file and allowed_image_file(file.filename) and uploads.file_kind(file) == 'image':
+        # Stored under the hash of its contents, so same-named uploads never clash
         db = get_db()
+        filename = uploads.store_upload(db, app.config['UPLOAD_FOLDER'], file, file.filename.rsplit('.', 1)[1])
         db.execute('INSERT INTO gallery (title, filename, sort_order) VALUES (?, ?, ?)',
                    (title, filename, sort_order))
         db.commit()
+        try:
+            images.generate_variants(app.config['UPLOAD_FOLDER'], filename)
+        except Exception:
+            # The original is still served; `python images.py` can retry later
+            app.logger.warning('Could not create variants for %s', filename, exc_info=True)
+        bump_data_version('gallery')
 
         flash('Gallery image uploaded successfully!', 'success')
     else:
@@ -660,10 +1417,8 @@ def add_gallery_image():
     return redirect(url_for('admin_dashboard'))
 
 @app.route('/admin/toggle_gallery_image/<int:image_id>', methods=['POST'])
+@login_required
 def toggle_gallery_image(image_id):
-    if 'logged_in' not in session:
-        return redirect(url_for('admin_login'))
-
     db = get_db()
     image = db.execute('SELECT * FROM gallery WHERE id = ?', (image_id,)).fetchone()
     
@@ -671,6 +1426,7 @@ def toggle_gallery_image(image_id):
         new_status = 0 if image['is_active'] else 1
         db.execute('UPDATE gallery SET is_active = ? WHERE id = ?', (new_status, image_id))
         db.commit()
+        bump_data_version('gallery')
         flash(f'Gallery image {"activated" if new_status else "deactivated"} successfully!', 'success')
     else:
         flash('Gallery image not found.', 'danger')
@@ -678,22 +1434,19 @@ def toggle_gallery_image(image_id):
     return redirect(url_for('admin_dashboard'))
 
 @app.route('/admin/delete_gallery_image/<int:image_id>', methods=['POST'])
+@login_required
 def delete_gallery_image(image_id):
-    if 'logged_in' not in session:
-        return redirect(url_for('admin_login'))
-
     db = get_db()
     image = db.execute('SELECT * FROM gallery WHERE id = ?', (image_id,)).fetchone()
     
     if image:
-        # Delete the file from filesystem
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], image['filename'])
-        if os.path.exists(file_path):
-            os.remove(file_path)
-        
-        # Delete from database
+        # Delete from database; the file and its variants go too unless
+        # another gallery image or notice uses the same bytes
         db.execute('DELETE FROM gallery WHERE id = ?', (image_id,))
         db.commit()
+        for filename in uploads.collect_unused(db, app.config['UPLOAD_FOLDER']):
+            images.delete_variants(app.config['UPLOAD_FOLDER'], filename)
+        bump_data_version('gallery')
         flash('Gallery image deleted successfully!', 'success')
     else:
         flash('Gallery image not found.', 'danger')
@@ -701,8 +1454,47 @@ def delete_gallery_image(image_id):
     return redirect(url_for('admin_dashboard'))
 
 
-# --- Run the App ---
-if __name__ == '__main__':
+# --- App Factory ---
+
+def preload_templates():
+    """Compiles every template into this worker's template cache."""
+    for name in app.jinja_env.list_templates(extensions=['html']):
+        app.jinja_env.get_template(name)
+
+def create_app(config=None):
+    """Finishes setting up the application and returns it.
+
+    Called once per worker from passenger_wsgi.py. Settings can be overridden
+    with ``config`` or with FLASK_-prefixed environment variables, e.g.
+    FLASK_PRELOAD_EXPORTS=true, FLASK_PRELOAD_TEMPLATES=true or FLASK_SECRET_KEY=...
+    """
+    global _db_pool, _backup_scheduler
+    app.config.from_prefixed_env()
+    if config:
+        app.config.update(config)
+    if _db_pool is not None:
+        # Settings may have changed since it was created
+        _db_pool.close()
+        _db_pool = None
+    if _backup_scheduler is not None:
+        _backup_scheduler.stop()
+        _backup_scheduler = None
+    
     # Ensure the upload folder exists
     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-    app.run(debug=True)
\ No newline at end of file
+    init_schema()
+    
+    if app.config['TEMPLATE_CACHE_DIR']:
+        os.makedirs(app.config['TEMPLATE_CACHE_DIR'], exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(app.config['TEMPLATE_CACHE_DIR'])
+    else:
+        app.jinja_env.bytecode_cache = None
+    if app.config['PRELOAD_TEMPLATES']:
+        preload_templates()
+    if app.config['PRELOAD_EXPORTS']:
+        exports.preload()
+    return app
+
+# --- Run the App ---
+if __name__ == '__main__':
+    create_app().run(debug=True)
\ No newline at end of file
@@ -0,0 +1,189 @@
+"""Fingerprinted CSS/JS bundles for the site layout and the admin dashboard.
+
+The stylesheets and scripts live in ``assets/`` and are built into
+``static/dist`` as minified files named after their contents, e.g.
+``layout.3f2a9c0d1e4b5a67.css``, each with a ``.gz`` (and ``.br``, when the
+optional ``brotli`` package is installed) sibling, plus a ``manifest.json``
+mapping bundle names to built files. A changed bundle gets a new name, so
+browsers can cache bundles forever and pages only carry their own HTML.
+
+Templates link bundles with ``asset_url('layout.css')``. Deploys build them
+beforehand; a worker that finds a bundle missing from the manifest builds it
+on first use, so a fresh checkout works without a build step.
+
+    python assets.py                 # build static/dist from assets/
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import re
+import tempfile
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+SOURCE_FOLDER = 'assets'
+# bundle name -> source files in SOURCE_FOLDER, concatenated in this order
+BUNDLES = {
+    'layout.css': ['layout.css'],
+    'layout.js': ['layout.js'],
+    'dashboard.css': ['dashboard.css'],
+    'dashboard.js': ['dashboard.js'],
+}
+MANIFEST = 'manifest.json'
+HASH_LENGTH = 16
+# Preferred encoding first, as in uploads.ENCODING_SUFFIXES
+ENCODING_SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+_BUILT_NAME = re.compile(r'^[\w-]+\.[0-9a-f]{%d}\.(css|js)$' % HASH_LENGTH)
+_CSS_COMMENT = re.compile(r'/\*.*?\*/', re.S)
+_CSS_SPACE_AROUND = re.compile(r'\s*([{};,>])\s*')
+_CSS_SPACE_AFTER_COLON = re.compile(r':\s+')
+
+# dist folder -> (mtime_ns, manifest)
+_manifests = {}
+
+
+def is_built_name(filename):
+    """Tells whether a file in the dist folder is a fingerprinted bundle (safe to cache forever)."""
+    return bool(_BUILT_NAME.match(filename))
+
+
+def minify_css(text):
+    """Drops comments and the whitespace that carries no meaning."""
+    text = _CSS_COMMENT.sub('', text)
+    text = ' '.join(text.split())
+    text = _CSS_SPACE_AROUND.sub(r'\1', text)
+    text = _CSS_SPACE_AFTER_COLON.sub(':', text)
+    return text.replace(';}', '}').strip() + '\n'
+
+
+def minify_js(text):
+    """Drops indentation, blank lines and whole-line // comments.
+
+    Works line by line and keeps every line break, so automatic semicolon
+    insertion is unaffected; lines inside multi-line template literals are
+    kept exactly as written. No renaming or rewriting of code.
+    """
+    lines = []
+    in_template = False
+    for line in text.splitlines():
+        if in_template:
+            lines.append(line)
+        else:
+            stripped = line.strip()
+            if stripped and not stripped.startswith('//'):
+                lines.append(stripped)
+        if line.count('`') % 2:
+            in_template = not in_template
+    return '\n'.join(lines) + '\n'
+
+
+MINIFIERS = {'css': minify_css, 'js': minify_js}
+
+
+def _write_atomic(path, data):
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as output:
+            output.write(data)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def _compressed(data):
+    """Yields (suffix, bytes) for each precompressed sibling."""
+    if brotli is not None:
+        yield ENCODING_SUFFIXES['br'], brotli.compress(data, quality=11)
+    yield ENCODING_SUFFIXES['gzip'], gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def read_manifest(dist_folder):
+    """Returns the manifest (bundle name -> built file name), {} if there is none yet."""
+    path = os.path.join(dist_folder, MANIFEST)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return {}
+    cached = _manifests.get(dist_folder)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    with open(path) as manifest_file:
+        manifest = json.load(manifest_file)
+    _manifests[dist_folder] = (mtime, manifest)
+    return manifest
+
+
+def build(source_folder, dist_folder):
+    """Builds every bundle that changed and writes the manifest; returns the manifest.
+
+    Files from the previous build are kept, so pages rendered before a deploy
+    (in browsers or the page cache) still find their bundles; older ones are
+    removed.
+    """
+    os.makedirs(dist_folder, exist_ok=True)
+    previous = read_manifest(dist_folder)
+    manifest = {}
+    for name, sources in BUNDLES.items():
+        text = []
+        for source in sources:
+            with open(os.path.join(source_folder, source), encoding='utf-8') as source_file:
+                text.append(source_file.read())
+        stem, extension = name.rsplit('.', 1)
+        data = MINIFIERS[extension]('\n'.join(text)).encode('utf-8')
+        built = f'{stem}.{hashlib.sha256(data).hexdigest()[:HASH_LENGTH]}.{extension}'
+        path = os.path.join(dist_folder, built)
+        if not os.path.isfile(path):
+            # Siblings first: a bundle that exists always has them
+            for suffix, compressed in _compressed(data):
+                _write_atomic(path + suffix, compressed)
+            _write_atomic(path, data)
+        manifest[name] = built
+
+    if manifest != previous:
+        _write_atomic(os.path.join(dist_folder, MANIFEST), json.dumps(manifest, indent=2).encode())
+    keep = set(manifest.values()) | set(previous.values())
+    for filename in os.listdir(dist_folder):
+        base = filename
+        for suffix in ENCODING_SUFFIXES.values():
+            if base.endswith(suffix):
+                base = base[:-len(suffix)]
+        if is_built_name(base) and base not in keep:
+            os.remove(os.path.join(dist_folder, filename))
+    return manifest
+
+
+def built_file(source_folder, dist_folder, name):
+    """Returns the built file name of a bundle, building the bundles if it is not in the manifest."""
+    if name not in BUNDLES:
+        raise KeyError(f'Unknown asset bundle: {name}')
+    built = read_manifest(dist_folder).get(name)
+    if built is None or not os.path.isfile(os.path.join(dist_folder, built)):
+        built = build(source_folder, dist_folder)[name]
+    return built
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--source', default=SOURCE_FOLDER, help=f'source folder (default {SOURCE_FOLDER})')
+    parser.add_argument('--dist', default='static/dist', help='output folder (default static/dist)')
+    args = parser.parse_args()
+
+    print(f"Precompressed: {', '.join(['br', 'gzip'] if brotli is not None else ['gzip'])}")
+    for name, built in build(args.source, args.dist).items():
+        source = sum(os.path.getsize(os.path.join(args.source, source)) for source in BUNDLES[name])
+        path = os.path.join(args.dist, built)
+        sizes = [f'{os.path.getsize(path) // 1024 or 1} KB minified']
+        sizes += [f'{os.path.getsize(path + suffix) / 1024:.1f} KB {suffix[1:]}'
+                  for suffix in ENCODING_SUFFIXES.values() if os.path.isfile(path + suffix)]
+        print(f"{name} -> {built}: {source // 1024} KB -> " + ', '.join(sizes))
+
+
+if __name__ == '__main__':
+    main()
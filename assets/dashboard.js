@@ -0,0 +1,630 @@
+// Tab functionality
+function showTab(tabName) {
+    // Hide all tab contents
+    const tabContents = document.querySelectorAll('.tab-content');
+    tabContents.forEach(content => {
+        content.classList.add('hidden');
+    });
+    
+    // Remove active class from all tab buttons
+    const tabButtons = document.querySelectorAll('.tab-button');
+    tabButtons.forEach(button => {
+        button.classList.remove('active', 'border-blue-500', 'text-blue-600');
+        button.classList.add('border-transparent', 'text-gray-500');
+    });
+    
+    // Show selected tab content
+    document.getElementById(tabName + '-content').classList.remove('hidden');
+    
+    // Add active class to selected tab button
+    const activeButton = document.getElementById(tabName + '-tab');
+    activeButton.classList.add('active', 'border-blue-500', 'text-blue-600');
+    activeButton.classList.remove('border-transparent', 'text-gray-500');
+    
+    // Handle real-time updates for events tab
+    if (tabName === 'events') {
+        startRealTimeUpdates();
+    } else {
+        stopRealTimeUpdates();
+    }
+    if (tabName === 'analytics') {
+        loadAnalytics();
+    }
+}
+
+function formatRate(rate) {
+    return rate === null ? '-' : (rate * 100).toFixed(1) + '%';
+}
+
+// Counts come from rollup tables, so this stays cheap however many registrations there are
+function loadAnalytics() {
+    const days = document.getElementById('analyticsDays').value;
+    const error = document.getElementById('analyticsError');
+    fetch('/admin/api/registrations/analytics?days=' + encodeURIComponent(days))
+        .then(response => {
+            if (!response.ok) {
+                throw new Error('Network response was not ok');
+            }
+            return response.json();
+        })
+        .then(data => {
+            error.classList.add('hidden');
+            const totals = data.totals;
+            document.getElementById('analyticsTotal').textContent = totals.registrations;
+            document.getElementById('analyticsApproved').textContent = totals.approved;
+            document.getElementById('analyticsApprovalRate').textContent = formatRate(totals.approval_rate);
+            document.getElementById('analyticsVoucherRate').textContent =
+                totals.with_voucher + ' (' + formatRate(totals.voucher_rate) + ')';
+
+            const highest = Math.max(1, ...data.days.map(day => day.registered));
+            document.getElementById('analyticsChart').innerHTML = data.days.map(day => `
+                <div class="flex-1 h-full flex flex-col justify-end bg-blue-300" style="height: ${day.registered / highest * 100}%"
+                     title="${escapeHtml(day.day)}: ${day.registered} registered, ${day.approved} approved, ${day.approvals} approvals that day">
+                    <div class="bg-blue-600" style="height: ${day.registered ? day.approved / day.registered * 100 : 0}%"></div>
+                </div>`).join('');
+            document.getElementById('analyticsFirstDay').textContent = data.days.length ? data.days[0].day : '';
+            document.getElementById('analyticsLastDay').textContent = data.days.length ? data.days[data.days.length - 1].day : '';
+
+            document.getElementById('analyticsReferences').innerHTML = data.top_references.map(reference => `
+                <tr class="border-b border-gray-200">
+                    <td class="py-2 px-4">${reference.reference ? escapeHtml(reference.reference) : '<em class="text-gray-400">none</em>'}</td>
+                    <td class="py-2 px-4">${reference.registrations}</td>
+                    <td class="py-2 px-4">${reference.approved}</td>
+                </tr>`).join('');
+        })
+        .catch(err => {
+            console.error('Error loading analytics:', err);
+            error.classList.remove('hidden');
+        });
+}
+
+// Initialize first tab as active
+document.addEventListener('DOMContentLoaded', function() {
+    showTab('events');
+});
+
+function editRegistration(id, fullName, mobile, address, reference, voucher, isApproved) {
+    document.getElementById('editId').value = id;
+    document.getElementById('editFullName').value = fullName;
+    document.getElementById('editMobile').value = mobile;
+    document.getElementById('editAddress').value = address;
+    document.getElementById('editReference').value = reference;
+    document.getElementById('editVoucher').value = voucher;
+    document.getElementById('editApproved').checked = isApproved;
+    
+    document.getElementById('editForm').action = '/admin/edit_registration/' + id;
+    document.getElementById('editModal').classList.remove('hidden');
+}
+
+function closeEditModal() {
+    document.getElementById('editModal').classList.add('hidden');
+}
+
+// Close modal when clicking outside
+document.getElementById('editModal').addEventListener('click', function(e) {
+    if (e.target === this) {
+        closeEditModal();
+    }
+});
+
+// Filtering happens on the server; typing just schedules a reload of the first page
+let filterTimer = null;
+
+function filterRegistrations() {
+    clearTimeout(filterTimer);
+    filterTimer = setTimeout(() => loadRegistrations(true), 300);
+}
+
+function currentFilters() {
+    return {
+        name: document.getElementById('searchName').value.trim(),
+        mobile: document.getElementById('searchMobile').value.trim(),
+        status: document.getElementById('filterStatus').value,
+        voucher: document.getElementById('searchVoucher').value.trim(),
+        date_from: document.getElementById('filterDateFrom').value,
+        date_to: document.getElementById('filterDateTo').value
+    };
+}
+
+function hasActiveFilters() {
+    return Object.values(currentFilters()).some(value => value !== '');
+}
+
+// Mirrors the server-side filters so live updates can be placed without a reload
+function matchesFilters(registration) {
+    const filters = currentFilters();
+    const day = (registration.registration_date || '').split(' ')[0];
+    return (!filters.name || registration.full_name.toLowerCase().includes(filters.name.toLowerCase()))
+        && (!filters.mobile || registration.mobile_number.startsWith(filters.mobile))
+        && (!filters.status || (filters.status === 'approved') === registration.is_approved)
+        && (!filters.voucher || (registration.voucher_number || '').startsWith(filters.voucher))
+        && (!filters.date_from || day >= filters.date_from)
+        && (!filters.date_to || day <= filters.date_to);
+}
+
+// Clear all filters
+function clearFilters() {
+    ['searchName', 'searchMobile', 'filterStatus', 'searchVoucher', 'filterDateFrom', 'filterDateTo'].forEach(id => {
+        document.getElementById(id).value = '';
+    });
+    loadRegistrations(true);
+}
+
+// Exports are built in the background; we poll the job and download when it is done
+const exportLabels = {excel: 'Excel', pdf: 'PDF'};
+
+function showExportStatus(text, isError) {
+    const status = document.getElementById('exportStatus');
+    status.textContent = text;
+    status.className = 'text-sm mt-2 ' + (isError ? 'text-red-700' : 'text-blue-700');
+}
+
+function trackExport(job) {
+    const label = exportLabels[job.kind];
+    if (job.status === 'done') {
+        showExportStatus(label + ' export ready, downloading...');
+        window.location = job.download_url;
+        return;
+    }
+    if (job.status === 'failed') {
+        showExportStatus(label + ' export failed: ' + (job.error || 'unknown error'), true);
+        return;
+    }
+    const percent = Math.round(job.progress * 100);
+    showExportStatus(job.status === 'queued'
+        ? label + ' export queued...'
+        : label + ' export in progress: ' + percent + '% (' + job.rows_done + ' of ' + (job.rows_total || '?') + ' rows)');
+    setTimeout(() => {
+        fetch('/admin/export/jobs/' + job.id, {cache: 'no-store'})
+            .then(response => response.json())
+            .then(data => trackExport(data.job))
+            .catch(() => showExportStatus(label + ' export status unavailable.', true));
+    }, 1000);
+}
+
+function startExport(kind) {
+    showExportStatus('Starting ' + exportLabels[kind] + ' export...');
+    fetch('/admin/export/' + kind + '/start', {method: 'POST'})
+        .then(response => {
+            if (!response.ok) {
+                throw new Error('Export could not be started');
+            }
+            return response.json();
+        })
+        .then(data => trackExport(data.job))
+        .catch(error => showExportStatus(error.message, true));
+    return false;
+}
+
+// Real-time update functionality
+let lastUpdateTime = new Date().getTime();
+let isUpdating = false;
+
+function escapeHtml(text) {
+    if (!text) return '';
+    return text.toString()
+        .replace(/&/g, '&amp;')
+        .replace(/</g, '&lt;')
+        .replace(/>/g, '&gt;')
+        .replace(/"/g, '&quot;')
+        .replace(/'/g, '&#39;');
+}
+
+function escapeForJs(text) {
+    if (!text) return '';
+    return text.toString()
+        .replace(/\\/g, '\\\\')
+        .replace(/'/g, "\\'") 
+        .replace(/"/g, '\\"')
+        .replace(/\n/g, '\\n')
+        .replace(/\r/g, '\\r');
+}
+
+function updateRegistrationsTable(registrations) {
+    if (isUpdating) return;
+    isUpdating = true;
+    
+    const tableBody = document.getElementById('registrationTableBody');
+    const noResultsRow = document.getElementById('noResultsRow');
+    
+    // Clear existing rows except no results row
+    const existingRows = tableBody.querySelectorAll('.registration-row');
+    existingRows.forEach(row => row.remove());
+    
+    if (registrations.length === 0) {
+        if (noResultsRow) {
+            noResultsRow.style.display = '';
+            noResultsRow.querySelector('td').textContent = hasActiveFilters()
+                ? 'No registrations match your search criteria.'
+                : 'No event registrations found.';
+        }
+        updateBulkBar();
+        isUpdating = false;
+        return;
+    }
+    
+    // Hide no results row
+    if (noResultsRow) {
+        noResultsRow.style.display = 'none';
+    }
+    
+    // Add new rows
+    registrations.forEach(registration => {
+        const row = document.createElement('tr');
+        row.className = 'border-b border-gray-200 hover:bg-gray-50 registration-row';
+        row.setAttribute('data-name', registration.full_name.toLowerCase());
+        row.setAttribute('data-mobile', registration.mobile_number);
+        row.setAttribute('data-status', registration.is_approved ? 'approved' : 'pending');
+        
+        const voucherDisplay = registration.voucher_number 
+            ? `<span class="bg-blue-100 text-blue-800 px-2 py-1 rounded text-xs">${escapeHtml(registration.voucher_number)}</span>`
+            : '<span class="text-gray-500">Not assigned</span>';
+        
+        const statusDisplay = registration.is_approved 
+            ? '<span class="px-2 py-1 text-xs rounded-full bg-green-100 text-green-800">Approved</span>'
+            : '<span class="px-2 py-1 text-xs rounded-full bg-yellow-100 text-yellow-800">Pending</span>';
+        
+        const approveButton = !registration.is_approved 
+            ? `<form action="/admin/approve_registration/${registration.id}" method="POST" class="inline">
+                 <button type="submit" class="bg-green-500 hover:bg-green-600 text-white font-bold py-1 px-3 rounded text-xs">Approve</button>
+               </form>`
+            : '';
+        
+        row.innerHTML = `
+            <td class="py-3 px-4"><input type="checkbox" class="registration-select" ${selectedRegistrations.has(registration.id) ? 'checked' : ''} onchange="toggleRegistration(${registration.id}, this.checked)"></td>
+            <td class="py-3 px-4">${registration.id}</td>
+            <td class="py-3 px-4">${escapeHtml(registration.full_name)}</td>
+            <td class="py-3 px-4">${escapeHtml(registration.mobile_number)}</td>
+            <td class="py-3 px-4">${escapeHtml(registration.address || 'N/A')}</td>
+            <td class="py-3 px-4">${escapeHtml(registration.reference || 'N/A')}</td>
+            <td class="py-3 px-4">${voucherDisplay}</td>
+            <td class="py-3 px-4">${statusDisplay}</td>
+            <td class="py-3 px-4">${registration.registration_date.split(' ')[0]}</td>
+            <td class="py-3 px-4">
+                <div class="flex space-x-2">
+                    <button onclick="editRegistration(${registration.id}, '${escapeForJs(registration.full_name)}', '${escapeForJs(registration.mobile_number)}', '${escapeForJs(registration.address || '')}', '${escapeForJs(registration.reference || '')}', '${escapeForJs(registration.voucher_number || '')}', ${registration.is_approved})" 
+                            class="bg-blue-500 hover:bg-blue-600 text-white font-bold py-1 px-3 rounded text-xs">Edit</button>
+                    ${approveButton}
+                    <form action="/admin/delete_registration/${registration.id}" method="POST" class="inline" onsubmit="return confirm('Are you sure you want to delete this registration?')">
+                        <button type="submit" class="bg-red-500 hover:bg-red-600 text-white font-bold py-1 px-3 rounded text-xs">Delete</button>
+                    </form>
+                </div>
+            </td>
+        `;
+        
+        if (noResultsRow) {
+            tableBody.insertBefore(row, noResultsRow);
+        } else {
+            tableBody.appendChild(row);
+        }
+    });
+    
+    updateBulkBar();
+    isUpdating = false;
+}
+
+// Bulk actions work on the ids ticked in the table and report back a
+// summary; the rows themselves update through the live change feed.
+const selectedRegistrations = new Set();
+
+function updateBulkBar() {
+    // Rows deleted or filtered out of the loaded window cannot stay selected
+    selectedRegistrations.forEach(id => {
+        if (!registrationsById.has(id)) selectedRegistrations.delete(id);
+    });
+    document.getElementById('selectedCount').textContent = selectedRegistrations.size;
+    document.querySelectorAll('.bulk-button').forEach(button => {
+        button.disabled = selectedRegistrations.size === 0;
+    });
+    document.getElementById('selectAllRegistrations').checked =
+        registrationsById.size > 0 && selectedRegistrations.size === registrationsById.size;
+}
+
+function toggleRegistration(id, checked) {
+    if (checked) {
+        selectedRegistrations.add(id);
+    } else {
+        selectedRegistrations.delete(id);
+    }
+    updateBulkBar();
+}
+
+function toggleAllRegistrations(checked) {
+    registrationsById.forEach((registration, id) => {
+        if (checked) {
+            selectedRegistrations.add(id);
+        } else {
+            selectedRegistrations.delete(id);
+        }
+    });
+    updateBulkBar();
+    document.querySelectorAll('.registration-select').forEach(box => { box.checked = checked; });
+}
+
+function clearSelection() {
+    toggleAllRegistrations(false);
+}
+
+function showBulkStatus(lines, isError) {
+    const status = document.getElementById('bulkStatus');
+    status.innerHTML = lines.map(line => escapeHtml(line)).join('<br>');
+    status.className = 'text-sm mt-2 ' + (isError ? 'text-red-700' : 'text-green-700');
+}
+
+function describeBulkResult(data) {
+    if (data.error) return [data.error];
+    if (data.ok === false) {
+        return [data.problem_count + ' of ' + data.rows + ' rows have problems, nothing was changed:']
+            .concat(data.problems.map(problem => 'Row ' + problem.line + ': ' + problem.problem));
+    }
+    const lines = [];
+    if ('assigned' in data) lines.push(data.assigned + ' voucher(s) assigned, ' + data.approved + ' registration(s) approved.');
+    if ('deleted' in data) lines.push(data.deleted + ' registration(s) deleted.');
+    if ('already_approved' in data) {
+        lines.push(data.approved + ' approved, ' + data.already_approved + ' already approved.');
+        if (data.without_voucher.length) {
+            lines.push('Not approved, no voucher number: ID ' + data.without_voucher.join(', '));
+        }
+    }
+    if (data.not_found && data.not_found.length) lines.push('Not found: ID ' + data.not_found.join(', '));
+    return lines;
+}
+
+function handleBulkResponse(response) {
+    return response.json().then(data => {
+        showBulkStatus(describeBulkResult(data), !response.ok);
+        return response.ok;
+    });
+}
+
+function runBulkAction(action) {
+    const ids = Array.from(selectedRegistrations);
+    if (!ids.length) return;
+    if (action === 'delete' && !confirm('Delete ' + ids.length + ' registration(s)?')) return;
+    showBulkStatus(['Working...']);
+    fetch('/admin/api/registrations/bulk', {
+        method: 'POST',
+        headers: {'Content-Type': 'application/json'},
+        body: JSON.stringify({action: action, ids: ids})
+    })
+        .then(handleBulkResponse)
+        .then(ok => {
+            if (ok && action === 'delete') clearSelection();
+            fetchLatestRegistrations();
+        })
+        .catch(() => showBulkStatus(['The request failed. Please try again.'], true));
+}
+
+function importVouchers(event) {
+    event.preventDefault();
+    const form = event.target;
+    showBulkStatus(['Importing...']);
+    fetch('/admin/api/registrations/vouchers/import', {method: 'POST', body: new FormData(form)})
+        .then(handleBulkResponse)
+        .then(ok => {
+            if (ok) form.reset();
+            fetchLatestRegistrations();
+        })
+        .catch(() => showBulkStatus(['The import failed. Please try again.'], true));
+    return false;
+}
+
+// Only the pages loaded so far are kept client-side. The server hands back a
+// cursor into its change log and later changes are applied to that window.
+let registrationCursor = null;
+let registrationEtag = null;
+let nextRegistrationPage = null;
+let pageRequest = 0;
+const registrationsById = new Map();
+
+function compareRegistrations(a, b) {
+    if (a.registration_date === b.registration_date) return b.id - a.id;
+    return a.registration_date < b.registration_date ? 1 : -1;
+}
+
+function renderLoadedRegistrations() {
+    updateRegistrationsTable(Array.from(registrationsById.values()).sort(compareRegistrations));
+    document.getElementById('loadMoreButton').classList.toggle('hidden', !nextRegistrationPage);
+}
+
+// True if the row sorts inside the loaded window (or everything is loaded)
+function withinLoadedWindow(registration) {
+    if (!nextRegistrationPage) return true;
+    const parts = nextRegistrationPage.split('|');
+    return compareRegistrations(registration, {registration_date: parts[0], id: Number(parts[1])}) <= 0;
+}
+
+function loadRegistrations(reset) {
+    const params = new URLSearchParams();
+    Object.entries(currentFilters()).forEach(([key, value]) => {
+        if (value !== '') params.set(key, value);
+    });
+    if (!reset && nextRegistrationPage) params.set('after', nextRegistrationPage);
+    const request = ++pageRequest;
+    
+    return fetch('/admin/api/registrations/page?' + params.toString(), {cache: 'no-store'})
+        .then(response => {
+            if (!response.ok) {
+                throw new Error('Network response was not ok');
+            }
+            return response.json();
+        })
+        .then(data => {
+            // A newer filter change superseded this request
+            if (request !== pageRequest) return;
+            if (reset) {
+                registrationsById.clear();
+                registrationCursor = data.cursor;
+                registrationEtag = null;
+            }
+            data.registrations.forEach(registration => registrationsById.set(registration.id, registration));
+            nextRegistrationPage = data.next;
+            renderLoadedRegistrations();
+        })
+        .catch(error => {
+            console.error('Error loading registrations:', error);
+            updateStatusIndicator(true);
+        });
+}
+
+function applyRegistrationChanges(data) {
+    if (data.reset) {
+        // The change log could not be replayed from our cursor
+        return loadRegistrations(true);
+    }
+    data.registrations.forEach(registration => {
+        if (matchesFilters(registration) && withinLoadedWindow(registration)) {
+            registrationsById.set(registration.id, registration);
+        } else {
+            registrationsById.delete(registration.id);
+        }
+    });
+    data.deleted.forEach(id => registrationsById.delete(id));
+    registrationCursor = data.cursor;
+    
+    if (data.registrations.length || data.deleted.length) {
+        renderLoadedRegistrations();
+    }
+}
+
+function fetchLatestRegistrations() {
+    if (registrationCursor === null) {
+        return loadRegistrations(true);
+    }
+    const headers = {};
+    if (registrationEtag) headers['If-None-Match'] = registrationEtag;
+    
+    return fetch('/admin/api/registrations?since=' + registrationCursor, {headers: headers, cache: 'no-store'})
+        .then(response => {
+            if (response.status === 304) {
+                return null;
+            }
+            if (!response.ok) {
+                throw new Error('Network response was not ok');
+            }
+            registrationEtag = response.headers.get('ETag');
+            return response.json();
+        })
+        .then(data => {
+            if (data) {
+                applyRegistrationChanges(data);
+            }
+            lastUpdateTime = new Date().getTime();
+            updateStatusIndicator();
+        })
+        .catch(error => {
+            console.error('Error fetching registrations:', error);
+            updateStatusIndicator(true);
+        });
+}
+
+// Live updates are pushed over Server-Sent Events when the server enables
+// them (SSE_ENABLED); otherwise, in browsers without EventSource, or when the
+// server refuses the stream, the dashboard polls for changes.
+const liveStreamEnabled = document.currentScript !== null && document.currentScript.dataset.liveStream === 'on';
+let updateInterval;
+let registrationStream = null;
+
+function startPolling() {
+    if (!updateInterval) {
+        updateInterval = setInterval(fetchLatestRegistrations, 5000);
+    }
+}
+
+function handleStreamEvent(event) {
+    const data = JSON.parse(event.data);
+    if (event.type === 'delete') {
+        applyRegistrationChanges({registrations: [], deleted: [data.id], cursor: data.cursor, reset: false});
+    } else if (data.registration) {
+        applyRegistrationChanges({registrations: [data.registration], deleted: [], cursor: data.cursor, reset: false});
+    }
+    lastUpdateTime = new Date().getTime();
+    updateStatusIndicator();
+}
+
+function openRegistrationStream() {
+    closeRegistrationStream();
+    if (!liveStreamEnabled || !window.EventSource || registrationCursor === null) {
+        startPolling();
+        return;
+    }
+    
+    registrationStream = new EventSource('/admin/api/registrations/stream?since=' + registrationCursor);
+    ['insert', 'update', 'approve', 'delete', 'ping'].forEach(type => {
+        registrationStream.addEventListener(type, handleStreamEvent);
+    });
+    registrationStream.addEventListener('reset', () => {
+        // Our cursor is too old to replay; reload everything and resubscribe
+        closeRegistrationStream();
+        loadRegistrations(true).then(openRegistrationStream);
+    });
+    registrationStream.onerror = () => {
+        if (registrationStream.readyState === EventSource.CLOSED) {
+            closeRegistrationStream();
+            updateStatusIndicator(true);
+            startPolling();
+        }
+    };
+}
+
+function closeRegistrationStream() {
+    if (registrationStream) {
+        registrationStream.close();
+        registrationStream = null;
+    }
+}
+
+function startRealTimeUpdates() {
+     // Clear any existing interval or stream
+     stopRealTimeUpdates();
+     
+     // Show status indicator
+     const statusElement = document.getElementById('realTimeStatus');
+     if (statusElement) {
+         statusElement.style.display = 'block';
+     }
+     
+     // Load the first page, then subscribe to changes after it
+     loadRegistrations(true).then(openRegistrationStream);
+ }
+
+function stopRealTimeUpdates() {
+     closeRegistrationStream();
+     if (updateInterval) {
+         clearInterval(updateInterval);
+         updateInterval = null;
+     }
+     
+     // Hide status indicator
+     const statusElement = document.getElementById('realTimeStatus');
+     if (statusElement) {
+         statusElement.style.display = 'none';
+     }
+ }
+ 
+ function updateStatusIndicator(hasError = false) {
+     const statusElement = document.getElementById('realTimeStatus');
+     const indicator = document.getElementById('statusIndicator');
+     const lastUpdateText = document.getElementById('lastUpdateText');
+     
+     if (!statusElement || !indicator || !lastUpdateText) return;
+     
+     const now = new Date();
+     const timeString = now.toLocaleTimeString();
+     
+     if (hasError) {
+         statusElement.className = 'bg-red-50 border border-red-200 p-3 rounded-lg mb-4';
+         indicator.className = 'w-3 h-3 bg-red-500 rounded-full';
+         statusElement.querySelector('p').innerHTML = `
+             <strong class="text-red-700">Connection Error</strong> - Unable to fetch updates
+             <span class="text-xs text-red-600 ml-2">Last attempt: ${timeString}</span>
+         `;
+     } else {
+         statusElement.className = 'bg-green-50 border border-green-200 p-3 rounded-lg mb-4';
+         indicator.className = 'w-3 h-3 bg-green-500 rounded-full animate-pulse';
+         statusElement.querySelector('p').innerHTML = `
+             <strong class="text-green-700">Real-time Updates Active</strong> - New registrations appear automatically
+             <span class="text-xs text-green-600 ml-2">Last updated: ${timeString}</span>
+         `;
+     }
+ }
@@ -0,0 +1,42 @@
+// Intersection Observer for scroll animations
+document.addEventListener('DOMContentLoaded', function() {
+    const observerOptions = {
+        threshold: 0.1,
+        rootMargin: '0px 0px -50px 0px'
+    };
+    
+    const observer = new IntersectionObserver(function(entries) {
+        entries.forEach(entry => {
+            if (entry.isIntersecting) {
+                entry.target.classList.add('animate');
+            }
+        });
+    }, observerOptions);
+    
+    // Observe all animation elements
+    document.querySelectorAll('.fade-in-up, .fade-in-left, .fade-in-right, .scale-in').forEach(el => {
+        observer.observe(el);
+    });
+});
+
+function toggleMobileMenu() {
+    const menu = document.getElementById('mobileMenu');
+    menu.classList.toggle('active');
+}
+
+function toggleMobileSubmenu(event) {
+    event.preventDefault();
+    const submenu = document.getElementById('about-submenu-mobile');
+    const arrow = document.getElementById('about-arrow-mobile');
+    submenu.classList.toggle('hidden');
+    arrow.classList.toggle('rotate-180');
+}
+
+// Close mobile menu when clicking outside
+document.addEventListener('click', function(event) {
+    const menu = document.getElementById('mobileMenu');
+    const button = event.target.closest('button');
+    if (!menu.contains(event.target) && !button) {
+        menu.classList.remove('active');
+    }
+});
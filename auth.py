@@ -0,0 +1,202 @@
+"""Admin authentication: password hashes, login throttling and cached identities.
+
+Passwords are stored as Werkzeug hashes (``method$salt$hash``). The method,
+PASSWORD_HASH_METHOD in app.py, sets the cost of a login; `python auth.py
+calibrate` finds the strongest scrypt setting that stays under a time budget
+on this machine. A stored hash made with another method is replaced by one
+with the configured method the next time its owner logs in. Unknown usernames
+are checked against a dummy hash, so a failed login takes the same time
+whether or not the user exists.
+
+Failed logins are counted per client address and per username in the
+``login_failures`` table, shared by all workers. Once a key reaches its limit,
+further attempts are refused before any hashing until its window ends, so a
+flood of guesses cannot keep workers busy computing hashes.
+
+A session carries the user's id and a stamp derived from their password hash.
+Each worker remembers the users it has resolved for a short time, so
+authenticated requests normally need no query; changing a password changes
+the stamp and ends the user's other sessions once the cached entry expires.
+
+    python auth.py set-password USERNAME [DATABASE]   # prompts for the new password
+    python auth.py calibrate [--target-ms 100]
+"""
+import argparse
+import getpass
+import hashlib
+import hmac
+import sqlite3
+import sys
+import time
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+DEFAULT_METHOD = 'scrypt:16384:8:1'
+SALT_LENGTH = 16
+STAMP_LENGTH = 16
+
+# user id -> (expires at, username, session stamp)
+_identities = {}
+# method -> hash of a random password, checked for unknown usernames
+_dummy_hashes = {}
+
+
+def hash_password(password, method=DEFAULT_METHOD):
+    return generate_password_hash(password, method=method, salt_length=SALT_LENGTH)
+
+
+def is_password_hash(stored):
+    """Tells a Werkzeug hash from a plaintext password left by an old init_db.py."""
+    method, _, rest = stored.partition('$')
+    return rest.count('$') == 1 and method.split(':', 1)[0] in ('scrypt', 'pbkdf2')
+
+
+def needs_rehash(stored, method):
+    return stored.split('$', 1)[0] != method
+
+
+def _dummy_hash(method):
+    if method not in _dummy_hashes:
+        _dummy_hashes[method] = hash_password(hashlib.sha256(str(time.time()).encode()).hexdigest(), method)
+    return _dummy_hashes[method]
+
+
+def authenticate(db, username, password, method=DEFAULT_METHOD):
+    """Returns the user row (id, username, password) if the password is right, otherwise None.
+
+    Rehashes the password with ``method`` when the stored hash used another one.
+    """
+    user = db.execute('SELECT id, username, password FROM users WHERE username = ?', (username,)).fetchone()
+    if user is None or not is_password_hash(user['password']):
+        check_password_hash(_dummy_hash(method), password)
+        return None
+    if not check_password_hash(user['password'], password):
+        return None
+    if needs_rehash(user['password'], method):
+        new_hash = hash_password(password, method)
+        db.execute('UPDATE users SET password = ? WHERE id = ?', (new_hash, user['id']))
+        db.commit()
+        user = db.execute('SELECT id, username, password FROM users WHERE id = ?', (user['id'],)).fetchone()
+    return user
+
+
+def set_password(db, username, password, method=DEFAULT_METHOD):
+    """Stores a new password for an existing user. Returns False if there is no such user."""
+    cursor = db.execute('UPDATE users SET password = ? WHERE username = ?', (hash_password(password, method), username))
+    db.commit()
+    for user_id, identity in list(_identities.items()):
+        if identity[1] == username:
+            _identities.pop(user_id, None)
+    return cursor.rowcount > 0
+
+
+# --- Login throttling ---
+
+def retry_after(db, limits, now=None):
+    """Returns the seconds until a login may be tried again, or 0 if it may be tried now.
+
+    ``limits`` is a list of (key, max failures, window seconds).
+    """
+    now = time.time() if now is None else now
+    wait = 0
+    for key, max_failures, window in limits:
+        row = db.execute('SELECT failures, window_start FROM login_failures WHERE key = ?', (key,)).fetchone()
+        if row is not None and row[0] >= max_failures and row[1] + window > now:
+            wait = max(wait, row[1] + window - now)
+    return wait
+
+
+def record_failure(db, limits, now=None):
+    """Counts a failed login against every key in ``limits``; a key's window starts at its first failure."""
+    now = time.time() if now is None else now
+    for key, _, window in limits:
+        db.execute('''
+            INSERT INTO login_failures (key, failures, window_start) VALUES (?, 1, ?)
+            ON CONFLICT (key) DO UPDATE SET
+                failures = CASE WHEN window_start + ? <= excluded.window_start THEN 1 ELSE failures + 1 END,
+                window_start = CASE WHEN window_start + ? <= excluded.window_start
+                                    THEN excluded.window_start ELSE window_start END
+        ''', (key, now, window, window))
+    # Expired windows are no longer needed
+    db.execute('DELETE FROM login_failures WHERE window_start < ?', (now - max(limit[2] for limit in limits),))
+    db.commit()
+
+
+def clear_failures(db, keys):
+    db.executemany('DELETE FROM login_failures WHERE key = ?', [(key,) for key in keys])
+    db.commit()
+
+
+# --- Sessions ---
+
+def session_stamp(password_hash):
+    """Short digest of the stored hash; sessions made before a password change no longer match it."""
+    return hashlib.sha256(password_hash.encode()).hexdigest()[:STAMP_LENGTH]
+
+
+def resolve_identity(load_user, user_id, stamp, ttl):
+    """Returns the username of a session's user, or None if the user is gone or the stamp is stale.
+
+    ``load_user(user_id)`` returns the user row and is only called when this
+    worker has not resolved the user in the last ``ttl`` seconds.
+    """
+    now = time.monotonic()
+    identity = _identities.get(user_id)
+    if identity is None or identity[0] <= now:
+        user = load_user(user_id)
+        if user is None:
+            _identities.pop(user_id, None)
+            return None
+        identity = (now + ttl, user['username'], session_stamp(user['password']))
+        _identities[user_id] = identity
+    if not hmac.compare_digest(identity[2], stamp or ''):
+        return None
+    return identity[1]
+
+
+def calibrate(target_ms, r=8, p=1):
+    """Returns the scrypt method with the largest power-of-two cost whose check takes at most target_ms."""
+    n = 1024
+    best = f'scrypt:{n}:{r}:{p}'
+    while n <= 2 ** 20:
+        method = f'scrypt:{n}:{r}:{p}'
+        stored = hash_password('calibration', method)
+        started = time.perf_counter()
+        check_password_hash(stored, 'calibration')
+        elapsed = (time.perf_counter() - started) * 1000
+        print(f'{method:<20} {elapsed:8.1f} ms  {128 * n * r // 2 ** 20} MB')
+        if elapsed > target_ms:
+            break
+        best = method
+        n *= 2
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+    set_parser = commands.add_parser('set-password', help="change a user's password")
+    set_parser.add_argument('username')
+    set_parser.add_argument('database', nargs='?', default='database.db')
+    set_parser.add_argument('--method', default=DEFAULT_METHOD, help=f'hash method (default {DEFAULT_METHOD})')
+    calibrate_parser = commands.add_parser('calibrate', help='suggest a PASSWORD_HASH_METHOD for this machine')
+    calibrate_parser.add_argument('--target-ms', type=float, default=100, help='time budget per login (default 100)')
+    args = parser.parse_args()
+
+    if args.command == 'calibrate':
+        print(f"PASSWORD_HASH_METHOD = '{calibrate(args.target_ms)}'")
+        return
+    password = getpass.getpass(f'New password for {args.username}: ')
+    if password != getpass.getpass('Repeat it: '):
+        sys.exit('The passwords do not match')
+    connection = sqlite3.connect(args.database, timeout=30)
+    try:
+        if not set_password(connection, args.username, password, args.method):
+            sys.exit(f'No user named {args.username}')
+    finally:
+        connection.close()
+    print(f'Password changed for {args.username}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,452 @@
+"""Online snapshots of database.db with page-level increments, retention and restore.
+
+A snapshot is a consistent copy taken with SQLite's online backup API while
+the site keeps running. In WAL mode (the default, see sqlite_pool.py) the
+copy is a single read transaction: registrations go on being committed while
+it runs, and the snapshot shows the database as of the moment the copy
+started. With another journal mode the copy is made STEP_PAGES pages at a
+time, so a writer waits for one step at most.
+
+The copy is cut into chunks of CHUNK_PAGES pages. Each chunk is stored once,
+gzip-compressed, under its SHA-256 in ``chunks/``, and a snapshot is a small
+JSON manifest in ``snapshots/`` listing its chunks. Pages unchanged since an
+earlier snapshot take no space, and a snapshot identical to the newest one
+is not stored at all.
+
+Retention keeps the newest ``keep_recent`` snapshots plus the newest one of
+each of the last ``keep_daily`` days (UTC); chunks that no remaining snapshot
+uses are deleted.
+
+With BACKUP_INTERVAL set in app.py, each worker runs a ``Scheduler`` thread.
+A lock file in the backup folder lets one process at a time take a snapshot,
+and only once the last run is BACKUP_INTERVAL seconds old, so the workers
+together take one snapshot per interval. ``python backup.py snapshot`` does
+the same from cron.
+
+    python backup.py snapshot                        # take a snapshot now and apply retention
+    python backup.py list
+    python backup.py verify SNAPSHOT                 # rebuild it and run an integrity check
+    python backup.py restore SNAPSHOT --to copy.db   # write it to a new file
+    python backup.py restore SNAPSHOT                # replace the live database (snapshots it first)
+"""
+import argparse
+import contextlib
+import gzip
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+DEFAULT_FOLDER = 'backups'
+SNAPSHOT_FOLDER = 'snapshots'
+CHUNK_FOLDER = 'chunks'
+LOCK_FILE = '.lock'
+LAST_RUN_FILE = '.last_run'
+CHUNK_PAGES = 32
+KEEP_RECENT = 24
+KEEP_DAILY = 14
+# Used when the database is not in WAL mode: pages copied per step, and the pause between steps
+STEP_PAGES = 256
+STEP_SLEEP = 0.01
+# Longest pause between two checks of the scheduler, in seconds
+CHECK_INTERVAL = 60
+
+
+def _write_atomic(path, data):
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as output:
+            output.write(data)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def _remove_database_file(path):
+    """Removes a database file together with any -wal/-shm files left next to it."""
+    for suffix in ('', '-wal', '-shm', '-journal'):
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(path + suffix)
+
+
+def _chunk_path(folder, name):
+    return os.path.join(folder, CHUNK_FOLDER, name[:2], name + '.gz')
+
+
+def _manifest_path(folder, snapshot_id):
+    return os.path.join(folder, SNAPSHOT_FOLDER, snapshot_id + '.json')
+
+
+@contextlib.contextmanager
+def locked(folder, blocking=True):
+    """Holds the backup folder's lock while the block runs.
+
+    Yields True, or False without waiting if ``blocking`` is off and another
+    process or thread holds the lock.
+    """
+    os.makedirs(folder, exist_ok=True)
+    with open(os.path.join(folder, LOCK_FILE), 'a') as lock_file:
+        if fcntl is None:
+            yield True
+            return
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def copy_database(database, path):
+    """Copies a consistent view of ``database`` to the new file ``path`` with the online backup API."""
+    source = sqlite3.connect(database, timeout=30)
+    try:
+        target = sqlite3.connect(path)
+        try:
+            if source.execute('PRAGMA journal_mode').fetchone()[0] == 'wal':
+                # One step is one read transaction, which WAL writers never wait for
+                source.backup(target)
+            else:
+                # Each step holds a read lock; writers get in between steps (and restart the copy)
+                source.backup(target, pages=STEP_PAGES, sleep=STEP_SLEEP)
+        finally:
+            target.close()
+    finally:
+        source.close()
+
+
+def list_snapshots(folder):
+    """Returns the manifests of all snapshots, oldest first."""
+    directory = os.path.join(folder, SNAPSHOT_FOLDER)
+    try:
+        names = sorted(name for name in os.listdir(directory) if name.endswith('.json'))
+    except FileNotFoundError:
+        return []
+    snapshots = []
+    for name in names:
+        with open(os.path.join(directory, name)) as manifest_file:
+            snapshots.append(json.load(manifest_file))
+    return snapshots
+
+
+def read_snapshot(folder, snapshot_id):
+    try:
+        with open(_manifest_path(folder, snapshot_id)) as manifest_file:
+            return json.load(manifest_file)
+    except FileNotFoundError:
+        raise KeyError(f'No snapshot {snapshot_id}') from None
+
+
+def take_snapshot(database, folder, now=None):
+    """Snapshots ``database`` into ``folder``; returns the manifest.
+
+    Returns None instead when the database is identical to the newest
+    snapshot. Call with the folder locked (see ``locked``).
+    """
+    now = time.time() if now is None else now
+    os.makedirs(os.path.join(folder, SNAPSHOT_FOLDER), exist_ok=True)
+    fd, copy_path = tempfile.mkstemp(dir=folder, suffix='.db.tmp')
+    os.close(fd)
+    os.remove(copy_path)
+    try:
+        copy_database(database, copy_path)
+        with open(copy_path, 'rb') as copy_file:
+            page_size = int.from_bytes(copy_file.read(100)[16:18], 'big')
+            # 1 stands for 65536 in the header
+            page_size = 65536 if page_size == 1 else page_size
+            copy_file.seek(0)
+            digest = hashlib.sha256()
+            chunks = []
+            new_chunks = new_bytes = 0
+            for data in iter(lambda: copy_file.read(page_size * CHUNK_PAGES), b''):
+                digest.update(data)
+                name = hashlib.sha256(data).hexdigest()
+                path = _chunk_path(folder, name)
+                if not os.path.isfile(path):
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    compressed = gzip.compress(data, compresslevel=6, mtime=0)
+                    _write_atomic(path, compressed)
+                    new_chunks += 1
+                    new_bytes += len(compressed)
+                chunks.append(name)
+            size = copy_file.tell()
+    finally:
+        _remove_database_file(copy_path)
+
+    snapshots = list_snapshots(folder)
+    if snapshots and snapshots[-1]['sha256'] == digest.hexdigest():
+        return None
+    moment = datetime.fromtimestamp(now, timezone.utc)
+    manifest = {
+        'id': moment.strftime('%Y%m%dT%H%M%S.%fZ'),
+        'created': now,
+        'database': os.path.basename(database),
+        'size': size,
+        'page_size': page_size,
+        'chunk_pages': CHUNK_PAGES,
+        'sha256': digest.hexdigest(),
+        'new_chunks': new_chunks,
+        'new_bytes': new_bytes,
+        'chunks': chunks,
+    }
+    _write_atomic(_manifest_path(folder, manifest['id']), json.dumps(manifest).encode())
+    return manifest
+
+
+def prune(folder, keep_recent=KEEP_RECENT, keep_daily=KEEP_DAILY, now=None):
+    """Applies the retention rules; returns (snapshots removed, chunks removed).
+
+    Call with the folder locked, so no snapshot is writing chunks meanwhile.
+    """
+    now = time.time() if now is None else now
+    snapshots = list_snapshots(folder)
+    # The newest snapshot is always kept
+    keep = {snapshot['id'] for snapshot in snapshots[-max(keep_recent, 1):]}
+    newest_per_day = {}
+    for snapshot in snapshots:
+        newest_per_day[datetime.fromtimestamp(snapshot['created'], timezone.utc).date()] = snapshot['id']
+    today = datetime.fromtimestamp(now, timezone.utc).date()
+    keep.update(snapshot_id for day, snapshot_id in newest_per_day.items() if (today - day).days < keep_daily)
+
+    removed = 0
+    used = set()
+    for snapshot in snapshots:
+        if snapshot['id'] in keep:
+            used.update(snapshot['chunks'])
+        else:
+            os.remove(_manifest_path(folder, snapshot['id']))
+            removed += 1
+    removed_chunks = 0
+    for directory, _, filenames in os.walk(folder):
+        for filename in filenames:
+            if filename.endswith('.gz') and filename[:-3] not in used:
+                os.remove(os.path.join(directory, filename))
+                removed_chunks += 1
+            elif '.tmp' in filename:
+                # Left by a process that died mid-write; no one else writes while the lock is held
+                os.remove(os.path.join(directory, filename))
+    return removed, removed_chunks
+
+
+def rebuild(folder, snapshot_id, path):
+    """Writes a snapshot to the new database file ``path`` and checks it; returns the manifest.
+
+    Raises ValueError if a chunk is missing or damaged or the result fails
+    SQLite's integrity check.
+    """
+    manifest = read_snapshot(folder, snapshot_id)
+    if os.path.exists(path) or os.path.exists(path + '-wal'):
+        raise ValueError(f'{path} already exists')
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.db.tmp')
+    try:
+        digest = hashlib.sha256()
+        with os.fdopen(fd, 'wb') as output:
+            for name in manifest['chunks']:
+                try:
+                    with open(_chunk_path(folder, name), 'rb') as chunk_file:
+                        data = gzip.decompress(chunk_file.read())
+                except FileNotFoundError:
+                    raise ValueError(f'Snapshot {snapshot_id} is missing chunk {name}') from None
+                if hashlib.sha256(data).hexdigest() != name:
+                    raise ValueError(f'Chunk {name} of snapshot {snapshot_id} is damaged')
+                digest.update(data)
+                output.write(data)
+        if digest.hexdigest() != manifest['sha256']:
+            raise ValueError(f'Snapshot {snapshot_id} does not match its checksum')
+        connection = sqlite3.connect(temp_path)
+        try:
+            result = connection.execute('PRAGMA integrity_check').fetchone()[0]
+        finally:
+            connection.close()
+        if result != 'ok':
+            raise ValueError(f'Snapshot {snapshot_id} fails the integrity check: {result}')
+        os.replace(temp_path, path)
+    except BaseException:
+        _remove_database_file(temp_path)
+        raise
+    return manifest
+
+
+def restore(database, folder, snapshot_id):
+    """Replaces the contents of the live ``database`` with a snapshot; returns the snapshot taken just before.
+
+    The current contents are snapshotted first (None if they match the
+    newest snapshot), so a restore can itself be undone. The pages are
+    copied in with the backup API, which holds the write lock for the copy,
+    so open connections switch to the restored data without a restart.
+    """
+    with locked(folder):
+        before = take_snapshot(database, folder)
+        fd, temp_path = tempfile.mkstemp(dir=folder, suffix='.db.tmp')
+        os.close(fd)
+        os.remove(temp_path)
+        try:
+            rebuild(folder, snapshot_id, temp_path)
+            source = sqlite3.connect(temp_path)
+            try:
+                target = sqlite3.connect(database, timeout=30)
+                try:
+                    source.backup(target)
+                finally:
+                    target.close()
+            finally:
+                source.close()
+        finally:
+            _remove_database_file(temp_path)
+    return before
+
+
+def snapshot(database, folder, keep_recent=KEEP_RECENT, keep_daily=KEEP_DAILY):
+    """Takes a snapshot and applies retention under the lock; returns the manifest or None (unchanged)."""
+    with locked(folder):
+        manifest = take_snapshot(database, folder)
+        prune(folder, keep_recent, keep_daily)
+        _mark_run(folder)
+    return manifest
+
+
+def _mark_run(folder):
+    path = os.path.join(folder, LAST_RUN_FILE)
+    with open(path, 'a'):
+        pass
+    os.utime(path)
+
+
+def _last_run(folder):
+    try:
+        return os.stat(os.path.join(folder, LAST_RUN_FILE)).st_mtime
+    except FileNotFoundError:
+        return 0
+
+
+class Scheduler:
+    """Background thread that runs ``snapshot`` whenever the last run is ``interval`` seconds old.
+
+    ``start`` may be called on every request: it only starts a thread if this
+    process has none, including after a fork.
+    """
+
+    def __init__(self, database, folder, interval, keep_recent=KEEP_RECENT, keep_daily=KEEP_DAILY, logger=None):
+        self.database = database
+        self.folder = folder
+        self.interval = interval
+        self.keep_recent = keep_recent
+        self.keep_daily = keep_daily
+        self.logger = logger
+        self._thread = None
+        self._pid = None
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._stopped = threading.Event()
+                self._thread = threading.Thread(target=self._run, name='backup-scheduler', daemon=True)
+                self._thread.start()
+                self._pid = os.getpid()
+
+    def stop(self):
+        self._stopped.set()
+
+    def run_once(self):
+        """Takes a snapshot if one is due and no other process is taking one; returns the manifest or None."""
+        with locked(self.folder, blocking=False) as acquired:
+            if not acquired or _last_run(self.folder) + self.interval > time.time():
+                return None
+            manifest = take_snapshot(self.database, self.folder)
+            prune(self.folder, self.keep_recent, self.keep_daily)
+            _mark_run(self.folder)
+            return manifest
+
+    def _run(self):
+        stopped = self._stopped
+        # Spread the workers' checks apart
+        while not stopped.wait(random.uniform(0.5, 1) * min(self.interval, CHECK_INTERVAL)):
+            try:
+                manifest = self.run_once()
+            except Exception:
+                if self.logger is not None:
+                    self.logger.exception('Database snapshot failed')
+                continue
+            if manifest is not None and self.logger is not None:
+                self.logger.info('Database snapshot %s: %d new chunk(s), %d bytes',
+                                 manifest['id'], manifest['new_chunks'], manifest['new_bytes'])
+
+
+def _invalidate_pages(version_dir):
+    """Gives every data set in the page cache a new version, so cached pages are rendered from the restored data."""
+    if not os.path.isdir(version_dir):
+        return
+    for name in os.listdir(version_dir):
+        if not name.endswith('.tmp'):
+            _write_atomic(os.path.join(version_dir, name), f'{time.time_ns()}-restore'.encode())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database', default='database.db')
+    parser.add_argument('--folder', default=DEFAULT_FOLDER, help=f'backup folder (default {DEFAULT_FOLDER})')
+    commands = parser.add_subparsers(dest='command', required=True)
+    snapshot_parser = commands.add_parser('snapshot', help='take a snapshot now and apply retention')
+    snapshot_parser.add_argument('--keep-recent', type=int, default=KEEP_RECENT)
+    snapshot_parser.add_argument('--keep-daily', type=int, default=KEEP_DAILY)
+    commands.add_parser('list', help='list the snapshots')
+    verify_parser = commands.add_parser('verify', help='rebuild a snapshot in a temporary file and check it')
+    verify_parser.add_argument('snapshot')
+    restore_parser = commands.add_parser('restore', help='restore a snapshot')
+    restore_parser.add_argument('snapshot')
+    restore_parser.add_argument('--to', help='write the snapshot to this new file instead of the live database')
+    restore_parser.add_argument('--version-dir', default='cache/versions',
+                                help='DATA_VERSION_DIR of the app, to refresh cached pages (default cache/versions)')
+    args = parser.parse_args()
+
+    try:
+        if args.command == 'snapshot':
+            manifest = snapshot(args.database, args.folder, args.keep_recent, args.keep_daily)
+            if manifest is None:
+                print('Unchanged since the newest snapshot')
+            else:
+                print(f"Snapshot {manifest['id']}: {manifest['size'] // 1024} KB, "
+                      f"{manifest['new_chunks']} of {len(manifest['chunks'])} chunk(s) new "
+                      f"({manifest['new_bytes'] // 1024} KB stored)")
+        elif args.command == 'list':
+            for manifest in list_snapshots(args.folder):
+                print(f"{manifest['id']}  {manifest['size'] // 1024:>8} KB  "
+                      f"{manifest['new_bytes'] // 1024:>8} KB new")
+        elif args.command == 'verify':
+            with tempfile.TemporaryDirectory() as directory:
+                manifest = rebuild(args.folder, args.snapshot, os.path.join(directory, 'verify.db'))
+            print(f"Snapshot {manifest['id']} is intact")
+        elif args.to:
+            rebuild(args.folder, args.snapshot, args.to)
+            print(f'Snapshot {args.snapshot} written to {args.to}')
+        else:
+            before = restore(args.database, args.folder, args.snapshot)
+            _invalidate_pages(args.version_dir)
+            if before is not None:
+                print(f"The previous contents were saved as snapshot {before['id']}")
+            print(f'Restored {args.database} from snapshot {args.snapshot}')
+    except (KeyError, ValueError) as error:
+        sys.exit(str(error).strip("'"))
+
+
+if __name__ == '__main__':
+    main()
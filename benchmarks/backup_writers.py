@@ -0,0 +1,100 @@
+"""Measures how database snapshots affect registration inserts.
+
+Seeds a temporary database (see seed.py), then commits registrations one at a
+time from a writer thread, first alone and then while another thread takes
+snapshots back to back with backup.py, as the scheduler thread does inside a
+worker. Compares the insert latencies of both phases; in WAL mode they should
+match, because a snapshot is a read transaction that writers never wait for.
+
+    python benchmarks/backup_writers.py
+    python benchmarks/backup_writers.py --registrations 100000 --journal-mode delete
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import backup  # noqa: E402
+import registrations  # noqa: E402
+import seed  # noqa: E402
+import sqlite_pool  # noqa: E402
+
+NUMBER_PREFIX = '0144'
+
+
+def percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def write_for(connection, seconds, numbers):
+    """Commits one registration at a time for ``seconds``; returns the latencies."""
+    latencies = []
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        registrations.insert_registration(
+            connection, 'Benchmark', 'Dhaka', f'{NUMBER_PREFIX}{next(numbers):07d}', 'benchmark'
+        )
+        connection.commit()
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def report(name, latencies, note=''):
+    ordered = sorted(latencies)
+    print(f'{name:<16} {len(ordered):>7} {percentile(ordered, 0.50) * 1000:>8.2f} '
+          f'{percentile(ordered, 0.99) * 1000:>8.2f} {ordered[-1] * 1000:>8.1f}   {note}'.rstrip())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--registrations', type=int, default=50000, help='seeded registrations (default 50000)')
+    parser.add_argument('--seconds', type=float, default=5, help='length of each phase (default 5)')
+    parser.add_argument('--journal-mode', default='WAL', help='journal mode of the database (default WAL)')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='backup-bench-')
+    try:
+        database = os.path.join(workdir, 'database.db')
+        seed.build(database, args.registrations, 0, 0, upload_folder=os.path.join(workdir, 'uploads'))
+        pool = sqlite_pool.ConnectionPool(database, journal_mode=args.journal_mode)
+        connection = pool.connect()
+        mode = connection.execute('PRAGMA journal_mode').fetchone()[0]
+        print(f'{args.registrations} registrations, {os.path.getsize(database) // 1024} KB, journal mode {mode}')
+        numbers = iter(range(10 ** 7))
+        folder = os.path.join(workdir, 'backups')
+
+        print(f"{'phase':<16} {'inserts':>7} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+        report('alone', write_for(connection, args.seconds, numbers))
+
+        stop = threading.Event()
+        snapshot_seconds = []
+
+        def snapshot_loop():
+            while not stop.is_set():
+                started = time.perf_counter()
+                backup.snapshot(database, folder)
+                snapshot_seconds.append(time.perf_counter() - started)
+
+        snapshotter = threading.Thread(target=snapshot_loop)
+        snapshotter.start()
+        try:
+            latencies = write_for(connection, args.seconds, numbers)
+        finally:
+            stop.set()
+            snapshotter.join()
+        average = sum(snapshot_seconds) / len(snapshot_seconds) * 1000 if snapshot_seconds else 0
+        report('with snapshots', latencies, f'{len(snapshot_seconds)} snapshot(s), {average:.0f} ms each')
+        connection.close()
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
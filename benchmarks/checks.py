@@ -0,0 +1,206 @@
+"""Checks behaviour that is easy to break without noticing: search, editing and sync.
+
+Each check gets a fresh migrated copy of database.db in a temporary folder
+(the real database is never touched) and an app pointed at it, and fails with
+a message when the behaviour regresses. Deploys run it before uploading.
+
+    python benchmarks/checks.py            # exit 1 if a check fails
+    python benchmarks/checks.py --database path/to/database.db
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import traceback
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import auth  # noqa: E402
+import migrations  # noqa: E402
+import registrations  # noqa: E402
+
+
+class CheckFailed(Exception):
+    pass
+
+
+def expect(condition, message):
+    if not condition:
+        raise CheckFailed(message)
+
+
+def app_config(workdir, database):
+    return {
+        'DATABASE': database,
+        'UPLOAD_FOLDER': os.path.join(workdir, 'uploads'),
+        'PAGE_CACHE_DIR': os.path.join(workdir, 'pages'),
+        'DATA_VERSION_DIR': os.path.join(workdir, 'versions'),
+        'EXPORT_FOLDER': os.path.join(workdir, 'exports'),
+        'METRICS_DIR': os.path.join(workdir, 'metrics'),
+        'PROFILE_DIR': os.path.join(workdir, 'profiles'),
+        'TEMPLATE_CACHE_DIR': os.path.join(workdir, 'templates'),
+        'BACKUP_FOLDER': os.path.join(workdir, 'backups'),
+        'BACKUP_INTERVAL': None,
+        # Every check migrates its own copy, which hashes the passwords anew
+        'AUTH_CACHE_TTL': 0,
+    }
+
+
+def admin_client(workdir, database):
+    """Starts the app on ``database`` and returns a test client logged in as the first user."""
+    from app import create_app
+
+    app = create_app(app_config(workdir, database))
+    connection = sqlite3.connect(database)
+    connection.row_factory = sqlite3.Row
+    admin = connection.execute('SELECT id, username, password FROM users ORDER BY id LIMIT 1').fetchone()
+    connection.close()
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = admin['id']
+        session['username'] = admin['username']
+        session['auth'] = auth.session_stamp(admin['password'])
+    return client
+
+
+# --- Checks: each takes (workdir, database) ---
+
+def bengali_notice_search(workdir, database):
+    """Bengali words are indexed whole, also after an index built by an older tokenizer is rebuilt."""
+    connection = sqlite3.connect(database)
+    # The tokenizer the index used to have, which cut Bengali words at their vowel signs
+    connection.execute('DROP TABLE notices_fts')
+    connection.execute('''
+        CREATE VIRTUAL TABLE notices_fts USING fts5(title, summary, body, tokenize = 'unicode61 remove_diacritics 2')
+    ''')
+    connection.execute(
+        'INSERT INTO notices (title, filename, summary) VALUES (?, ?, ?)',
+        ('জরুরী নিয়োগ বিজ্ঞপ্তি', 'bengali-check.pdf', 'মোট ১২টি পদ')
+    )
+    connection.commit()
+    connection.close()
+
+    client = admin_client(workdir, database)  # rebuilds the stale index at startup
+
+    def titles(query):
+        return [result['title'] for result in client.get('/notices/search', query_string={'q': query}).get_json()['results']]
+
+    expect('জরুরী নিয়োগ বিজ্ঞপ্তি' in titles('নিয়োগ'), 'searching নিয়োগ does not find the notice')
+    expect('জরুরী নিয়োগ বিজ্ঞপ্তি' in titles('মোট'), 'searching মোট does not find the notice')
+    # Shares the letters ম and ট with মোট, but not the word
+    expect('জরুরী নিয়োগ বিজ্ঞপ্তি' not in titles('মেটা'), 'searching মেটা finds the notice that only says মোট')
+    results = client.get('/notices/search', query_string={'q': 'মোট'}).get_json()['results']
+    snippet = next(result['snippet_html'] for result in results if result['title'] == 'জরুরী নিয়োগ বিজ্ঞপ্তি')
+    expect('<mark>মোট</mark>' in snippet, f'snippet does not highlight the whole word: {snippet}')
+
+
+def flashes(client):
+    with client.session_transaction() as session:
+        return [message for _, message in session.pop('_flashes', [])]
+
+
+def edit_legacy_mobile(workdir, database):
+    """Registrations whose stored number is not a valid mobile number can be edited if it is left alone."""
+    client = admin_client(workdir, database)
+    connection = sqlite3.connect(database)
+    connection.row_factory = sqlite3.Row
+    legacy = [
+        row for row in connection.execute('SELECT * FROM event_registrations')
+        if registrations.normalize_mobile(row['mobile_number']) is None
+    ]
+    expect(legacy, 'database.db has no registration with a legacy mobile number to edit')
+
+    for row in legacy:
+        form = {
+            'full_name': row['full_name'] + ' (edited)',
+            'mobile_number': row['mobile_number'],
+            'address': row['address'] or '',
+            'reference': row['reference'] or '',
+            'voucher_number': row['voucher_number'] or '',
+        }
+        if row['is_approved']:
+            form['is_approved'] = 'on'
+        client.post(f"/admin/edit_registration/{row['id']}", data=form)
+        messages = flashes(client)
+        expect(messages == ['Registration updated successfully!'], f"editing registration {row['id']}: {messages}")
+        saved = connection.execute(
+            'SELECT full_name, mobile_number FROM event_registrations WHERE id = ?', (row['id'],)
+        ).fetchone()
+        expect(tuple(saved) == (form['full_name'], row['mobile_number']), f"registration {row['id']} saved as {tuple(saved)}")
+
+    # A number the admin changes is still validated
+    row = legacy[0]
+    client.post(f"/admin/edit_registration/{row['id']}", data={
+        'full_name': row['full_name'], 'mobile_number': '12345', 'voucher_number': '',
+    })
+    messages = flashes(client)
+    expect(messages == ['Please enter a valid mobile number.'], f'changing to an invalid number: {messages}')
+    connection.close()
+
+
+def registration_changes(workdir, database):
+    """The change feed sends only what changed after ``since``, and only a cursor when it cannot."""
+    client = admin_client(workdir, database)
+    cursor = client.get('/admin/api/registrations/page').get_json()['cursor']
+
+    for since in (None, cursor + 1000):
+        data = client.get('/admin/api/registrations', query_string={'since': since}).get_json()
+        expect(data == {'reset': True, 'cursor': cursor}, f'since={since} answers {sorted(data)}')
+
+    data = client.get('/admin/api/registrations', query_string={'since': cursor}).get_json()
+    expect(data == {'registrations': [], 'deleted': [], 'cursor': cursor, 'reset': False},
+           f'nothing changed but since={cursor} answers {data}')
+
+    connection = sqlite3.connect(database)
+    registration_id, = connection.execute('SELECT id FROM event_registrations ORDER BY id LIMIT 1').fetchone()
+    connection.execute('UPDATE event_registrations SET full_name = ? WHERE id = ?', ('Changed', registration_id))
+    connection.commit()
+    connection.close()
+    data = client.get('/admin/api/registrations', query_string={'since': cursor}).get_json()
+    expect([registration['full_name'] for registration in data['registrations']] == ['Changed'],
+           f'after one edit since={cursor} answers {data}')
+    expect(data['cursor'] > cursor and not data['reset'], f"the cursor did not move on: {data['cursor']}")
+
+
+CHECKS = [
+    ('Bengali notice search', bengali_notice_search),
+    ('edit a registration with a legacy mobile number', edit_legacy_mobile),
+    ('registration change feed', registration_changes),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database', default=os.path.join(ROOT, 'database.db'))
+    args = parser.parse_args()
+
+    failures = 0
+    for name, check in CHECKS:
+        workdir = tempfile.mkdtemp(prefix='checks-')
+        try:
+            database = os.path.join(workdir, 'database.db')
+            shutil.copy(args.database, database)
+            connection = sqlite3.connect(database)
+            migrations.migrate(connection)
+            connection.close()
+            check(workdir, database)
+            print(f'ok   {name}')
+        except CheckFailed as failure:
+            failures += 1
+            print(f'FAIL {name}: {failure}')
+        except Exception:
+            failures += 1
+            print(f'FAIL {name}: error')
+            traceback.print_exc()
+        finally:
+            shutil.rmtree(workdir)
+
+    if failures:
+        sys.exit(f'{failures} check(s) failed')
+
+
+if __name__ == '__main__':
+    main()
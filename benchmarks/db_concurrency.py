@@ -0,0 +1,144 @@
+"""Registration inserts per second with several worker processes writing at once.
+
+Simulates Passenger workers taking registrations (look up the mobile number,
+insert, commit) while other workers serve public pages (read queries). Each
+mode runs against its own temporary copy of database.db:
+
+    baseline  a new connection per request with sqlite3 defaults (rollback journal)
+    pooled    connections from sqlite_pool with the app's SQLITE_* settings (WAL)
+
+    python benchmarks/db_concurrency.py
+    python benchmarks/db_concurrency.py --writers 8 --readers 4 --seconds 10 --json db.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import sqlite_pool  # noqa: E402
+
+READ_QUERY = 'SELECT id, title, filename, summary, timestamp FROM notices ORDER BY timestamp DESC'
+
+
+def open_connection(mode, database, pool):
+    if mode == 'pooled':
+        return pool.acquire()
+    connection = sqlite3.connect(database)
+    connection.row_factory = sqlite3.Row
+    return connection
+
+
+def close_connection(mode, connection, pool):
+    if mode == 'pooled':
+        pool.release(connection)
+    else:
+        connection.close()
+
+
+def worker(mode, role, database, seconds, worker_id, start_at):
+    """Runs one simulated Passenger worker; returns its counts and latencies."""
+    pool = sqlite_pool.ConnectionPool(database) if mode == 'pooled' else None
+    latencies = []
+    errors = 0
+    sequence = 0
+    while time.time() < start_at:
+        time.sleep(0.001)
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        connection = open_connection(mode, database, pool)
+        try:
+            if role == 'writer':
+                sequence += 1
+                mobile = f'019{worker_id:02d}{sequence:06d}'
+                existing = connection.execute(
+                    'SELECT id FROM event_registrations WHERE mobile_number = ?', (mobile,)
+                ).fetchone()
+                if existing is None:
+                    connection.execute(
+                        'INSERT INTO event_registrations (full_name, address, mobile_number, reference) VALUES (?, ?, ?, ?)',
+                        (f'Load Test {worker_id}-{sequence}', 'Dhaka', mobile, 'benchmark')
+                    )
+                    connection.commit()
+            else:
+                connection.execute(READ_QUERY).fetchall()
+        except sqlite3.OperationalError:
+            errors += 1
+            if connection.in_transaction:
+                connection.rollback()
+        else:
+            latencies.append(time.perf_counter() - started)
+        finally:
+            close_connection(mode, connection, pool)
+    return {'role': role, 'ok': len(latencies), 'errors': errors, 'latencies': latencies}
+
+
+def run_mode(mode, writers, readers, seconds):
+    workdir = tempfile.mkdtemp(prefix='db-bench-')
+    try:
+        database = os.path.join(workdir, 'database.db')
+        shutil.copy(os.path.join(ROOT, 'database.db'), database)
+        setup = sqlite3.connect(database)
+        setup.execute('PRAGMA journal_mode = DELETE' if mode == 'baseline' else 'PRAGMA journal_mode = WAL')
+        setup.close()
+
+        start_at = time.time() + 1.0
+        jobs = [(mode, 'writer', database, seconds, i, start_at) for i in range(writers)]
+        jobs += [(mode, 'reader', database, seconds, writers + i, start_at) for i in range(readers)]
+        context = multiprocessing.get_context('spawn')
+        with context.Pool(len(jobs)) as pool:
+            results = pool.starmap(worker, jobs)
+    finally:
+        shutil.rmtree(workdir)
+
+    summary = {}
+    for role in ('writer', 'reader'):
+        role_results = [result for result in results if result['role'] == role]
+        if not role_results:
+            continue
+        latencies = sorted(latency for result in role_results for latency in result['latencies'])
+        summary[role] = {
+            'per_second': sum(result['ok'] for result in role_results) / seconds,
+            'errors': sum(result['errors'] for result in role_results),
+            'p50_ms': statistics.median(latencies) * 1000 if latencies else None,
+            'p95_ms': latencies[int(len(latencies) * 0.95)] * 1000 if latencies else None,
+        }
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--writers', type=int, default=4, help='processes submitting registrations (default 4)')
+    parser.add_argument('--readers', type=int, default=2, help='processes reading public data (default 2)')
+    parser.add_argument('--seconds', type=float, default=5, help='duration of each mode (default 5)')
+    parser.add_argument('--mode', choices=['baseline', 'pooled'], action='append', help='only run these modes')
+    parser.add_argument('--json', metavar='PATH', help='also write the results to PATH')
+    args = parser.parse_args()
+
+    results = {mode: run_mode(mode, args.writers, args.readers, args.seconds)
+               for mode in args.mode or ['baseline', 'pooled']}
+
+    print(f"{'mode':<10} {'role':<7} {'ops/s':>9} {'errors':>7} {'p50 ms':>8} {'p95 ms':>8}")
+    for mode, summary in results.items():
+        for role, stats in summary.items():
+            p50 = f"{stats['p50_ms']:.2f}" if stats['p50_ms'] is not None else '-'
+            p95 = f"{stats['p95_ms']:.2f}" if stats['p95_ms'] is not None else '-'
+            print(f"{mode:<10} {role:<7} {stats['per_second']:>9.1f} {stats['errors']:>7} {p50:>8} {p95:>8}")
+
+    if args.json:
+        with open(args.json, 'w') as output:
+            json.dump({'writers': args.writers, 'readers': args.readers, 'seconds': args.seconds,
+                       'results': results}, output, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""Checks that the app's hot queries are served by indexes.
+
+Applies the migrations to a temporary copy of database.db, runs EXPLAIN QUERY
+PLAN on each query below and fails if a plan scans a whole table, sorts
+through a temporary B-tree or does not use the expected index. Keep the
+queries in step with app.py when changing them.
+
+    python benchmarks/query_plans.py            # print the plans, exit 1 on a regression
+    python benchmarks/query_plans.py --database path/to/database.db
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import migrations  # noqa: E402
+
+# (name, query, parameters, index the plan must mention)
+QUERIES = [
+    ('registration by mobile',
+     'SELECT id FROM event_registrations WHERE mobile_number = ?',
+     ('01700000000',), 'idx_event_registrations_mobile'),
+    ('voucher check on edit',
+     'SELECT id FROM event_registrations WHERE voucher_number = ? AND id != ?',
+     ('V1', 1), 'sqlite_autoindex_event_registrations_1'),
+    ('registrations page',
+     'SELECT * FROM event_registrations ORDER BY registration_date DESC, id DESC LIMIT ?',
+     (51,), 'idx_event_registrations_date'),
+    ('registrations page by status',
+     'SELECT * FROM event_registrations WHERE is_approved = ? ORDER BY registration_date DESC, id DESC LIMIT ?',
+     (0, 51), 'idx_event_registrations_status_date'),
+    ('registrations page by mobile prefix',
+     'SELECT * FROM event_registrations WHERE mobile_number >= ? AND mobile_number < ? LIMIT ?',
+     ('017', '018', 51), 'idx_event_registrations_mobile'),
+    ('public notices',
+     '''SELECT n.id, n.title, n.filename, n.summary, n.timestamp, d.page_count, d.thumbnail
+        FROM notices n LEFT JOIN upload_documents d ON d.filename = n.filename
+        ORDER BY n.timestamp DESC''',
+     (), 'idx_notices_timestamp'),
+    ('admin notices',
+     'SELECT id, title, filename, summary, timestamp FROM notices ORDER BY timestamp DESC',
+     (), 'idx_notices_timestamp'),
+    ('public gallery',
+     'SELECT id, title, filename FROM gallery WHERE is_active = 1 ORDER BY sort_order ASC, timestamp DESC',
+     (), 'COVERING INDEX idx_gallery_active_order'),
+    ('admin gallery',
+     'SELECT id, title, filename, is_active, sort_order, timestamp FROM gallery ORDER BY sort_order ASC, timestamp DESC',
+     (), 'idx_gallery_order'),
+    ('notice refcount trigger',
+     'SELECT COUNT(*) FROM notices WHERE filename = ?',
+     ('a.pdf',), 'idx_notices_filename'),
+    ('gallery refcount',
+     'SELECT COUNT(*) FROM gallery WHERE filename = ?',
+     ('a.png',), 'idx_gallery_filename'),
+    ('analytics days',
+     '''SELECT day, registered, approved, with_voucher, approvals
+        FROM registration_daily WHERE day >= ? AND day <= ? ORDER BY day''',
+     ('2024-01-01', '2024-01-30'), 'PRIMARY KEY'),
+    ('analytics top references',
+     '''SELECT reference, registrations, approved FROM registration_references
+        ORDER BY registrations DESC, reference LIMIT ?''',
+     (10,), 'idx_registration_references_count'),
+]
+
+
+def plan_problems(plan, expected_index):
+    """Returns what is wrong with a plan (list of EXPLAIN QUERY PLAN details)."""
+    problems = []
+    for detail in plan:
+        if detail.startswith('SCAN') and 'INDEX' not in detail and 'VIRTUAL TABLE' not in detail:
+            problems.append(f'full table scan: {detail}')
+        if 'TEMP B-TREE' in detail:
+            problems.append(f'sort without an index: {detail}')
+    if expected_index and not any(expected_index in detail for detail in plan):
+        problems.append(f'does not use {expected_index}')
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database', default=os.path.join(ROOT, 'database.db'))
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='query-plans-')
+    try:
+        database = os.path.join(workdir, 'database.db')
+        shutil.copy(args.database, database)
+        connection = sqlite3.connect(database)
+        migrations.migrate(connection)
+
+        failures = 0
+        for name, query, parameters, expected_index in QUERIES:
+            plan = [row[3] for row in connection.execute(f'EXPLAIN QUERY PLAN {query}', parameters)]
+            problems = plan_problems(plan, expected_index)
+            failures += bool(problems)
+            print(f"{'FAIL' if problems else 'ok':<5}{name}")
+            for detail in plan:
+                print(f'       {detail}')
+            for problem in problems:
+                print(f'     ! {problem}')
+        connection.close()
+    finally:
+        shutil.rmtree(workdir)
+
+    if failures:
+        sys.exit(f'{failures} query plan(s) regressed')
+
+
+if __name__ == '__main__':
+    main()
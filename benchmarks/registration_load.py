@@ -0,0 +1,180 @@
+"""Load test of the event registration form: sustained submissions per second, zero duplicates.
+
+Starts several worker processes (like Passenger's), each with the app on a
+temporary copy of database.db and several client threads posting the
+registration form through the test client. Every mobile number is submitted
+--repeat times in different spellings (01..., +880 1...-..., 880..., Bengali
+digits) by different clients at about the same time, so exactly one of them
+must get in. Runs once committing each registration on its own and once with
+REGISTRATION_GROUP_COMMIT, then checks the database: one row per number,
+no duplicates, nothing lost. Exits 1 if that check fails.
+
+    python benchmarks/registration_load.py
+    python benchmarks/registration_load.py --workers 4 --threads 8 --numbers 2000 --json load.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Numbers in a range real registrations do not use (operator digit 3); cleared
+# from the copy before each run
+NUMBER_PREFIX = '0133'
+REFERENCE = 'load-test'
+BENGALI_DIGITS = str.maketrans('0123456789', '০১২৩৪৫৬৭৮৯')
+
+
+def spellings(number):
+    local = number[1:]
+    return [
+        number,
+        f'+880 {local[:4]}-{local[4:]}',
+        f'880{local}',
+        number.translate(BENGALI_DIGITS),
+    ]
+
+
+def submissions(numbers, repeat, seed=1):
+    """Every number `repeat` times in varying spellings, shuffled so copies land on different clients."""
+    items = []
+    for i in range(numbers):
+        number = f'{NUMBER_PREFIX}{i:07d}'
+        variants = spellings(number)
+        items.extend((number, variants[copy % len(variants)]) for copy in range(repeat))
+    random.Random(seed).shuffle(items)
+    return items
+
+
+def worker(workdir, group_commit, synchronous, items, threads, start_at):
+    """One simulated Passenger worker; returns its clients' results."""
+    os.chdir(ROOT)
+    from app import create_app
+
+    app = create_app({
+        'DATABASE': os.path.join(workdir, 'database.db'),
+        'UPLOAD_FOLDER': os.path.join(workdir, 'uploads'),
+        'PAGE_CACHE_DIR': os.path.join(workdir, 'pages'),
+        'DATA_VERSION_DIR': os.path.join(workdir, 'versions'),
+        'REGISTRATION_GROUP_COMMIT': group_commit,
+        'SQLITE_SYNCHRONOUS': synchronous,
+    })
+    results = {'registered': 0, 'duplicate': 0, 'error': 0, 'latencies': []}
+    lock = threading.Lock()
+
+    def client(share):
+        test_client = app.test_client()
+        outcome = {'registered': 0, 'duplicate': 0, 'error': 0, 'latencies': []}
+        while time.time() < start_at:
+            time.sleep(0.001)
+        for _, spelling in share:
+            started = time.perf_counter()
+            response = test_client.post('/event-registration', data={
+                'full_name': 'Load Test', 'address': 'Dhaka', 'mobile_number': spelling, 'reference': REFERENCE,
+            })
+            outcome['latencies'].append(time.perf_counter() - started)
+            if response.status_code == 302:
+                outcome['registered'] += 1
+            elif b'already registered' in response.data:
+                outcome['duplicate'] += 1
+            else:
+                outcome['error'] += 1
+        with lock:
+            for key in ('registered', 'duplicate', 'error'):
+                results[key] += outcome[key]
+            results['latencies'].extend(outcome['latencies'])
+
+    client_threads = [threading.Thread(target=client, args=(items[i::threads],)) for i in range(threads)]
+    for thread in client_threads:
+        thread.start()
+    for thread in client_threads:
+        thread.join()
+    results['finished_at'] = time.time()
+    return results
+
+
+def run_mode(group_commit, synchronous, workers, threads, numbers, repeat):
+    workdir = tempfile.mkdtemp(prefix='registration-load-')
+    try:
+        database = os.path.join(workdir, 'database.db')
+        shutil.copy(os.path.join(ROOT, 'database.db'), database)
+        connection = sqlite3.connect(database)
+        connection.execute('DELETE FROM event_registrations WHERE mobile_number >= ? AND mobile_number < ?',
+                           (NUMBER_PREFIX, NUMBER_PREFIX[:-1] + chr(ord(NUMBER_PREFIX[-1]) + 1)))
+        connection.commit()
+        connection.close()
+
+        items = submissions(numbers, repeat)
+        start_at = time.time() + 3.0
+        jobs = [(workdir, group_commit, synchronous, items[i::workers], threads, start_at) for i in range(workers)]
+        with multiprocessing.get_context('spawn').Pool(workers) as pool:
+            results = pool.starmap(worker, jobs)
+        elapsed = max(result['finished_at'] for result in results) - start_at
+
+        connection = sqlite3.connect(database)
+        rows, distinct = connection.execute(
+            'SELECT COUNT(*), COUNT(DISTINCT mobile_number) FROM event_registrations WHERE reference = ?', (REFERENCE,)
+        ).fetchone()
+        connection.close()
+    finally:
+        shutil.rmtree(workdir)
+
+    latencies = sorted(latency for result in results for latency in result['latencies'])
+    return {
+        'submissions': len(latencies),
+        'per_second': len(latencies) / elapsed,
+        'registered': sum(result['registered'] for result in results),
+        'duplicate': sum(result['duplicate'] for result in results),
+        'error': sum(result['error'] for result in results),
+        'p50_ms': statistics.median(latencies) * 1000,
+        'p95_ms': latencies[int(len(latencies) * 0.95)] * 1000,
+        'rows': rows,
+        'duplicate_rows': rows - distinct,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=4, help='worker processes (default 4)')
+    parser.add_argument('--threads', type=int, default=4, help='client threads per worker (default 4)')
+    parser.add_argument('--numbers', type=int, default=1000, help='distinct mobile numbers (default 1000)')
+    parser.add_argument('--repeat', type=int, default=2, help='submissions per number (default 2)')
+    parser.add_argument('--synchronous', default='NORMAL', choices=['OFF', 'NORMAL', 'FULL'],
+                        help='SQLITE_SYNCHRONOUS for the run (default NORMAL, as in app.py)')
+    parser.add_argument('--mode', choices=['direct', 'group'], action='append', help='only run these modes')
+    parser.add_argument('--json', metavar='PATH', help='also write the results to PATH')
+    args = parser.parse_args()
+
+    results = {mode: run_mode(mode == 'group', args.synchronous, args.workers, args.threads, args.numbers, args.repeat)
+               for mode in args.mode or ['direct', 'group']}
+
+    print(f"{'mode':<7} {'subm/s':>8} {'registered':>10} {'duplicate':>9} {'errors':>6} "
+          f"{'p50 ms':>7} {'p95 ms':>7} {'rows':>6} {'dup rows':>8}")
+    failed = False
+    for mode, stats in results.items():
+        print(f"{mode:<7} {stats['per_second']:>8.1f} {stats['registered']:>10} {stats['duplicate']:>9} "
+              f"{stats['error']:>6} {stats['p50_ms']:>7.2f} {stats['p95_ms']:>7.2f} {stats['rows']:>6} "
+              f"{stats['duplicate_rows']:>8}")
+        failed |= bool(stats['duplicate_rows'] or stats['error']
+                   or stats['registered'] != args.numbers or stats['rows'] != args.numbers)
+
+    if args.json:
+        with open(args.json, 'w') as output:
+            json.dump({'synchronous': args.synchronous, 'workers': args.workers, 'threads': args.threads, 'numbers': args.numbers,
+                       'repeat': args.repeat, 'results': results}, output, indent=2)
+    if failed:
+        sys.exit('Registrations were lost, duplicated or failed')
+
+
+if __name__ == '__main__':
+    main()
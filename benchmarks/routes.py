@@ -0,0 +1,408 @@
+"""Throughput, p50/p99 latency and peak RSS of the hot routes, saved as a JSON baseline.
+
+Seeds a temporary database (see seed.py) and measures each route below twice:
+
+  client   the Flask test client in a fresh process per route, one request at
+           a time. Shows what the route itself costs; peak RSS is that process's.
+  server   --workers processes (like Passenger's) serving one listening socket
+           with werkzeug, driven over HTTP by --threads client threads. Peak
+           RSS is the largest worker's high-water mark while the route ran
+           (reset before each route, so it starts from what earlier routes
+           left allocated).
+
+Each route runs for --duration seconds (at least --min-requests requests).
+Admin routes are requested logged in. Registrations are posted with fresh
+mobile numbers, so every POST is a real insert. home and notices are served
+from the page cache after the warm-up request, as in production.
+
+    python benchmarks/routes.py --json before.json
+    git checkout other-branch
+    python benchmarks/routes.py --json after.json --baseline before.json
+    python benchmarks/routes.py --compare before.json after.json   # exit 1 on a regression
+"""
+import argparse
+import http.client
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from urllib.parse import urlencode
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import seed  # noqa: E402
+
+# (endpoint, method, path, needs admin login, expected status)
+ROUTES = [
+    ('home', 'GET', '/', False, 200),
+    ('notices', 'GET', '/notices', False, 200),
+    ('admin_dashboard', 'GET', '/admin/dashboard', True, 200),
+    ('api_get_registrations', 'GET', '/admin/api/registrations', True, 200),
+    ('export_excel', 'GET', '/admin/export/excel', True, 200),
+    ('export_pdf', 'GET', '/admin/export/pdf', True, 200),
+    ('event_registration', 'POST', '/event-registration', False, 302),
+]
+ADMIN = {'username': 'admin', 'password': 'password'}
+# Posted numbers use operator digit 3; that range is cleared from the seeded copy
+NUMBER_PREFIX = '0133'
+# Metrics compared by --compare/--baseline: (key, label, True if higher is better)
+COMPARED = [
+    ('per_second', 'req/s', True),
+    ('p50_ms', 'p50 ms', False),
+    ('p99_ms', 'p99 ms', False),
+    ('peak_rss_mb', 'RSS MB', False),
+]
+
+
+def app_config(workdir):
+    return {
+        'DATABASE': os.path.join(workdir, 'database.db'),
+        'PAGE_CACHE_DIR': os.path.join(workdir, 'pages'),
+        'DATA_VERSION_DIR': os.path.join(workdir, 'versions'),
+        'EXPORT_FOLDER': os.path.join(workdir, 'exports'),
+        'METRICS_DIR': os.path.join(workdir, 'metrics'),
+        'PROFILE_DIR': os.path.join(workdir, 'profiles'),
+        'BACKUP_FOLDER': os.path.join(workdir, 'backups'),
+        'BACKUP_INTERVAL': None,
+    }
+
+
+def registration_form(numbers):
+    return {'full_name': 'Benchmark', 'address': 'Dhaka', 'mobile_number': f'{NUMBER_PREFIX}{next(numbers):07d}',
+            'reference': 'benchmark'}
+
+
+def percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def summarize(latencies, errors, elapsed, peak_rss_kb, **extra):
+    ordered = sorted(latencies)
+    return {
+        'requests': len(ordered),
+        'errors': errors,
+        'per_second': len(ordered) / elapsed,
+        'p50_ms': percentile(ordered, 0.50) * 1000,
+        'p99_ms': percentile(ordered, 0.99) * 1000,
+        'peak_rss_mb': peak_rss_kb / 1024,
+        **extra,
+    }
+
+
+def max_rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+# --- client: the test client, one process per route ---
+
+def client_route(workdir, route, duration, min_requests):
+    os.chdir(ROOT)
+    from app import create_app
+
+    app = create_app(app_config(workdir))
+    endpoint, method, path, admin, expected = route
+    client = app.test_client()
+    if admin:
+        client.post('/admin/login', data=ADMIN)
+    numbers = itertools.count(int(time.time() * 1000) % 10 ** 6 * 10)
+    base_rss_kb = max_rss_kb()
+
+    def request():
+        if method == 'POST':
+            return client.post(path, data=registration_form(numbers))
+        return client.get(path)
+
+    request()  # warm up imports and caches
+    latencies, errors = [], 0
+    started = time.perf_counter()
+    while time.perf_counter() - started < duration or len(latencies) < min_requests:
+        began = time.perf_counter()
+        response = request()
+        response.get_data()
+        latencies.append(time.perf_counter() - began)
+        errors += response.status_code != expected
+    elapsed = time.perf_counter() - started
+    return summarize(latencies, errors, elapsed, max_rss_kb(), base_rss_mb=base_rss_kb / 1024)
+
+
+def run_client(workdir, routes, duration, min_requests):
+    results = {}
+    context = multiprocessing.get_context('spawn')
+    for route in routes:
+        with context.Pool(1) as pool:
+            results[route[0]] = pool.apply(client_route, (workdir, route, duration, min_requests))
+        print(f'  client {route[0]}: {results[route[0]]["per_second"]:.1f} req/s', file=sys.stderr)
+    return results
+
+
+# --- server: werkzeug workers sharing a socket, driven over HTTP ---
+
+def serve(fd):
+    """Worker process entry point (see --serve-fd); settings come from FLASK_* variables."""
+    os.chdir(ROOT)
+    import logging
+    from werkzeug.serving import make_server
+    from app import create_app
+
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', 0, create_app(), fd=fd)
+    server.serve_forever()
+
+
+def read_status(pid, field):
+    with open(f'/proc/{pid}/status') as status:
+        for line in status:
+            if line.startswith(field + ':'):
+                return int(line.split()[1])
+    return 0
+
+
+def reset_peak_rss(pid):
+    """Resets VmHWM to the current RSS (Linux 4.0+); returns False where not allowed."""
+    try:
+        with open(f'/proc/{pid}/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def http_request(port, method, path, cookie=None, form=None):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+    try:
+        headers = {'Cookie': cookie} if cookie else {}
+        body = None
+        if form is not None:
+            body = urlencode(form)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        connection.request(method, path, body=body, headers=headers)
+        response = connection.getresponse()
+        response.read()
+        return response
+    finally:
+        connection.close()
+
+
+def wait_for_server(port, timeout=30):
+    deadline = time.time() + timeout
+    while True:
+        try:
+            return http_request(port, 'GET', '/robots.txt')
+        except OSError:
+            if time.time() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+def run_server(workdir, routes, duration, min_requests, workers, threads):
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(128)
+    port = listener.getsockname()[1]
+    env = dict(os.environ, **{f'FLASK_{key}': json.dumps(value) for key, value in app_config(workdir).items()})
+    processes = [
+        subprocess.Popen([sys.executable, os.path.abspath(__file__), '--serve-fd', str(listener.fileno())],
+                         pass_fds=[listener.fileno()], env=env)
+        for _ in range(workers)
+    ]
+    results = {}
+    try:
+        wait_for_server(port)
+        login = http_request(port, 'POST', '/admin/login', form=ADMIN)
+        cookie = login.getheader('Set-Cookie').split(';', 1)[0]
+        numbers = itertools.count(int(time.time() * 1000) % 10 ** 6 * 10)
+        numbers_lock = threading.Lock()
+
+        for endpoint, method, path, admin, expected in routes:
+            def request():
+                form = None
+                if method == 'POST':
+                    with numbers_lock:
+                        form = registration_form(numbers)
+                return http_request(port, method, path, cookie if admin else None, form)
+
+            for _ in range(workers):
+                request()  # warm up
+            resettable = all(reset_peak_rss(process.pid) for process in processes)
+            latencies, errors = [], [0]
+            lock = threading.Lock()
+            started = time.perf_counter()
+
+            def client():
+                while time.perf_counter() - started < duration or len(latencies) < min_requests:
+                    began = time.perf_counter()
+                    try:
+                        failed = request().status != expected
+                    except OSError:
+                        failed = True
+                    with lock:
+                        latencies.append(time.perf_counter() - began)
+                        errors[0] += failed
+
+            client_threads = [threading.Thread(target=client) for _ in range(threads)]
+            for thread in client_threads:
+                thread.start()
+            for thread in client_threads:
+                thread.join()
+            elapsed = time.perf_counter() - started
+            peak_rss_kb = max(read_status(process.pid, 'VmHWM') for process in processes)
+            results[endpoint] = summarize(latencies, errors[0], elapsed, peak_rss_kb,
+                                          rss_since_start=not resettable)
+            print(f'  server {endpoint}: {results[endpoint]["per_second"]:.1f} req/s', file=sys.stderr)
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+        listener.close()
+    return results
+
+
+# --- baselines ---
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old, new, threshold):
+    """Prints old vs new for every route in both; returns the regressions beyond threshold percent."""
+    regressions = []
+    print(f"{'':<7} {'route':<22} {'metric':<7} {'old':>10} {'new':>10} {'change':>8}")
+    for mode in ('client', 'server'):
+        for endpoint, stats in new['results'].get(mode, {}).items():
+            before = old['results'].get(mode, {}).get(endpoint)
+            if not before:
+                continue
+            for key, label, higher_is_better in COMPARED:
+                if not before.get(key):
+                    continue
+                change = (stats[key] - before[key]) / before[key] * 100
+                worse = -change if higher_is_better else change
+                flag = ''
+                if worse > threshold:
+                    flag = ' !'
+                    regressions.append(f'{mode} {endpoint} {label} {change:+.1f}%')
+                print(f'{mode:<7} {endpoint:<22} {label:<7} {before[key]:>10.2f} {stats[key]:>10.2f} '
+                      f'{change:>+7.1f}%{flag}')
+    return regressions
+
+
+def print_results(results):
+    print(f"{'':<7} {'route':<22} {'requests':>8} {'errors':>6} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} "
+          f"{'RSS MB':>7}")
+    for mode, routes in results.items():
+        for endpoint, stats in routes.items():
+            print(f"{mode:<7} {endpoint:<22} {stats['requests']:>8} {stats['errors']:>6} {stats['per_second']:>8.1f} "
+                  f"{stats['p50_ms']:>8.2f} {stats['p99_ms']:>8.2f} {stats['peak_rss_mb']:>7.1f}")
+
+
+def load(path):
+    with open(path) as baseline:
+        return json.load(baseline)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database', help='run against a copy of this database (e.g. from seed.py) instead of '
+                                           'seeding one')
+    parser.add_argument('--registrations', type=int, default=5000, help='registrations to seed (default 5000)')
+    parser.add_argument('--notices', type=int, default=100, help='notices to seed (default 100)')
+    parser.add_argument('--gallery', type=int, default=20, help='gallery images to seed (default 20)')
+    parser.add_argument('--seed', type=int, default=1, help='random seed for the data (default 1)')
+    parser.add_argument('--mode', choices=['client', 'server'], action='append', help='only run these modes')
+    parser.add_argument('--route', choices=[route[0] for route in ROUTES], action='append',
+                        help='only measure these routes')
+    parser.add_argument('--duration', type=float, default=3.0, help='seconds per route (default 3)')
+    parser.add_argument('--min-requests', type=int, default=5, help='requests per route at least (default 5)')
+    parser.add_argument('--workers', type=int, default=4, help='server worker processes (default 4)')
+    parser.add_argument('--threads', type=int, default=8, help='server client threads (default 8)')
+    parser.add_argument('--json', metavar='PATH', help='write the results to PATH')
+    parser.add_argument('--baseline', metavar='PATH', help='compare the results with an earlier --json file')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='only compare two --json files')
+    parser.add_argument('--threshold', type=float, default=10.0,
+                        help='percent worse that counts as a regression (default 10)')
+    parser.add_argument('--serve-fd', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve_fd is not None:
+        return serve(args.serve_fd)
+    if args.compare:
+        regressions = compare(load(args.compare[0]), load(args.compare[1]), args.threshold)
+        if regressions:
+            sys.exit('Regressions: ' + ', '.join(regressions))
+        return
+
+    routes = [route for route in ROUTES if not args.route or route[0] in args.route]
+    workdir = tempfile.mkdtemp(prefix='route-benchmark-')
+    try:
+        database = os.path.join(workdir, 'database.db')
+        if args.database:
+            shutil.copy(args.database, database)
+        else:
+            seed.build(database, args.registrations, args.notices, args.gallery, seed_value=args.seed)
+        connection = sqlite3.connect(database)
+        connection.execute('DELETE FROM event_registrations WHERE mobile_number >= ? AND mobile_number < ?',
+                           (NUMBER_PREFIX, NUMBER_PREFIX[:-1] + chr(ord(NUMBER_PREFIX[-1]) + 1)))
+        connection.commit()
+        volumes = {table: connection.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+                   for table in ('event_registrations', 'notices', 'gallery')}
+        connection.close()
+
+        results = {}
+        for mode in args.mode or ['client', 'server']:
+            # Every mode starts from the same data
+            shutil.copy(database, database + '.seeded')
+            if mode == 'client':
+                results[mode] = run_client(workdir, routes, args.duration, args.min_requests)
+            else:
+                results[mode] = run_server(workdir, routes, args.duration, args.min_requests, args.workers,
+                                           args.threads)
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(database + suffix):
+                    os.remove(database + suffix)
+            os.replace(database + '.seeded', database)
+    finally:
+        shutil.rmtree(workdir)
+
+    print_results(results)
+    report = {
+        'revision': git_revision(),
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'cpus': os.cpu_count(),
+        'volumes': volumes,
+        'settings': {'duration': args.duration, 'min_requests': args.min_requests, 'workers': args.workers,
+                     'threads': args.threads},
+        'results': results,
+    }
+    if args.json:
+        with open(args.json, 'w') as output:
+            json.dump(report, output, indent=2)
+    if args.baseline:
+        print()
+        regressions = compare(load(args.baseline), report, args.threshold)
+        if regressions:
+            print('Regressions: ' + ', '.join(regressions))
+
+
+if __name__ == '__main__':
+    main()
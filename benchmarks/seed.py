@@ -0,0 +1,146 @@
+"""Builds a database with synthetic registrations, notices and gallery rows for benchmarks.
+
+Starts from a copy of database.db (or an empty schema with --empty), applies
+the migrations and adds the requested number of rows. The same --seed always
+gives the same data, so runs on different commits are comparable. Notices and
+gallery rows reuse files already in the upload folder, so pages render real
+images and links.
+
+    python benchmarks/seed.py /tmp/bench.db
+    python benchmarks/seed.py /tmp/bench.db --registrations 50000 --notices 500 --gallery 40 --force
+"""
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import sys
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import migrations  # noqa: E402
+
+FIRST_NAMES = ['Abdul', 'Ayesha', 'Fatema', 'Habib', 'Jannat', 'Kamal', 'Mahmud', 'Nasrin', 'Rahim', 'Rafiq',
+               'Sadia', 'Shahid', 'Sultana', 'Tanvir', 'Yasmin', 'Zahid']
+LAST_NAMES = ['Ahmed', 'Akter', 'Begum', 'Chowdhury', 'Hasan', 'Hossain', 'Islam', 'Khan', 'Miah', 'Rahman',
+              'Sarkar', 'Uddin']
+PLACES = ['Agrabad, Chattogram', 'Dhanmondi, Dhaka', 'Gulshan, Dhaka', 'Mirpur, Dhaka', 'Uttara, Dhaka',
+          'Sylhet Sadar', 'Khulna', 'Rajshahi', 'Cumilla', 'Narayanganj']
+WORDS = ['annual', 'general', 'meeting', 'shareholders', 'dividend', 'notice', 'board', 'directors', 'resort',
+         'hospital', 'laboratory', 'tower', 'project', 'investment', 'report', 'schedule', 'holiday', 'office',
+         'recruitment', 'tender', 'members', 'agenda', 'approval', 'financial', 'statement', 'event']
+BASE_DATE = datetime(2025, 1, 1)
+
+
+def sentence(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words)).capitalize()
+
+
+def stored_files(upload_folder, extensions):
+    try:
+        names = sorted(os.listdir(upload_folder))
+    except FileNotFoundError:
+        return []
+    return [name for name in names if name.rsplit('.', 1)[-1].lower() in extensions]
+
+
+def seed(connection, rng, registrations, notices, gallery, upload_folder):
+    pdfs = stored_files(upload_folder, {'pdf'}) or ['benchmark-notice.pdf']
+    images = stored_files(upload_folder, {'jpg', 'jpeg', 'png', 'webp'}) or ['benchmark-image.png']
+    taken = {row[0] for row in connection.execute('SELECT mobile_number FROM event_registrations')}
+    used_vouchers = {row[0] for row in connection.execute(
+        'SELECT voucher_number FROM event_registrations WHERE voucher_number IS NOT NULL'
+    )}
+
+    rows = []
+    voucher = 0
+    while len(rows) < registrations:
+        mobile = f'01{rng.choice("3456789")}{rng.randrange(10 ** 8):08d}'
+        if mobile in taken:
+            continue
+        taken.add(mobile)
+        registered = BASE_DATE + timedelta(seconds=rng.randrange(180 * 24 * 3600))
+        voucher_number = approved_date = None
+        approved = 0
+        if rng.random() < 0.6:
+            voucher += 1
+            voucher_number = f'BEN{voucher:07d}'
+            while voucher_number in used_vouchers:
+                voucher += 1
+                voucher_number = f'BEN{voucher:07d}'
+            if rng.random() < 0.8:
+                approved = 1
+                approved_date = (registered + timedelta(hours=rng.randrange(1, 240))).strftime('%Y-%m-%d %H:%M:%S')
+        rows.append((
+            f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}', rng.choice(PLACES), mobile,
+            rng.choice(['', 'Facebook', 'Friend', 'Newspaper', 'Website']), voucher_number, approved,
+            registered.strftime('%Y-%m-%d %H:%M:%S'), approved_date,
+        ))
+    connection.executemany('''
+        INSERT INTO event_registrations
+            (full_name, address, mobile_number, reference, voucher_number, is_approved, registration_date, approved_date)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', rows)
+
+    connection.executemany('INSERT INTO notices (title, filename, summary, timestamp) VALUES (?, ?, ?, ?)', [
+        (sentence(rng, 5), rng.choice(pdfs), sentence(rng, 25),
+         (BASE_DATE + timedelta(days=rng.randrange(365))).strftime('%Y-%m-%d %H:%M:%S'))
+        for _ in range(notices)
+    ])
+    connection.executemany(
+        'INSERT INTO gallery (title, filename, is_active, sort_order, timestamp) VALUES (?, ?, ?, ?, ?)', [
+            (sentence(rng, 3), rng.choice(images), int(rng.random() < 0.8), rng.randrange(10),
+             (BASE_DATE + timedelta(days=rng.randrange(365))).strftime('%Y-%m-%d %H:%M:%S'))
+            for _ in range(gallery)
+        ])
+    connection.commit()
+
+
+def build(target, registrations, notices, gallery, seed_value=1, empty=False,
+          upload_folder=os.path.join(ROOT, 'static', 'uploads')):
+    """Creates ``target`` (replacing it) with the given volumes added; returns the row counts."""
+    if os.path.abspath(target) == os.path.join(ROOT, 'database.db'):
+        raise ValueError('Refusing to seed the real database.db; give another path')
+    if os.path.exists(target):
+        os.remove(target)
+    if not empty:
+        shutil.copy(os.path.join(ROOT, 'database.db'), target)
+
+    connection = sqlite3.connect(target)
+    try:
+        migrations.migrate(connection)
+        seed(connection, random.Random(seed_value), registrations, notices, gallery, upload_folder)
+        return {table: connection.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+                for table in ('event_registrations', 'notices', 'gallery')}
+    finally:
+        connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('database', help='database file to create')
+    parser.add_argument('--registrations', type=int, default=5000, help='event registrations to add (default 5000)')
+    parser.add_argument('--notices', type=int, default=100, help='notices to add (default 100)')
+    parser.add_argument('--gallery', type=int, default=20, help='gallery images to add (default 20)')
+    parser.add_argument('--seed', type=int, default=1, help='random seed (default 1)')
+    parser.add_argument('--empty', action='store_true', help='start from an empty schema instead of database.db')
+    parser.add_argument('--upload-folder', default=os.path.join(ROOT, 'static', 'uploads'),
+                        help='where to pick notice and gallery files from')
+    parser.add_argument('--force', action='store_true', help='overwrite the database file if it exists')
+    args = parser.parse_args()
+
+    if os.path.exists(args.database) and not args.force:
+        sys.exit(f'{args.database} exists; pass --force to replace it')
+    try:
+        counts = build(args.database, args.registrations, args.notices, args.gallery, seed_value=args.seed,
+                       empty=args.empty, upload_folder=args.upload_folder)
+    except ValueError as error:
+        sys.exit(str(error))
+    print(f"{args.database}: {counts['event_registrations']} registrations, "
+          f"{counts['notices']} notices, {counts['gallery']} gallery images")
+
+
+if __name__ == '__main__':
+    main()
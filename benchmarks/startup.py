@@ -0,0 +1,142 @@
+"""Measures worker cold start: import time, create_app() time, first requests and resident memory.
+
+Each run starts a fresh interpreter, the way Passenger starts a worker, against
+a temporary copy of database.db so the real database is never touched. After
+create_app() it times the worker's first request to home, notices and
+admin_dashboard, with the page cache off so every page is rendered. The
+template bytecode cache starts empty for each mode and is filled by its first
+run, as after a deploy; the medians show workers started after that.
+
+    python benchmarks/startup.py            # every mode below
+    python benchmarks/startup.py --runs 20 --json startup.json
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs inside the child interpreter; prints one JSON line
+CHILD = '''
+import json, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.create_app()
+created = time.perf_counter()
+
+import auth
+with app.app.app_context():
+    admin = app.get_db().execute("SELECT id, username, password FROM users WHERE username = 'admin'").fetchone()
+client = app.app.test_client()
+with client.session_transaction() as session:
+    session['user_id'] = admin['id']
+    session['username'] = admin['username']
+    session['auth'] = auth.session_stamp(admin['password'])
+first_request_ms = {}
+for endpoint, path in FIRST_REQUESTS:
+    began = time.perf_counter()
+    response = client.get(path)
+    first_request_ms[endpoint] = (time.perf_counter() - began) * 1000
+    assert response.status_code == 200, (path, response.status_code)
+
+def rss_mb():
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+print(json.dumps({
+    'import_ms': (imported - started) * 1000,
+    'create_app_ms': (created - imported) * 1000,
+    'first_request_ms': first_request_ms,
+    'rss_mb': rss_mb(),
+    'modules': len(sys.modules),
+    'heavy_modules': sorted(name for name in ('pandas', 'openpyxl', 'reportlab') if name in sys.modules),
+}))
+'''
+
+FIRST_REQUESTS = [('home', '/'), ('notices', '/notices'), ('admin_dashboard', '/admin/dashboard')]
+
+MODES = {
+    'default': {},
+    'no-template-cache': {'FLASK_TEMPLATE_CACHE_DIR': 'null'},
+    'preload-templates': {'FLASK_PRELOAD_TEMPLATES': 'true'},
+    'preload': {'FLASK_PRELOAD_EXPORTS': 'true'},
+}
+
+
+def run_once(workdir, extra_env):
+    env = dict(os.environ, **{
+        'FLASK_DATABASE': json.dumps(os.path.join(workdir, 'database.db')),
+        'FLASK_PAGE_CACHE_ENABLED': 'false',
+        'FLASK_TEMPLATE_CACHE_DIR': json.dumps(os.path.join(workdir, 'templates')),
+        'FLASK_METRICS_DIR': json.dumps(os.path.join(workdir, 'metrics')),
+        'FLASK_DATA_VERSION_DIR': json.dumps(os.path.join(workdir, 'versions')),
+        'FLASK_BACKUP_INTERVAL': 'null',
+        **extra_env,
+    })
+    code = f'FIRST_REQUESTS = {FIRST_REQUESTS!r}\n{CHILD}'
+    output = subprocess.run(
+        [sys.executable, '-c', code], cwd=ROOT, env=env, check=True, capture_output=True, text=True
+    ).stdout
+    # The worker may start the notice indexer, which prints to the same stdout
+    return json.loads(next(line for line in reversed(output.splitlines()) if line.startswith('{')))
+
+
+def summarize(samples):
+    result = {}
+    for key in ('import_ms', 'create_app_ms', 'rss_mb'):
+        values = [sample[key] for sample in samples]
+        result[key] = {'median': statistics.median(values), 'min': min(values), 'max': max(values)}
+    result['first_request_ms'] = {
+        endpoint: statistics.median(sample['first_request_ms'][endpoint] for sample in samples)
+        for endpoint, _ in FIRST_REQUESTS
+    }
+    result['modules'] = samples[-1]['modules']
+    result['heavy_modules'] = samples[-1]['heavy_modules']
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10, help='fresh interpreters per mode (default 10)')
+    parser.add_argument('--mode', choices=sorted(MODES), action='append', help='only run these modes')
+    parser.add_argument('--json', metavar='PATH', help='also write the results to PATH')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='startup-bench-')
+    try:
+        database = os.path.join(workdir, 'database.db')
+        shutil.copy(os.path.join(ROOT, 'database.db'), database)
+
+        results = {}
+        for mode in args.mode or list(MODES):
+            shutil.rmtree(os.path.join(workdir, 'templates'), ignore_errors=True)
+            samples = [run_once(workdir, MODES[mode]) for _ in range(args.runs)]
+            results[mode] = summarize(samples)
+    finally:
+        shutil.rmtree(workdir)
+
+    print(f"{'mode':<18} {'import ms':>10} {'create_app ms':>14} "
+          + ''.join(f'{endpoint + " ms":>20}' for endpoint, _ in FIRST_REQUESTS)
+          + f" {'RSS MB':>8} {'modules':>8}  heavy imports")
+    for mode, result in results.items():
+        print(f"{mode:<18} {result['import_ms']['median']:>10.1f} {result['create_app_ms']['median']:>14.1f} "
+              + ''.join(f"{result['first_request_ms'][endpoint]:>20.1f}" for endpoint, _ in FIRST_REQUESTS)
+              + f" {result['rss_mb']['median']:>8.1f} {result['modules']:>8}  {', '.join(result['heavy_modules']) or '-'}")
+
+    if args.json:
+        with open(args.json, 'w') as output:
+            json.dump({'runs': args.runs, 'results': results}, output, indent=2)
+
+
+if __name__ == '__main__':
+    main()
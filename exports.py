@@ -0,0 +1,357 @@
+"""Event registration exports.
+
+These functions only need a sqlite3 connection and a writable binary file, so
+they can run inside a request or outside of Flask altogether. Rows are read
+from the cursor in chunks and written straight out, so memory use does not
+grow with the number of registrations.
+"""
+import os
+import sqlite3
+import time
+from datetime import datetime
+
+# openpyxl and reportlab are imported inside the functions that use them. They
+# cost hundreds of milliseconds and tens of MB per process, and only exports
+# need them, so web workers should not pay for them at startup.
+
+EXPORT_COLUMNS = ['ID', 'Full Name', 'Mobile', 'Address', 'Reference', 'Voucher', 'Status', 'Registration Date']
+CHUNK_SIZE = 500
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Landscape A4 with half-inch margins, as the original single-table report used.
+# Sizes are in points (reportlab's landscape(A4) and inch, without the import).
+INCH = 72.0
+PDF_PAGE_SIZE = (841.8897637795277, 595.2755905511812)
+PDF_MARGIN = 0.5 * INCH
+# Inside the margins, on every side of the page frame (reportlab's default, set explicitly)
+PDF_FRAME_PADDING = 6
+PDF_COL_WIDTHS = [0.5*INCH, 1.8*INCH, 1.2*INCH, 2.5*INCH, 1.2*INCH, 1.2*INCH, 1*INCH, 1.2*INCH]
+# Must agree with the FONTSIZE/padding entries of the table style below
+PDF_BODY_FONT_SIZE = 8
+PDF_CELL_PADDING = 6
+PDF_HEADER_HEIGHT = 10 * 1.2 + 2 * 8
+PDF_CHUNK_SIZE = 100
+
+_pdf_styles = None
+
+
+def iter_registration_chunks(db, chunk_size=CHUNK_SIZE):
+    """Yields lists of event_registrations rows, newest first, chunk_size at a time."""
+    cursor = db.execute(
+        'SELECT id, full_name, mobile_number, address, reference, voucher_number, is_approved, registration_date '
+        'FROM event_registrations ORDER BY registration_date DESC, id DESC'
+    )
+    try:
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                return
+            yield rows
+    finally:
+        cursor.close()
+
+
+def write_registrations_xlsx(db, fileobj, progress=None):
+    """Writes all registrations as an .xlsx workbook to fileobj.
+
+    progress, if given, is called with the number of rows written so far.
+    """
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Alignment, Border, Font, Side
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Event Registrations')
+
+    # Same header look pandas' to_excel gave the old export
+    thin = Side(style='thin')
+    header = []
+    for title in EXPORT_COLUMNS:
+        cell = WriteOnlyCell(sheet, value=title)
+        cell.font = Font(bold=True)
+        cell.border = Border(left=thin, right=thin, top=thin, bottom=thin)
+        cell.alignment = Alignment(horizontal='center', vertical='top')
+        header.append(cell)
+    sheet.append(header)
+
+    written = 0
+    for rows in iter_registration_chunks(db):
+        for reg in rows:
+            sheet.append([
+                reg['id'],
+                reg['full_name'],
+                reg['mobile_number'],
+                reg['address'],
+                reg['reference'],
+                reg['voucher_number'],
+                'Approved' if reg['is_approved'] else 'Pending',
+                reg['registration_date']
+            ])
+        written += len(rows)
+        if progress:
+            progress(written)
+
+    workbook.save(fileobj)
+
+
+def get_pdf_styles():
+    """Builds the paragraph and table styles once and reuses them for every report."""
+    global _pdf_styles
+    if _pdf_styles is None:
+        from reportlab.lib import colors
+        from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+        from reportlab.platypus import TableStyle
+
+        styles = getSampleStyleSheet()
+        title_style = ParagraphStyle(
+            'CustomTitle',
+            parent=styles['Heading1'],
+            fontName='Helvetica-Bold',  # Note: Google Sans would require font registration
+            fontSize=16,
+            spaceAfter=30,
+            alignment=1  # Center alignment
+        )
+        table_style = TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 10),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
+            ('TOPPADDING', (0, 0), (-1, 0), 8),
+            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+            ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+            ('FONTSIZE', (0, 1), (-1, -1), 8),
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
+            ('LEFTPADDING', (0, 0), (-1, -1), 6),
+            ('RIGHTPADDING', (0, 0), (-1, -1), 6),
+            ('TOPPADDING', (0, 1), (-1, -1), 6),
+            ('BOTTOMPADDING', (0, 1), (-1, -1), 6)
+        ])
+        _pdf_styles = {'normal': styles['Normal'], 'title': title_style, 'table': table_style}
+    return _pdf_styles
+
+
+def preload():
+    """Imports the export libraries now rather than on the first export."""
+    import openpyxl
+    import reportlab.pdfgen.canvas
+    import reportlab.platypus
+    get_pdf_styles()
+
+
+def _truncate(text, limit):
+    """Shortens text longer than limit to limit characters ending in '...'."""
+    text = text or ''
+    return text[:limit - 3] + '...' if len(text) > limit else text
+
+
+def _pdf_row(reg, normal):
+    """Builds one report table row and measures its height.
+
+    Long text is cut to fit the landscape columns. The height is worked out the
+    way reportlab's Table does (tallest cell plus padding), once per row, so the
+    page tables can be given fixed row heights instead of re-wrapping every
+    paragraph each time a layout is attempted.
+    """
+    from reportlab.platypus import Paragraph
+
+    row = [
+        str(reg['id']),
+        Paragraph(_truncate(reg['full_name'], 25), normal),
+        reg['mobile_number'] or '',
+        Paragraph(_truncate(reg['address'], 60), normal),
+        Paragraph(_truncate(reg['reference'], 15), normal),
+        reg['voucher_number'] or '',
+        'Approved' if reg['is_approved'] else 'Pending',
+        reg['registration_date'].split(' ')[0] if reg['registration_date'] else ''
+    ]
+    height = PDF_BODY_FONT_SIZE * 1.2
+    for cell, width in zip(row, PDF_COL_WIDTHS):
+        if isinstance(cell, Paragraph):
+            height = max(height, cell.wrap(width - 2 * PDF_CELL_PADDING, PDF_PAGE_SIZE[1])[1])
+    return row, height + 2 * PDF_CELL_PADDING
+
+
+def _stacked_height(flowables, width, height):
+    """Height the flowables take when stacked from the top of a frame, as Frame.add places them."""
+    total = 0
+    for index, flowable in enumerate(flowables):
+        # The frame drops the space before whatever comes first
+        if index:
+            total += flowable.getSpaceBefore()
+        total += flowable.wrap(width, height - total)[1] + flowable.getSpaceAfter()
+    return total
+
+
+def write_registrations_pdf(db, fileobj, generated_at=None, progress=None):
+    """Writes the registrations report as a PDF to fileobj.
+
+    Rather than one table holding every row, which reportlab re-measures each
+    time it splits it across a page, every page gets its own table with just
+    the rows that fit. Rows are pulled from the cursor as pages need them, so
+    only about a page of layout objects is alive at any time.
+
+    progress, if given, is called with the number of rows laid out so far.
+    """
+    from reportlab.pdfgen.canvas import Canvas
+    from reportlab.platypus import Frame, Paragraph, Spacer, Table
+
+    styles = get_pdf_styles()
+    generated_at = generated_at or datetime.now()
+    canv = Canvas(fileobj, pagesize=PDF_PAGE_SIZE)
+    page_width, page_height = PDF_PAGE_SIZE
+    frame_width = page_width - 2 * PDF_MARGIN
+    frame_height = page_height - 2 * PDF_MARGIN
+    content_width = frame_width - 2 * PDF_FRAME_PADDING
+    content_height = frame_height - 2 * PDF_FRAME_PADDING
+
+    chunks = iter_registration_chunks(db, PDF_CHUNK_SIZE)
+    pending = []
+    exhausted = False
+    first_page = True
+    written = 0
+
+    while first_page or pending or not exhausted:
+        frame = Frame(PDF_MARGIN, PDF_MARGIN, frame_width, frame_height,
+                      leftPadding=PDF_FRAME_PADDING, bottomPadding=PDF_FRAME_PADDING,
+                      rightPadding=PDF_FRAME_PADDING, topPadding=PDF_FRAME_PADDING)
+        heading = []
+        if first_page:
+            heading = [
+                Paragraph("Event Registrations Report", styles['title']),
+                Spacer(1, 12),
+                Paragraph(f"Generated on: {generated_at.strftime('%Y-%m-%d %H:%M:%S')}", styles['normal']),
+                Spacer(1, 20),
+            ]
+        # Measured with the flowables' own wrap(), before the frame places them
+        available = content_height - _stacked_height(heading, content_width, content_height)
+        for flowable in heading:
+            frame.add(flowable, canv)
+
+        # Take rows until the next one would overflow the page
+        used = PDF_HEADER_HEIGHT
+        count = 0
+        while True:
+            if count == len(pending):
+                rows = None if exhausted else next(chunks, None)
+                if rows is None:
+                    exhausted = True
+                    break
+                pending.extend(_pdf_row(reg, styles['normal']) for reg in rows)
+            height = pending[count][1]
+            if used + height > available:
+                break
+            used += height
+            count += 1
+
+        if count == 0 and pending and not first_page:
+            raise ValueError('A registration row is too tall to fit on a page')
+
+        page_rows = pending[:count]
+        del pending[:count]
+        table = Table(
+            [EXPORT_COLUMNS] + [row for row, _ in page_rows],
+            colWidths=PDF_COL_WIDTHS,
+            rowHeights=[PDF_HEADER_HEIGHT] + [height for _, height in page_rows],
+            repeatRows=1
+        )
+        table.setStyle(styles['table'])
+        if not frame.add(table, canv):
+            raise ValueError('The page table does not fit its frame')
+        canv.showPage()
+        first_page = False
+        written += count
+        if progress:
+            progress(written)
+
+    canv.save()
+
+
+# kind -> (file extension, mimetype, writer)
+EXPORT_FORMATS = {
+    'excel': ('xlsx', XLSX_MIMETYPE, write_registrations_xlsx),
+    'pdf': ('pdf', 'application/pdf', write_registrations_pdf),
+}
+
+
+def run_export_job(database, export_folder, job_id):
+    """Runs one queued export_jobs row to completion.
+
+    Called in a separate process started by the app (see the command line
+    entry point below).
+
+    The file is written under a temporary name and renamed into place, so a
+    'done' job always points at a complete file. Artifacts of older jobs of the
+    same kind are removed once this one succeeds.
+    """
+    db = sqlite3.connect(database, timeout=30)
+    db.row_factory = sqlite3.Row
+    temp_path = os.path.join(export_folder, f'.job-{job_id}.tmp')
+    try:
+        job = db.execute('SELECT kind FROM export_jobs WHERE id = ?', (job_id,)).fetchone()
+        extension, _, writer = EXPORT_FORMATS[job['kind']]
+
+        # Stamp the job with the data it actually reads, which may be newer
+        # than when it was queued
+        version = db.execute('SELECT COALESCE(MAX(id), 0) FROM registration_changes').fetchone()[0]
+        total = db.execute('SELECT COUNT(*) FROM event_registrations').fetchone()[0]
+        db.execute(
+            "UPDATE export_jobs SET status = 'running', data_version = ?, rows_total = ?, started_at = CURRENT_TIMESTAMP WHERE id = ?",
+            (version, total, job_id)
+        )
+        db.commit()
+
+        last_report = [time.monotonic()]
+
+        def progress(rows_done):
+            # Throttled so a large export does not turn into a stream of writes
+            if time.monotonic() - last_report[0] >= 0.5:
+                db.execute('UPDATE export_jobs SET rows_done = ? WHERE id = ?', (rows_done, job_id))
+                db.commit()
+                last_report[0] = time.monotonic()
+
+        os.makedirs(export_folder, exist_ok=True)
+        with open(temp_path, 'wb') as output:
+            writer(db, output, progress=progress)
+        filename = f'registrations-{job_id}.{extension}'
+        os.replace(temp_path, os.path.join(export_folder, filename))
+
+        db.execute(
+            "UPDATE export_jobs SET status = 'done', rows_done = rows_total, filename = ?, finished_at = CURRENT_TIMESTAMP WHERE id = ?",
+            (filename, job_id)
+        )
+        stale = db.execute(
+            "SELECT id, filename FROM export_jobs WHERE kind = ? AND id < ? AND status IN ('done', 'failed')",
+            (job['kind'], job_id)
+        ).fetchall()
+        db.executemany('DELETE FROM export_jobs WHERE id = ?', [(old['id'],) for old in stale])
+        db.commit()
+        for old in stale:
+            if old['filename']:
+                try:
+                    os.remove(os.path.join(export_folder, old['filename']))
+                except FileNotFoundError:
+                    pass
+    except Exception as e:
+        db.rollback()
+        db.execute(
+            "UPDATE export_jobs SET status = 'failed', error = ?, finished_at = CURRENT_TIMESTAMP WHERE id = ?",
+            (str(e), job_id)
+        )
+        db.commit()
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    import sys
+
+    if len(sys.argv) != 5 or sys.argv[1] != 'run-job':
+        sys.exit('usage: python exports.py run-job DATABASE EXPORT_FOLDER JOB_ID')
+    run_export_job(sys.argv[2], sys.argv[3], int(sys.argv[4]))
@@ -0,0 +1,205 @@
+"""Responsive variants of uploaded images.
+
+For every image in the upload folder we keep resized WebP (and AVIF, when the
+installed Pillow can write it) copies at a few widths, the original's
+dimensions and a tiny blurred placeholder. They live in a ``variants``
+sub-folder next to the originals, with one JSON sidecar per image, so gallery
+uploads on the server and images processed at deploy time never write the same
+file.
+
+Templates call ``responsive_image`` to get a ``<picture>`` element with
+``srcset``/``sizes``, explicit width/height and lazy loading. Images without
+variants fall back to a plain ``<img>``.
+
+    python images.py                 # process images that are new or changed
+    python images.py --force         # rebuild every variant
+"""
+import argparse
+import base64
+import io
+import json
+import os
+import tempfile
+
+from markupsafe import Markup, escape
+
+# Pillow is imported inside the functions that use it; web workers only need
+# the sidecars to render pages.
+
+IMAGE_EXTENSIONS = {'jpg', 'jpeg', 'png', 'webp'}
+VARIANT_FOLDER = 'variants'
+# Candidate widths in pixels; those narrower than the original are made, plus
+# one at the original width
+VARIANT_WIDTHS = (160, 320, 640, 960, 1280, 1920)
+VARIANT_QUALITY = {'avif': 50, 'webp': 75}
+# Best format first, as listed in <picture>
+VARIANT_MIMETYPES = {'avif': 'image/avif', 'webp': 'image/webp'}
+PLACEHOLDER_WIDTH = 16
+
+# sidecar path -> (mtime_ns, data)
+_sidecars = {}
+
+
+def is_image(filename):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in IMAGE_EXTENSIONS
+
+
+def variant_formats():
+    """Returns the variant formats the installed Pillow can write."""
+    from PIL import features
+    return [fmt for fmt in VARIANT_MIMETYPES if features.check(fmt)]
+
+
+def _sidecar_path(upload_folder, filename):
+    return os.path.join(upload_folder, VARIANT_FOLDER, f'{filename}.json')
+
+
+def _placeholder(image):
+    """Returns a blurred ~16px wide WebP of the image as a data: URI."""
+    from PIL import ImageFilter
+    height = max(1, round(image.height * PLACEHOLDER_WIDTH / image.width))
+    small = image.resize((PLACEHOLDER_WIDTH, height)).filter(ImageFilter.GaussianBlur(1))
+    buffer = io.BytesIO()
+    small.save(buffer, 'WEBP', quality=30)
+    return 'data:image/webp;base64,' + base64.b64encode(buffer.getvalue()).decode('ascii')
+
+
+def _save_atomic(path, write):
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as output:
+            write(output)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def generate_variants(upload_folder, filename, force=False):
+    """Creates the variants and sidecar for one uploaded image and returns the sidecar data.
+
+    Up-to-date variants are left alone unless force is set.
+    """
+    from PIL import Image, ImageOps
+
+    source = os.path.join(upload_folder, filename)
+    sidecar_path = _sidecar_path(upload_folder, filename)
+    source_mtime = os.stat(source).st_mtime_ns
+    if not force:
+        existing = load_sidecar(upload_folder, filename)
+        if existing and existing['source_mtime'] == source_mtime:
+            return existing
+
+    os.makedirs(os.path.dirname(sidecar_path), exist_ok=True)
+    with Image.open(source) as opened:
+        # Phone photos are often stored sideways with an EXIF rotation
+        image = ImageOps.exif_transpose(opened)
+        image = image.convert('RGBA' if image.mode in ('RGBA', 'LA', 'P') else 'RGB')
+
+    widths = [width for width in VARIANT_WIDTHS if width < image.width] + [min(image.width, VARIANT_WIDTHS[-1])]
+    stem = os.path.splitext(filename)[0]
+    variants = {}
+    for fmt in variant_formats():
+        variants[fmt] = []
+        for width in widths:
+            height = max(1, round(image.height * width / image.width))
+            resized = image if width == image.width else image.resize((width, height), Image.LANCZOS)
+            name = f'{stem}-{width}.{fmt}'
+            _save_atomic(
+                os.path.join(upload_folder, VARIANT_FOLDER, name),
+                lambda output: resized.save(output, fmt.upper(), quality=VARIANT_QUALITY[fmt])
+            )
+            variants[fmt].append([width, f'{VARIANT_FOLDER}/{name}'])
+
+    data = {
+        'source_mtime': source_mtime,
+        'width': image.width,
+        'height': image.height,
+        'placeholder': _placeholder(image),
+        'variants': variants,
+    }
+    _save_atomic(sidecar_path, lambda output: output.write(json.dumps(data).encode('utf-8')))
+    return data
+
+
+def delete_variants(upload_folder, filename):
+    """Removes the variants and sidecar of an image (e.g. when it is deleted)."""
+    data = load_sidecar(upload_folder, filename)
+    paths = [_sidecar_path(upload_folder, filename)]
+    if data:
+        paths.extend(os.path.join(upload_folder, name)
+                     for variants in data['variants'].values() for _, name in variants)
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def load_sidecar(upload_folder, filename):
+    """Returns the sidecar data of an image, or None if it has no variants yet."""
+    path = _sidecar_path(upload_folder, filename)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+    cached = _sidecars.get(path)
+    if cached is None or cached[0] != mtime:
+        try:
+            with open(path, encoding='utf-8') as sidecar:
+                cached = (mtime, json.load(sidecar))
+        except (OSError, ValueError):
+            return None
+        _sidecars[path] = cached
+    return cached[1]
+
+
+def render_responsive_image(upload_folder, url_for_upload, filename, alt, sizes='100vw', class_='', eager=False):
+    """Returns the markup for an uploaded image; see responsive_image in app.py."""
+    attributes = f'alt="{escape(alt)}"'
+    if class_:
+        attributes += f' class="{escape(class_)}"'
+    if eager:
+        # Likely the largest element on screen: fetch it first
+        attributes += ' loading="eager" fetchpriority="high"'
+    else:
+        attributes += ' loading="lazy" decoding="async"'
+
+    data = load_sidecar(upload_folder, filename)
+    if data is None:
+        return Markup(f'<img src="{escape(url_for_upload(filename))}" {attributes}>')
+
+    attributes += f' width="{data["width"]}" height="{data["height"]}"'
+    # The placeholder shows until the image has loaded, then is dropped so it
+    # does not show through transparent areas.
+    attributes += (f' style="background: url({data["placeholder"]}) center / cover no-repeat"'
+                   ' onload="this.style.background=\'\'"')
+    sources = ''.join(
+        f'<source type="{VARIANT_MIMETYPES[fmt]}" sizes="{escape(sizes)}" '
+        f'srcset="{escape(", ".join(f"{url_for_upload(name)} {width}w" for width, name in variants))}">'
+        for fmt, variants in data['variants'].items() if variants
+    )
+    return Markup(f'<picture>{sources}<img src="{escape(url_for_upload(filename))}" {attributes}></picture>')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--folder', default='static/uploads', help='upload folder (default static/uploads)')
+    parser.add_argument('--force', action='store_true', help='rebuild variants that are already up to date')
+    args = parser.parse_args()
+
+    print(f"Formats: {', '.join(variant_formats())}")
+    for filename in sorted(os.listdir(args.folder)):
+        if not is_image(filename) or not os.path.isfile(os.path.join(args.folder, filename)):
+            continue
+        data = generate_variants(args.folder, filename, force=args.force)
+        original = os.path.getsize(os.path.join(args.folder, filename))
+        # Report the variant a typical phone would pick
+        typical = {fmt: os.path.getsize(os.path.join(args.folder, min(variants, key=lambda v: abs(v[0] - 640))[1]))
+                   for fmt, variants in data['variants'].items()}
+        print(f"{filename}: {data['width']}x{data['height']}, {original // 1024} KB -> "
+              + ', '.join(f'{fmt} {size // 1024} KB' for fmt, size in typical.items()))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,70 +1,28 @@
 import sqlite3
 
-# Establish a connection to the database
-connection = sqlite3.connect('database.db')
-cursor = connection.cursor()
+import auth
+import migrations
 
-# Create the 'notices' table
-# This table will store the ID, title, and filename of each notice
-cursor.execute('''
-        CREATE TABLE IF NOT EXISTS notices (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            title TEXT NOT NULL,
-            filename TEXT NOT NULL,
-            summary TEXT,
-            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
 
-# Create the 'users' table for admin login
-# For this example, we'll insert a default admin user.
-# In a real-world application, use a more secure password hashing method.
-cursor.execute('''
-    CREATE TABLE IF NOT EXISTS users (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        username TEXT UNIQUE NOT NULL,
-        password TEXT NOT NULL
-    )
-''')
+def init_db(database='database.db'):
+    """Brings the schema up to date (see migrations.py) and creates the default admin user."""
+    # Establish a connection to the database
+    connection = sqlite3.connect(database)
+    migrations.migrate(connection)
+    cursor = connection.cursor()
 
-# Create the 'gallery' table for storing gallery images
-cursor.execute('''
-    CREATE TABLE IF NOT EXISTS gallery (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        title TEXT NOT NULL,
-        filename TEXT NOT NULL,
-        is_active BOOLEAN DEFAULT 1,
-        sort_order INTEGER DEFAULT 0,
-        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-    )
-''')
+    # Check if the admin user already exists before inserting
+    cursor.execute("SELECT * FROM users WHERE username = ?", ('admin',))
+    if cursor.fetchone() is None:
+        # Change it after the first login: python auth.py set-password admin
+        cursor.execute("INSERT INTO users (username, password) VALUES (?, ?)", ('admin', auth.hash_password('password')))
 
-# Create the 'event_registrations' table for storing event registrations
-cursor.execute('''
-    CREATE TABLE IF NOT EXISTS event_registrations (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        full_name TEXT NOT NULL,
-        address TEXT,
-        mobile_number TEXT NOT NULL,
-        reference TEXT,
-        voucher_number TEXT UNIQUE,
-        is_approved BOOLEAN DEFAULT 0,
-        registration_date DATETIME DEFAULT CURRENT_TIMESTAMP,
-        approved_date DATETIME
-    )
-''')
+    # Commit changes and close the connection
+    connection.commit()
+    connection.close()
 
-# Check if the admin user already exists before inserting
-cursor.execute("SELECT * FROM users WHERE username = ?", ('admin',))
-if cursor.fetchone() is None:
-    # IMPORTANT: In a production environment, you MUST hash passwords.
-    # Example: from werkzeug.security import generate_password_hash
-    # hashed_pw = generate_password_hash('admin_password', method='pbkdf2:sha256')
-    cursor.execute("INSERT INTO users (username, password) VALUES (?, ?)", ('admin', 'password')) # Use a strong password!
 
-# Commit changes and close the connection
-connection.commit()
-connection.close()
-
-print("Database initialized successfully with 'notices' and 'users' tables.")
-print("Default admin user created with username: 'admin' and password: 'password'")
+if __name__ == '__main__':
+    init_db()
+    print("Database initialized successfully with 'notices' and 'users' tables.")
+    print("Default admin user created with username: 'admin' and password: 'password'")
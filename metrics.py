@@ -0,0 +1,516 @@
+"""Request metrics shared by all Passenger workers, and a per-request sampling profiler.
+
+Each worker keeps histograms in memory: request latency per route, SQL query
+count and time per request (through InstrumentedConnection, which wraps the
+connection get_db hands out), template render time and response size. Every
+few seconds it writes them to its own file in METRICS_DIR, named after its
+PID and start time, so a new process that reuses a PID gets a file of its own.
+Readers sum the files of all workers, which is how Prometheus' multiprocess
+mode treats per-process counters as well, so workers share nothing.
+``collect`` folds the files of workers that have exited into one
+``retired.json``, so the counts of recycled workers stay in the totals (no
+counter ever goes backwards) while the folder stays small.
+
+``prometheus_text`` renders the merged histograms in the Prometheus text
+format and ``route_summary`` turns them into rows for the admin page.
+"""
+import contextlib
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Upper bounds of the histogram buckets (+Inf is implied)
+SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+BYTES_BUCKETS = (1024, 10 * 1024, 100 * 1024, 1024 * 1024, 10 * 1024 * 1024)
+
+# name -> (help text, bucket bounds)
+METRICS = {
+    'http_request_duration_seconds': ('Time to build a response, by route', SECONDS_BUCKETS),
+    'http_response_size_bytes': ('Response body size, by route', BYTES_BUCKETS),
+    'db_queries_per_request': ('SQL statements executed per request, by route', QUERY_BUCKETS),
+    'db_seconds_per_request': ('Time spent in SQLite per request, by route', SECONDS_BUCKETS),
+    'template_render_seconds': ('Template render time, by template', SECONDS_BUCKETS),
+}
+
+# (name, labels) -> [count per bucket..., count in +Inf, sum]
+_histograms = {}
+_lock = threading.Lock()
+_pid = os.getpid()
+_last_flush = 0.0
+_file_name = None
+
+RETIRED_FILE = 'retired.json'
+LOCK_FILE = '.lock'
+# worker-<pid>-<start time>.json; plain <pid>.json files come from older versions
+_WORKER_FILE = re.compile(r'^(?:worker-)?(\d+)(?:-(\d+))?\.json$')
+
+# Profiled requests lower the process-wide switch interval while they run
+_switch_lock = threading.Lock()
+_switch_users = 0
+_saved_switch_interval = None
+
+
+def _check_pid():
+    global _histograms, _pid, _last_flush, _file_name
+    if _pid != os.getpid():
+        # Forked: what the parent recorded is in the parent's file
+        _histograms = {}
+        _pid = os.getpid()
+        _last_flush = 0.0
+        _file_name = None
+
+
+def _process_start(pid):
+    """Start time of a running process (clock ticks since boot, from /proc), or None if it is not running.
+
+    Without /proc, '0' for any running process.
+    """
+    try:
+        with open(f'/proc/{pid}/stat') as stat:
+            # Fields after the command name, which is in parentheses; starttime is field 22
+            return stat.read().rsplit(')', 1)[1].split()[19]
+    except FileNotFoundError:
+        if os.path.isdir('/proc'):
+            return None
+    except (OSError, IndexError):
+        return None
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return None
+    except OSError:
+        pass
+    return '0'
+
+
+def _worker_file_name():
+    global _file_name
+    if _file_name is None:
+        _file_name = f'worker-{os.getpid()}-{_process_start(os.getpid()) or 0}.json'
+    return _file_name
+
+
+def observe(name, labels, value):
+    """Records one observation of a histogram; labels is a tuple of (name, value) pairs."""
+    buckets = METRICS[name][1]
+    _check_pid()
+    with _lock:
+        series = _histograms.get((name, labels))
+        if series is None:
+            series = _histograms[(name, labels)] = [0] * (len(buckets) + 1) + [0.0]
+        for index, bound in enumerate(buckets):
+            if value <= bound:
+                series[index] += 1
+                break
+        else:
+            series[len(buckets)] += 1
+        series[-1] += value
+
+
+def observe_request(endpoint, method, status, seconds, response_bytes, db_queries, db_seconds):
+    route = (('endpoint', endpoint),)
+    observe('http_request_duration_seconds', route + (('method', method), ('status', str(status))), seconds)
+    if response_bytes is not None:
+        observe('http_response_size_bytes', route, response_bytes)
+    observe('db_queries_per_request', route, db_queries)
+    observe('db_seconds_per_request', route, db_seconds)
+
+
+def flush(directory, interval=0):
+    """Writes this worker's histograms to its file if the last write is older than interval seconds."""
+    global _last_flush
+    _check_pid()
+    now = time.monotonic()
+    if now - _last_flush < interval:
+        return
+    _last_flush = now
+    with _lock:
+        rows = [[name, list(labels), series] for (name, labels), series in _histograms.items()]
+    try:
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as output:
+            json.dump(rows, output)
+        os.replace(temp_path, os.path.join(directory, _worker_file_name()))
+    except OSError:
+        # Metrics must never break a request
+        pass
+
+
+def _read_rows(path):
+    try:
+        with open(path) as source:
+            return json.load(source)
+    except (OSError, ValueError):
+        return None
+
+
+def _merge(merged, rows):
+    for name, labels, series in rows:
+        if name not in METRICS:
+            continue
+        key = (name, tuple(tuple(pair) for pair in labels))
+        total = merged.get(key)
+        if total is None or len(total) != len(series):
+            merged[key] = list(series)
+        else:
+            merged[key] = [a + b for a, b in zip(total, series)]
+
+
+def _is_retired(filename):
+    """Tells whether a worker file belongs to a process that has exited."""
+    match = _WORKER_FILE.match(filename)
+    if match is None:
+        return False
+    pid, start = match.groups()
+    # Files without a start time are from before it was recorded; their PID may be reused by now
+    return start is None or _process_start(int(pid)) != start
+
+
+@contextlib.contextmanager
+def _locked(directory):
+    with open(os.path.join(directory, LOCK_FILE), 'a') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        yield
+
+
+def _write_json(path, data):
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(fd, 'w') as output:
+        json.dump(data, output)
+    os.replace(temp_path, path)
+
+
+def _retire(directory, retired, filenames):
+    """Adds the given workers' files to the retired totals, removes them and returns the new totals.
+
+    The totals list the files they include until those are removed, so a
+    file is never counted twice, even if this stops halfway.
+    """
+    merged = {}
+    _merge(merged, retired['rows'])
+    absorbed = list(retired['absorbed'])
+    for filename in filenames:
+        rows = _read_rows(os.path.join(directory, filename))
+        if rows is not None:
+            _merge(merged, rows)
+            absorbed.append(filename)
+    rows = [[name, list(labels), series] for (name, labels), series in merged.items()]
+    path = os.path.join(directory, RETIRED_FILE)
+    _write_json(path, {'absorbed': absorbed, 'rows': rows})
+    for filename in absorbed:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(os.path.join(directory, filename))
+    retired = {'absorbed': [], 'rows': rows}
+    _write_json(path, retired)
+    return retired
+
+
+def _worker_files(directory):
+    return [name for name in os.listdir(directory) if name.endswith('.json') and name != RETIRED_FILE]
+
+
+def collect(directory):
+    """Returns the histograms of every worker, past and present, summed: {(name, labels): series}.
+
+    Files of workers that have exited are first folded into retired.json.
+    Runs under a lock shared with other readers, so two readers never fold
+    the same file and none sees a file between the two steps.
+    """
+    try:
+        names = _worker_files(directory)
+    except FileNotFoundError:
+        return {}
+    with _locked(directory):
+        retired = _read_rows(os.path.join(directory, RETIRED_FILE)) or {'absorbed': [], 'rows': []}
+        exited = [name for name in names if name not in retired['absorbed'] and _is_retired(name)]
+        if exited or retired['absorbed']:
+            try:
+                retired = _retire(directory, retired, exited)
+            except OSError:
+                # Metrics must never break a request
+                pass
+        merged = {}
+        _merge(merged, retired['rows'])
+        for filename in _worker_files(directory):
+            if filename not in retired['absorbed']:
+                rows = _read_rows(os.path.join(directory, filename))
+                if rows is not None:
+                    _merge(merged, rows)
+    return merged
+
+
+def _label_text(labels, extra=()):
+    pairs = [*labels, *extra]
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def prometheus_text(merged):
+    """Renders merged histograms in the Prometheus text exposition format."""
+    lines = []
+    for name, (help_text, buckets) in METRICS.items():
+        series_list = sorted((labels, series) for (metric, labels), series in merged.items() if metric == name)
+        if not series_list:
+            continue
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} histogram')
+        for labels, series in series_list:
+            cumulative = 0
+            for bound, count in zip(buckets, series):
+                cumulative += count
+                lines.append(f'{name}_bucket{_label_text(labels, [("le", repr(float(bound)))])} {cumulative}')
+            count = sum(series[:-1])
+            lines.append(f'{name}_bucket{_label_text(labels, [("le", "+Inf")])} {count}')
+            lines.append(f'{name}_sum{_label_text(labels)} {series[-1]!r}')
+            lines.append(f'{name}_count{_label_text(labels)} {count}')
+    return '\n'.join(lines) + '\n'
+
+
+def quantile(buckets, series, q):
+    """Estimates a quantile from histogram buckets, interpolating like PromQL's histogram_quantile."""
+    counts = series[:-1]
+    total = sum(counts)
+    if not total:
+        return None
+    rank = q * total
+    cumulative = 0
+    lower = 0.0
+    for bound, count in zip(buckets, counts):
+        if count and cumulative + count >= rank:
+            return lower + (bound - lower) * (rank - cumulative) / count
+        cumulative += count
+        lower = bound
+    # In the +Inf bucket: the largest finite bound is all we know
+    return buckets[-1]
+
+
+def _add(total, series):
+    return list(series) if total is None else [a + b for a, b in zip(total, series)]
+
+
+def route_summary(merged):
+    """Returns one dict per route, slowest in total first, for the admin metrics page."""
+    routes = {}
+    for (name, labels), series in merged.items():
+        if name == 'template_render_seconds':
+            continue
+        endpoint = dict(labels)['endpoint']
+        route = routes.setdefault(endpoint, {})
+        route[name] = _add(route.get(name), series)
+
+    rows = []
+    for endpoint, route in routes.items():
+        duration = route.get('http_request_duration_seconds')
+        if duration is None:
+            continue
+        count = sum(duration[:-1])
+        queries = route.get('db_queries_per_request')
+        db_time = route.get('db_seconds_per_request')
+        size = route.get('http_response_size_bytes')
+        rows.append({
+            'endpoint': endpoint,
+            'count': count,
+            'total_seconds': duration[-1],
+            'mean_ms': duration[-1] / count * 1000,
+            'p50_ms': quantile(SECONDS_BUCKETS, duration, 0.5) * 1000,
+            'p95_ms': quantile(SECONDS_BUCKETS, duration, 0.95) * 1000,
+            'queries': queries[-1] / count if queries else 0,
+            'db_ms': db_time[-1] / count * 1000 if db_time else 0,
+            'kb': size[-1] / max(1, sum(size[:-1])) / 1024 if size else None,
+        })
+    rows.sort(key=lambda row: row['total_seconds'], reverse=True)
+    return rows
+
+
+def template_summary(merged):
+    """Returns one dict per template, slowest in total first."""
+    rows = []
+    for (name, labels), series in merged.items():
+        if name != 'template_render_seconds':
+            continue
+        count = sum(series[:-1])
+        rows.append({
+            'template': dict(labels)['template'],
+            'count': count,
+            'mean_ms': series[-1] / count * 1000 if count else 0,
+            'p95_ms': (quantile(SECONDS_BUCKETS, series, 0.95) or 0) * 1000,
+            'total_seconds': series[-1],
+        })
+    rows.sort(key=lambda row: row['total_seconds'], reverse=True)
+    return rows
+
+
+class InstrumentedConnection:
+    """Wraps a sqlite3 connection, counting statements and timing them (fetching included).
+
+    Everything else is passed through to the connection.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.queries = 0
+        self.seconds = 0.0
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return InstrumentedCursor(self.connection.execute(sql, parameters), self)
+        finally:
+            self.queries += 1
+            self.seconds += time.perf_counter() - started
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return InstrumentedCursor(self.connection.executemany(sql, seq_of_parameters), self)
+        finally:
+            self.queries += 1
+            self.seconds += time.perf_counter() - started
+
+    def __getattr__(self, name):
+        return getattr(self.connection, name)
+
+
+class InstrumentedCursor:
+    def __init__(self, cursor, owner):
+        self._cursor = cursor
+        self._owner = owner
+
+    def _timed(self, method, *args):
+        started = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            self._owner.seconds += time.perf_counter() - started
+
+    def fetchone(self):
+        return self._timed(self._cursor.fetchone)
+
+    def fetchmany(self, *args):
+        return self._timed(self._cursor.fetchmany, *args)
+
+    def fetchall(self):
+        return self._timed(self._cursor.fetchall)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return self._timed(next, self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class SamplingProfiler:
+    """Samples one thread's stack at a fixed interval while it handles a request.
+
+    Cheap enough to leave off by default and turn on for a single request.
+    ``collapsed`` gives the result in the collapsed-stack format that
+    flamegraph.pl and speedscope read.
+    """
+
+    def __init__(self, thread_id, interval=0.002):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        global _switch_users, _saved_switch_interval
+        self._running = True
+        # The sampler needs the GIL to take a sample, and the profiled thread
+        # only gives it up every switch interval (5 ms by default). The setting
+        # is process-wide, so overlapping profiles share it: the first lowers
+        # it, the last one to stop restores it.
+        with _switch_lock:
+            if _switch_users == 0:
+                _saved_switch_interval = sys.getswitchinterval()
+            _switch_users += 1
+            sys.setswitchinterval(min(sys.getswitchinterval(), self.interval / 4))
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+        self._started = time.perf_counter()
+
+    def stop(self):
+        global _switch_users
+        self._running = False
+        self._thread.join()
+        with _switch_lock:
+            _switch_users -= 1
+            if _switch_users == 0:
+                sys.setswitchinterval(_saved_switch_interval)
+        self.seconds = time.perf_counter() - self._started
+
+    def _run(self):
+        while self._running:
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+                self.samples += 1
+            time.sleep(self.interval)
+
+    def collapsed(self):
+        return '\n'.join(f'{stack} {count}' for stack, count in self.stacks.most_common())
+
+    def report(self, title, top=30):
+        """Plain-text report: the functions most often on top of the stack, then the collapsed stacks."""
+        own = Counter()
+        for stack, count in self.stacks.items():
+            own[stack.rsplit(';', 1)[-1]] += count
+        lines = [
+            title,
+            f'{self.samples} samples every {self.interval * 1000:g} ms over {self.seconds * 1000:.1f} ms',
+            '',
+            'Most samples (self):',
+        ]
+        for function, count in own.most_common(top):
+            lines.append(f'{count * 100 / max(1, self.samples):6.1f}%  {function}')
+        lines += ['', 'Collapsed stacks (for flamegraph.pl or speedscope):', self.collapsed()]
+        return '\n'.join(lines) + '\n'
+
+
+def save_profile(directory, name, text, keep=20):
+    """Stores a profile report and removes all but the newest keep reports. Returns its file name."""
+    os.makedirs(directory, exist_ok=True)
+    filename = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{name}.txt"
+    with open(os.path.join(directory, filename), 'w') as output:
+        output.write(text)
+    for old in list_profiles(directory)[keep:]:
+        try:
+            os.remove(os.path.join(directory, old))
+        except FileNotFoundError:
+            pass
+    return filename
+
+
+def list_profiles(directory):
+    """Returns the stored profile file names, newest first."""
+    try:
+        names = [name for name in os.listdir(directory) if name.endswith('.txt')]
+    except FileNotFoundError:
+        return []
+    # Names start with the time they were taken
+    return sorted(names, reverse=True)
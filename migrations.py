@@ -0,0 +1,507 @@
+"""Versioned schema migrations for the SQLite database.
+
+The database records the last migration applied in ``PRAGMA user_version``.
+``migrate`` applies the newer ones in order at startup (see init_schema in
+app.py) or from the command line. Each migration runs in its own write
+transaction together with the version bump, so a failing migration leaves the
+database as it was, and workers starting at the same time apply it once: the
+others wait for the lock and then see the new version.
+
+To change the schema, append a function decorated with ``@migration`` and the
+next version number. Never edit a migration that has been deployed.
+
+    python migrations.py [DATABASE]           # apply pending migrations
+    python migrations.py --status [DATABASE]  # show applied and pending migrations
+"""
+import sqlite3
+import sys
+
+import analytics
+import auth
+import notice_index
+import registrations
+
+MIGRATIONS = []
+
+
+def migration(version, description):
+    """Registers a function(connection) as the migration to schema version ``version``."""
+    def register(apply):
+        if MIGRATIONS and version != MIGRATIONS[-1][0] + 1:
+            raise ValueError(f'Migration {version} does not follow {MIGRATIONS[-1][0]}')
+        MIGRATIONS.append((version, description, apply))
+        return apply
+    return register
+
+
+def schema_version(connection):
+    return connection.execute('PRAGMA user_version').fetchone()[0]
+
+
+def latest_version():
+    return MIGRATIONS[-1][0]
+
+
+def migrate(connection):
+    """Applies every pending migration. Returns the versions applied."""
+    applied = []
+    for version, description, apply in MIGRATIONS:
+        if schema_version(connection) >= version:
+            continue
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            # Another worker may have got there while we waited for the lock
+            if schema_version(connection) >= version:
+                connection.rollback()
+                continue
+            apply(connection)
+            connection.execute(f'PRAGMA user_version = {version}')
+            connection.commit()
+        except BaseException:
+            connection.rollback()
+            raise
+        applied.append(version)
+    return applied
+
+
+@migration(1, 'Baseline schema')
+def baseline(connection):
+    """The schema as init_db.py created it before migrations existed.
+
+    Uses IF NOT EXISTS throughout, because databases from that time already
+    have some or all of it.
+    """
+    cursor = connection.cursor()
+    # Create the 'notices' table
+    # This table will store the ID, title, and filename of each notice
+    cursor.execute('''
+            CREATE TABLE IF NOT EXISTS notices (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                title TEXT NOT NULL,
+                filename TEXT NOT NULL,
+                summary TEXT,
+                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+    # Create the 'users' table for admin login
+    # For this example, we'll insert a default admin user.
+    # In a real-world application, use a more secure password hashing method.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL
+        )
+    ''')
+
+    # Create the 'gallery' table for storing gallery images
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS gallery (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT NOT NULL,
+            filename TEXT NOT NULL,
+            is_active BOOLEAN DEFAULT 1,
+            sort_order INTEGER DEFAULT 0,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Create the 'event_registrations' table for storing event registrations
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS event_registrations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            full_name TEXT NOT NULL,
+            address TEXT,
+            mobile_number TEXT NOT NULL,
+            reference TEXT,
+            voucher_number TEXT UNIQUE,
+            is_approved BOOLEAN DEFAULT 0,
+            registration_date DATETIME DEFAULT CURRENT_TIMESTAMP,
+            approved_date DATETIME
+        )
+    ''')
+
+    # Indexes behind the paginated admin listing (newest first, optionally by
+    # status) and the mobile number lookups/prefix search.
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_event_registrations_date ON event_registrations (registration_date, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_event_registrations_status_date ON event_registrations (is_approved, registration_date, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_event_registrations_mobile ON event_registrations (mobile_number)')
+
+    # Change log for event registrations. Every insert, update, approval and
+    # delete appends a row here (via the triggers below), so the admin
+    # dashboard can ask for "everything after change N" instead of reloading
+    # the whole table. AUTOINCREMENT keeps ids increasing even after pruning.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS registration_changes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            registration_id INTEGER NOT NULL,
+            action TEXT NOT NULL,
+            changed_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS event_registrations_log_insert
+        AFTER INSERT ON event_registrations
+        BEGIN
+            INSERT INTO registration_changes (registration_id, action) VALUES (NEW.id, 'insert');
+        END
+    ''')
+
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS event_registrations_log_update
+        AFTER UPDATE ON event_registrations
+        BEGIN
+            INSERT INTO registration_changes (registration_id, action)
+            VALUES (NEW.id, CASE WHEN NEW.is_approved AND NOT OLD.is_approved THEN 'approve' ELSE 'update' END);
+        END
+    ''')
+
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS event_registrations_log_delete
+        AFTER DELETE ON event_registrations
+        BEGIN
+            INSERT INTO registration_changes (registration_id, action) VALUES (OLD.id, 'delete');
+        END
+    ''')
+
+    # Only the most recent changes are kept; clients holding an older cursor
+    # simply get a full reload.
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS registration_changes_prune
+        AFTER INSERT ON registration_changes
+        BEGIN
+            DELETE FROM registration_changes WHERE id <= NEW.id - 10000;
+        END
+    ''')
+
+    # Background export jobs (see exports.run_export_job). Finished files are
+    # reused while data_version (the registration change cursor) is unchanged.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS export_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            data_version INTEGER NOT NULL,
+            rows_done INTEGER NOT NULL DEFAULT 0,
+            rows_total INTEGER,
+            filename TEXT,
+            error TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            started_at DATETIME,
+            finished_at DATETIME
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_export_jobs_kind_version ON export_jobs (kind, data_version)')
+
+    # Files in the upload folder (see uploads.py). New uploads are named after
+    # the hash of their contents, so identical files are stored once. refcount
+    # is the number of notices and gallery rows using the file; the triggers
+    # below keep it current and uploads.collect_unused removes files at zero.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS upload_blobs (
+            filename TEXT PRIMARY KEY,
+            sha256 TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            refcount INTEGER NOT NULL DEFAULT 0,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_upload_blobs_sha256 ON upload_blobs (sha256)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_upload_blobs_unused ON upload_blobs (refcount) WHERE refcount <= 0')
+
+    for table in ('notices', 'gallery'):
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_upload_ref_insert
+            AFTER INSERT ON {table}
+            BEGIN
+                UPDATE upload_blobs SET refcount = refcount + 1 WHERE filename = NEW.filename;
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_upload_ref_update
+            AFTER UPDATE OF filename ON {table}
+            WHEN NEW.filename IS NOT OLD.filename
+            BEGIN
+                UPDATE upload_blobs SET refcount = refcount + 1 WHERE filename = NEW.filename;
+                UPDATE upload_blobs SET refcount = refcount - 1 WHERE filename = OLD.filename;
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_upload_ref_delete
+            AFTER DELETE ON {table}
+            BEGIN
+                UPDATE upload_blobs SET refcount = refcount - 1 WHERE filename = OLD.filename;
+            END
+        ''')
+
+    # What notice_index.py extracted from each stored PDF (once per file)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS upload_documents (
+            filename TEXT PRIMARY KEY,
+            status TEXT NOT NULL,
+            page_count INTEGER,
+            text TEXT,
+            thumbnail TEXT,
+            error TEXT,
+            extracted_at DATETIME
+        )
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS upload_blobs_delete_document
+        AFTER DELETE ON upload_blobs
+        BEGIN
+            DELETE FROM upload_documents WHERE filename = OLD.filename;
+        END
+    ''')
+
+    # Full-text index of notices (rowid = notice id) behind the notice search.
+    # Title and summary come from notices, body from the PDF text; the triggers
+    # keep it in step with both tables.
+    cursor.execute(notice_index.FTS_TABLE_SQL)
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS notices_fts_insert
+        AFTER INSERT ON notices
+        BEGIN
+            INSERT INTO notices_fts (rowid, title, summary, body)
+            VALUES (NEW.id, NEW.title, NEW.summary, (SELECT text FROM upload_documents WHERE filename = NEW.filename));
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS notices_fts_update
+        AFTER UPDATE OF title, summary, filename ON notices
+        BEGIN
+            UPDATE notices_fts
+            SET title = NEW.title, summary = NEW.summary,
+                body = (SELECT text FROM upload_documents WHERE filename = NEW.filename)
+            WHERE rowid = NEW.id;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS notices_fts_delete
+        AFTER DELETE ON notices
+        BEGIN
+            DELETE FROM notices_fts WHERE rowid = OLD.id;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS upload_documents_fts
+        AFTER INSERT ON upload_documents
+        BEGIN
+            UPDATE notices_fts SET body = NEW.text
+            WHERE rowid IN (SELECT id FROM notices WHERE filename = NEW.filename);
+        END
+    ''')
+    # Notices created before the index existed
+    cursor.execute(notice_index.FILL_INDEX_SQL)
+
+
+@migration(2, 'One registration per mobile number')
+def unique_mobile_numbers(connection):
+    """Replaces the read-then-insert duplicate check with a UNIQUE index.
+
+    Registrations that already share a number are moved to
+    event_registration_duplicates for the admins to review; the one kept is
+    the approved one, else the earliest.
+    """
+    connection.execute('CREATE TABLE IF NOT EXISTS event_registration_duplicates AS SELECT * FROM event_registrations WHERE 0')
+    duplicates = '''
+        FROM event_registrations AS r
+        WHERE EXISTS (
+            SELECT 1 FROM event_registrations k
+            WHERE k.mobile_number = r.mobile_number
+              AND (k.is_approved > r.is_approved OR (k.is_approved = r.is_approved AND k.id < r.id))
+        )
+    '''
+    connection.execute(f'INSERT INTO event_registration_duplicates SELECT * {duplicates}')
+    connection.execute(f'DELETE {duplicates}')
+    connection.execute('DROP INDEX IF EXISTS idx_event_registrations_mobile')
+    connection.execute('CREATE UNIQUE INDEX idx_event_registrations_mobile ON event_registrations (mobile_number)')
+
+
+@migration(3, 'Indexes for the notice and gallery listings')
+def listing_indexes(connection):
+    """Lets the listings read rows in index order instead of scanning and sorting.
+
+    The public gallery index covers the carousel query, so it never touches
+    the table. The filename indexes serve the refcount and full-text triggers.
+    """
+    connection.execute('CREATE INDEX idx_notices_timestamp ON notices (timestamp)')
+    connection.execute('CREATE INDEX idx_notices_filename ON notices (filename)')
+    connection.execute('''
+        CREATE INDEX idx_gallery_active_order
+        ON gallery (is_active, sort_order, timestamp DESC, id, title, filename)
+    ''')
+    connection.execute('CREATE INDEX idx_gallery_order ON gallery (sort_order, timestamp DESC)')
+    connection.execute('CREATE INDEX idx_gallery_filename ON gallery (filename)')
+
+
+@migration(4, 'Normalized mobile numbers')
+def normalize_mobile_numbers(connection):
+    """Rewrites stored mobile numbers in the form registrations.normalize_mobile gives new ones.
+
+    Numbers that turn out to be the same phone are resolved like in migration
+    2: the approved (else earliest) registration stays and the rest move to
+    event_registration_duplicates. Values that are not phone numbers are left
+    as they are.
+    """
+    rows = connection.execute(
+        'SELECT id, mobile_number, is_approved FROM event_registrations ORDER BY is_approved DESC, id'
+    ).fetchall()
+    kept = {}
+    duplicates = []
+    renames = []
+    for registration_id, mobile_number, _ in rows:
+        normalized = registrations.normalize_mobile(mobile_number) or mobile_number
+        if normalized in kept:
+            duplicates.append((registration_id,))
+            continue
+        kept[normalized] = registration_id
+        if normalized != mobile_number:
+            renames.append((normalized, registration_id))
+    connection.executemany(
+        'INSERT INTO event_registration_duplicates SELECT * FROM event_registrations WHERE id = ?', duplicates
+    )
+    connection.executemany('DELETE FROM event_registrations WHERE id = ?', duplicates)
+    connection.executemany('UPDATE event_registrations SET mobile_number = ? WHERE id = ?', renames)
+
+
+@migration(5, 'Hashed admin passwords and failed login counts')
+def hashed_passwords(connection):
+    """Replaces plaintext passwords with hashes and adds the table behind login throttling (see auth.py).
+
+    Hashes use auth.DEFAULT_METHOD; logging in moves them to whatever
+    PASSWORD_HASH_METHOD is configured.
+    """
+    users = connection.execute('SELECT id, password FROM users').fetchall()
+    connection.executemany('UPDATE users SET password = ? WHERE id = ?', [
+        (auth.hash_password(password), user_id) for user_id, password in users if not auth.is_password_hash(password)
+    ])
+    connection.execute('''
+        CREATE TABLE login_failures (
+            key TEXT PRIMARY KEY,
+            failures INTEGER NOT NULL,
+            window_start REAL NOT NULL
+        ) WITHOUT ROWID
+    ''')
+
+
+@migration(6, 'Registration analytics rollups')
+def registration_rollups(connection):
+    """Daily and per-reference registration counts, kept current by triggers (see analytics.py).
+
+    Each registration counts once on the UTC day it registered (registered,
+    approved, with_voucher), once more on the day it was approved if it still
+    is (approvals), and once under its reference, trimmed and lower-cased. Triggers take a
+    row's old contribution away and add its new one, so every write path,
+    including bulk changes and the group commit, keeps the rollups exact.
+
+    A voucher counts when its number is non-empty, the test
+    registrations.approve_many uses. The edit form used to store '' for a
+    blank voucher; those become NULL first.
+    """
+    connection.execute("UPDATE event_registrations SET voucher_number = NULL WHERE trim(voucher_number) = ''")
+    connection.execute('''
+        CREATE TABLE registration_daily (
+            day TEXT PRIMARY KEY,
+            registered INTEGER NOT NULL DEFAULT 0,
+            approved INTEGER NOT NULL DEFAULT 0,
+            with_voucher INTEGER NOT NULL DEFAULT 0,
+            approvals INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    ''')
+    connection.execute('''
+        CREATE TABLE registration_references (
+            reference TEXT PRIMARY KEY,
+            registrations INTEGER NOT NULL DEFAULT 0,
+            approved INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    ''')
+    connection.execute(
+        'CREATE INDEX idx_registration_references_count ON registration_references (registrations DESC, reference)'
+    )
+
+    def contribution(row, sign):
+        """Statements adding (sign 1) or removing (sign -1) one row's counts."""
+        return f'''
+            INSERT INTO registration_daily (day, registered, approved, with_voucher)
+            VALUES (
+                IFNULL(date({row}.registration_date), ''), {sign},
+                {sign} * (CASE WHEN {row}.is_approved THEN 1 ELSE 0 END),
+                {sign} * (COALESCE({row}.voucher_number, '') != '')
+            )
+            ON CONFLICT (day) DO UPDATE SET
+                registered = registered + excluded.registered,
+                approved = approved + excluded.approved,
+                with_voucher = with_voucher + excluded.with_voucher;
+            INSERT INTO registration_daily (day, approvals)
+            SELECT IFNULL(date({row}.approved_date), ''), {sign} WHERE {row}.approved_date IS NOT NULL AND {row}.is_approved
+            ON CONFLICT (day) DO UPDATE SET approvals = approvals + excluded.approvals;
+            INSERT INTO registration_references (reference, registrations, approved)
+            VALUES (
+                lower(trim(IFNULL({row}.reference, ''))), {sign},
+                {sign} * (CASE WHEN {row}.is_approved THEN 1 ELSE 0 END)
+            )
+            ON CONFLICT (reference) DO UPDATE SET
+                registrations = registrations + excluded.registrations,
+                approved = approved + excluded.approved;
+        '''
+
+    # Days and references nothing counts towards any more are dropped
+    cleanup = '''
+        DELETE FROM registration_daily
+        WHERE day IN (IFNULL(date(OLD.registration_date), ''), IFNULL(date(OLD.approved_date), ''))
+          AND registered = 0 AND approvals = 0;
+        DELETE FROM registration_references
+        WHERE reference = lower(trim(IFNULL(OLD.reference, ''))) AND registrations = 0;
+    '''
+    connection.execute(f'''
+        CREATE TRIGGER event_registrations_rollup_insert
+        AFTER INSERT ON event_registrations
+        BEGIN
+            {contribution('NEW', 1)}
+        END
+    ''')
+    connection.execute(f'''
+        CREATE TRIGGER event_registrations_rollup_update
+        AFTER UPDATE OF registration_date, approved_date, is_approved, voucher_number, reference ON event_registrations
+        WHEN OLD.registration_date IS NOT NEW.registration_date
+          OR OLD.approved_date IS NOT NEW.approved_date
+          OR OLD.is_approved IS NOT NEW.is_approved
+          OR (COALESCE(OLD.voucher_number, '') != '') != (COALESCE(NEW.voucher_number, '') != '')
+          OR lower(trim(IFNULL(OLD.reference, ''))) != lower(trim(IFNULL(NEW.reference, '')))
+        BEGIN
+            {contribution('OLD', -1)}
+            {contribution('NEW', 1)}
+            {cleanup}
+        END
+    ''')
+    connection.execute(f'''
+        CREATE TRIGGER event_registrations_rollup_delete
+        AFTER DELETE ON event_registrations
+        BEGIN
+            {contribution('OLD', -1)}
+            {cleanup}
+        END
+    ''')
+    analytics.rebuild_rollups(connection)
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    status = '--status' in args
+    args = [arg for arg in args if arg != '--status']
+    if len(args) > 1:
+        sys.exit('usage: python migrations.py [--status] [DATABASE]')
+    connection = sqlite3.connect(args[0] if args else 'database.db', timeout=30)
+    try:
+        if status:
+            current = schema_version(connection)
+            for version, description, _ in MIGRATIONS:
+                print(f"{'applied' if version <= current else 'pending':<8} {version:>3}  {description}")
+        else:
+            applied = migrate(connection)
+            print(f'Applied migration(s) {", ".join(map(str, applied))}' if applied else 'Schema is up to date')
+    finally:
+        connection.close()
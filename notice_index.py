@@ -0,0 +1,239 @@
+"""Text, page count and thumbnail extraction for notice PDFs.
+
+Extraction runs once per stored PDF, outside the web worker (see
+run_index_process in app.py), and the results go into upload_documents. The
+triggers in migrations.py copy the text into the notices_fts full-text index,
+which is all the notice search endpoint reads.
+
+Text and page counts come from pypdf. The thumbnail is the first page rendered
+by poppler's ``pdftoppm`` when it is installed; otherwise it is the largest
+image embedded in the first page (scanned notices), and text-only PDFs get
+none.
+
+    python notice_index.py pending DATABASE UPLOAD_FOLDER   # index every notice PDF not indexed yet
+    python notice_index.py rebuild DATABASE                 # recreate the full-text index
+"""
+import html
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+
+import uploads
+
+# pypdf and Pillow are imported inside the functions that use them
+
+THUMBNAIL_FOLDER = 'thumbnails'
+THUMBNAIL_WIDTH = 320
+# Plenty for search; keeps a huge scanned-and-OCRed PDF from bloating the index
+MAX_TEXT_LENGTH = 200000
+PDFTOPPM_TIMEOUT = 60
+
+# unicode61 splits words at every character outside ``categories``. Its
+# default ('L* N* Co') leaves out the combining marks (M*), which include the
+# Bengali vowel signs, and would index জরুরী as জর + র. Diacritics are still
+# folded for Latin text (cafe matches café).
+FTS_TOKENIZE = "unicode61 remove_diacritics 2 categories 'L* N* Co M*'"
+FTS_TABLE_SQL = f'''
+    CREATE VIRTUAL TABLE IF NOT EXISTS notices_fts USING fts5(
+        title, summary, body, tokenize = "{FTS_TOKENIZE}"
+    )
+'''
+# Title and summary come from notices, body from the PDF text
+FILL_INDEX_SQL = '''
+    INSERT INTO notices_fts (rowid, title, summary, body)
+    SELECT n.id, n.title, n.summary, d.text
+    FROM notices n LEFT JOIN upload_documents d ON d.filename = n.filename
+    WHERE n.id NOT IN (SELECT rowid FROM notices_fts)
+'''
+
+# Wrapped around matches by snippet(); replaced after escaping the text
+_MATCH_START = '\x02'
+_MATCH_END = '\x03'
+
+
+def thumbnail_name(filename):
+    """Path of a PDF's thumbnail, relative to the upload folder."""
+    return f'{THUMBNAIL_FOLDER}/{os.path.splitext(filename)[0]}-{THUMBNAIL_WIDTH}.webp'
+
+
+def delete_thumbnail(upload_folder, filename):
+    """Removes a PDF's thumbnail (e.g. once the PDF itself is gone)."""
+    try:
+        os.remove(os.path.join(upload_folder, thumbnail_name(filename)))
+    except FileNotFoundError:
+        pass
+
+
+def _first_page_image(path, reader):
+    """Returns the first page as a Pillow image, or None if it cannot be rendered."""
+    from PIL import Image
+
+    pdftoppm = shutil.which('pdftoppm')
+    if pdftoppm:
+        with tempfile.TemporaryDirectory() as workdir:
+            prefix = os.path.join(workdir, 'page')
+            result = subprocess.run(
+                [pdftoppm, '-png', '-singlefile', '-f', '1', '-l', '1', '-scale-to', str(THUMBNAIL_WIDTH * 2), path, prefix],
+                capture_output=True, timeout=PDFTOPPM_TIMEOUT
+            )
+            if result.returncode == 0 and os.path.exists(prefix + '.png'):
+                with Image.open(prefix + '.png') as page:
+                    return page.copy()
+
+    images = list(reader.pages[0].images) if len(reader.pages) else []
+    if images:
+        largest = max(images, key=lambda embedded: embedded.image.width * embedded.image.height)
+        return largest.image
+    return None
+
+
+def extract_document(path):
+    """Returns (page_count, text, thumbnail image or None) for a PDF file."""
+    from pypdf import PdfReader
+
+    reader = PdfReader(path)
+    parts = []
+    length = 0
+    for page in reader.pages:
+        text = page.extract_text() or ''
+        parts.append(text)
+        length += len(text)
+        if length >= MAX_TEXT_LENGTH:
+            break
+    text = ' '.join(' '.join(parts).split())[:MAX_TEXT_LENGTH]
+    return len(reader.pages), text, _first_page_image(path, reader)
+
+
+def _save_thumbnail(upload_folder, filename, image):
+    path = os.path.join(upload_folder, thumbnail_name(filename))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    height = max(1, round(image.height * THUMBNAIL_WIDTH / image.width))
+    thumbnail = image.convert('RGB').resize((THUMBNAIL_WIDTH, height))
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(fd, 'wb') as output:
+        thumbnail.save(output, 'WEBP', quality=75)
+    os.replace(temp_path, path)
+    return thumbnail_name(filename)
+
+
+def index_file(db, upload_folder, filename):
+    """Extracts one stored PDF and records the result (or the error) in upload_documents.
+
+    Also writes its precompressed copies, the other slow step after an upload.
+    """
+    uploads.precompress(os.path.join(upload_folder, filename))
+    try:
+        page_count, text, image = extract_document(os.path.join(upload_folder, filename))
+        thumbnail = _save_thumbnail(upload_folder, filename, image) if image is not None else None
+    except Exception as error:
+        db.execute(
+            "INSERT OR REPLACE INTO upload_documents (filename, status, error, extracted_at) "
+            "VALUES (?, 'failed', ?, CURRENT_TIMESTAMP)",
+            (filename, f'{type(error).__name__}: {error}'[:500])
+        )
+    else:
+        db.execute(
+            "INSERT OR REPLACE INTO upload_documents (filename, status, page_count, text, thumbnail, extracted_at) "
+            "VALUES (?, 'done', ?, ?, ?, CURRENT_TIMESTAMP)",
+            (filename, page_count, text, thumbnail)
+        )
+    db.commit()
+
+
+def pending_files(db, upload_folder):
+    """Returns the notice PDFs on disk that have no upload_documents row yet."""
+    rows = db.execute('''
+        SELECT DISTINCT filename FROM notices
+        WHERE filename NOT IN (SELECT filename FROM upload_documents)
+    ''')
+    return [row[0] for row in rows if os.path.isfile(os.path.join(upload_folder, row[0]))]
+
+
+def index_pending(database, upload_folder):
+    """Indexes every pending notice PDF. Returns how many were processed."""
+    db = sqlite3.connect(database, timeout=30)
+    try:
+        pending = pending_files(db, upload_folder)
+        for filename in pending:
+            index_file(db, upload_folder, filename)
+        return len(pending)
+    finally:
+        db.close()
+
+
+def index_is_current(db):
+    """Tells whether notices_fts was created with FTS_TOKENIZE."""
+    row = db.execute("SELECT sql FROM sqlite_master WHERE name = 'notices_fts'").fetchone()
+    return row is not None and FTS_TOKENIZE in row[0]
+
+
+def rebuild_index(db, stale_only=False):
+    """Recreates notices_fts with FTS_TOKENIZE and fills it from the notices and their PDF text.
+
+    Runs in one write transaction; with ``stale_only`` it first checks, under
+    the lock, that the index still needs it, so workers starting together
+    rebuild it once. The triggers in migrations.py refer to the table by
+    name, so they keep working. Returns True if the index was rebuilt.
+    """
+    db.execute('BEGIN IMMEDIATE')
+    try:
+        if stale_only and index_is_current(db):
+            db.rollback()
+            return False
+        db.execute('DROP TABLE IF EXISTS notices_fts')
+        db.execute(FTS_TABLE_SQL)
+        db.execute(FILL_INDEX_SQL)
+        db.commit()
+    except BaseException:
+        db.rollback()
+        raise
+    return True
+
+
+def fts_query(text):
+    """Turns what a visitor typed into an FTS5 query: every word must match, as a prefix.
+
+    Quoting each word keeps FTS5 operators and punctuation from being
+    interpreted, so any input is a valid query.
+    """
+    words = text.split()
+    return ' '.join('"{}"*'.format(word.replace('"', '""')) for word in words)
+
+
+def search_notices(db, text, limit=20):
+    """Returns notices matching text, best match first, as dicts with an HTML snippet."""
+    query = fts_query(text)
+    if not query:
+        return []
+    rows = db.execute('''
+        SELECT n.id, n.title, n.summary, n.filename, n.timestamp, d.page_count, d.thumbnail,
+               snippet(notices_fts, -1, ?, ?, ' ... ', 16) AS snippet
+        FROM notices_fts
+        JOIN notices n ON n.id = notices_fts.rowid
+        LEFT JOIN upload_documents d ON d.filename = n.filename
+        WHERE notices_fts MATCH ?
+        ORDER BY bm25(notices_fts, 10.0, 5.0, 1.0)
+        LIMIT ?
+    ''', (_MATCH_START, _MATCH_END, query, limit)).fetchall()
+    results = []
+    for row in rows:
+        result = dict(row)
+        snippet = html.escape(result.pop('snippet') or '')
+        result['snippet_html'] = snippet.replace(_MATCH_START, '<mark>').replace(_MATCH_END, '</mark>')
+        results.append(result)
+    return results
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 3 and sys.argv[1] == 'rebuild':
+        connection = sqlite3.connect(sys.argv[2], timeout=30)
+        rebuild_index(connection)
+        connection.close()
+        print('Rebuilt the notice search index')
+        sys.exit()
+    if len(sys.argv) != 4 or sys.argv[1] != 'pending':
+        sys.exit('usage: python notice_index.py pending DATABASE UPLOAD_FOLDER | rebuild DATABASE')
+    print(f'Indexed {index_pending(sys.argv[2], sys.argv[3])} file(s)')
@@ -0,0 +1,184 @@
+"""Rendered-page cache for public pages whose HTML only changes on deploy.
+
+A page is rendered once, compressed once (gzip, plus brotli when the optional
+``brotli`` package is installed) and kept both in this process and on disk, so
+other Passenger workers and freshly recycled ones reuse it instead of
+rendering it again. Entries are keyed by endpoint and by the modification time
+of the template and every template it extends or includes, so editing a
+template is enough to invalidate its pages.
+
+Pages built from database rows (the home gallery, the notice board) name the
+data they depend on. Each name has a version token kept in a small file that
+every worker can see; the admin views that change the data call
+``bump_data_version`` and the next request renders the page again. Until then
+public requests are served without touching SQLite.
+
+Responses carry a strong ETag and are answered with 304 Not Modified when the
+browser already has them.
+"""
+import gzip
+import hashlib
+import os
+import pickle
+import tempfile
+import time
+
+from flask import current_app, make_response, render_template, request
+from jinja2 import meta
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# endpoint -> entry dict, see _build_entry
+_pages = {}
+# template name -> files it is built from (itself, layouts, includes)
+_template_files = {}
+
+
+def _files_for_template(name):
+    """Returns the source files of a template and everything it extends or includes."""
+    if name not in _template_files:
+        env = current_app.jinja_env
+        files = []
+        pending = [name]
+        seen = set()
+        while pending:
+            current = pending.pop()
+            if current in seen:
+                continue
+            seen.add(current)
+            source, filename, _ = env.loader.get_source(env, current)
+            files.append(filename)
+            pending.extend(ref for ref in meta.find_referenced_templates(env.parse(source)) if ref)
+        _template_files[name] = files
+    return _template_files[name]
+
+
+def _version_path(name):
+    return os.path.join(current_app.config['DATA_VERSION_DIR'], name)
+
+
+def get_data_version(name):
+    """Returns the current version token of a data set ('0' until it is first bumped)."""
+    try:
+        with open(_version_path(name)) as version_file:
+            return version_file.read()
+    except OSError:
+        return '0'
+
+
+def bump_data_version(name):
+    """Marks a data set as changed so every page built from it is rendered again.
+
+    Call after committing the change. The token only has to differ from the
+    previous one, so no locking is needed between workers.
+    """
+    directory = current_app.config['DATA_VERSION_DIR']
+    try:
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as output:
+            output.write(f'{time.time_ns()}-{os.getpid()}')
+        os.replace(temp_path, _version_path(name))
+    except OSError:
+        current_app.logger.warning('Could not bump data version %s', name, exc_info=True)
+
+
+def _cache_key(endpoint, template, data=()):
+    """Identifies one rendering of an endpoint: changes whenever a source template or its data changes."""
+    digest = hashlib.sha1(endpoint.encode())
+    for filename in _files_for_template(template):
+        stat = os.stat(filename)
+        digest.update(f'{filename}:{stat.st_mtime_ns}:{stat.st_size}'.encode())
+    for name in data:
+        digest.update(f'{name}:{get_data_version(name)}'.encode())
+    for path in current_app.config['PAGE_CACHE_WATCH']:
+        try:
+            digest.update(f'{path}:{os.stat(path).st_mtime_ns}'.encode())
+        except OSError:
+            pass
+    return digest.hexdigest()
+
+
+def _build_entry(key, html):
+    body = html.encode('utf-8')
+    etag = hashlib.sha256(body).hexdigest()[:32]
+    variants = {'identity': body, 'gzip': gzip.compress(body, compresslevel=9)}
+    if brotli is not None:
+        variants['br'] = brotli.compress(body, quality=11)
+    return {'key': key, 'etag': etag, 'variants': variants}
+
+
+def _disk_path(endpoint):
+    return os.path.join(current_app.config['PAGE_CACHE_DIR'], f'{endpoint}.page')
+
+
+def _load_from_disk(endpoint, key):
+    try:
+        with open(_disk_path(endpoint), 'rb') as cached:
+            entry = pickle.load(cached)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return None
+    return entry if entry.get('key') == key else None
+
+
+def _save_to_disk(endpoint, entry):
+    """Writes the entry atomically so other workers never read a partial file."""
+    directory = current_app.config['PAGE_CACHE_DIR']
+    try:
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as output:
+            pickle.dump(entry, output, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, _disk_path(endpoint))
+    except OSError:
+        current_app.logger.warning('Could not write page cache for %s', endpoint, exc_info=True)
+
+
+def _respond(entry, max_age):
+    """Builds the response for the best encoding the client accepts, or a 304."""
+    encoding = 'identity'
+    for candidate in ('br', 'gzip'):
+        if candidate in entry['variants'] and request.accept_encodings[candidate]:
+            encoding = candidate
+            break
+    etag = entry['etag'] if encoding == 'identity' else f"{entry['etag']}-{encoding}"
+
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+    else:
+        response = make_response(entry['variants'][encoding])
+        response.content_type = 'text/html; charset=utf-8'
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+    response.set_etag(etag)
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.max_age = max_age
+    return response
+
+
+def render_cached_page(template, data=(), context=None):
+    """Renders a template through the page cache and returns the response.
+
+    ``data`` names the data sets the page is built from and ``context`` is a
+    callable returning the template variables; it is only called when the page
+    has to be rendered again.
+    """
+    if not current_app.config['PAGE_CACHE_ENABLED']:
+        return render_template(template, **(context() if context else {}))
+
+    endpoint = request.endpoint
+    key = _cache_key(endpoint, template, data)
+    entry = _pages.get(endpoint)
+    if entry is None or entry['key'] != key:
+        entry = _load_from_disk(endpoint, key)
+        if entry is None:
+            entry = _build_entry(key, render_template(template, **(context() if context else {})))
+            _save_to_disk(endpoint, entry)
+        _pages[endpoint] = entry
+    # Browsers revalidate data-backed pages (a cheap 304) so admin changes show up at once
+    max_age = current_app.config['PAGE_CACHE_DATA_MAX_AGE' if data else 'PAGE_CACHE_MAX_AGE']
+    return _respond(entry, max_age)
@@ -1 +1,3 @@
-from app import app as application
\ No newline at end of file
+from app import create_app
+
+application = create_app()
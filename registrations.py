@@ -0,0 +1,373 @@
+"""Event registration intake.
+
+Mobile numbers are normalized before they are stored, so the same phone typed
+as 01712-345678, +880 1712 345678 or in Bengali digits is one registration.
+The UNIQUE index on mobile_number (see migrations.py) then turns the duplicate
+check and the insert into one atomic ``INSERT ... ON CONFLICT DO NOTHING``:
+two submissions racing each other cannot both get in.
+
+Committing every registration on its own costs a trip through SQLite's write
+lock and a sync per submission, which is what queues up during campaign
+bursts. A RegistrationWriter (REGISTRATION_GROUP_COMMIT in app.py) instead
+collects the registrations submitted by a worker's request threads and writes
+everything that arrived while the previous commit was in progress in a single
+transaction. A lone submission is written immediately; batches only form
+under load.
+
+The bulk admin operations below work on any number of registrations in one
+transaction and one statement per step: ids are passed as a JSON array
+(``json_each``), voucher assignments go through a temp table and are
+validated against each other and the stored vouchers in a single query.
+"""
+import csv
+import io
+import json
+import queue
+import re
+import threading
+from concurrent.futures import Future
+
+# openpyxl is imported in read_voucher_file, only when an .xlsx is imported
+
+_BENGALI_DIGITS = str.maketrans('০১২৩৪৫৬৭৮৯', '0123456789')
+_SEPARATORS = re.compile(r'[\s\-().]')
+# Bangladeshi mobile numbers: 01 + operator digit 3-9 + 8 digits
+_LOCAL_MOBILE = re.compile(r'^01[3-9]\d{8}$')
+_COUNTRY_CODE = '880'
+
+# Recognized column titles in voucher imports (lowercase, without spaces or
+# underscores); the export's 'Mobile' and 'Voucher' columns are among them
+MOBILE_COLUMNS = {'mobile', 'mobilenumber', 'phone', 'phonenumber'}
+VOUCHER_COLUMNS = {'voucher', 'vouchernumber'}
+VOUCHER_FILE_EXTENSIONS = {'csv', 'xlsx'}
+MAX_REPORTED_PROBLEMS = 100
+
+INSERT_REGISTRATION = '''
+    INSERT INTO event_registrations (full_name, address, mobile_number, reference)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT (mobile_number) DO NOTHING
+'''
+
+
+def normalize_mobile(value):
+    """Returns the canonical form of a mobile number, or None if it is not one.
+
+    Bangladeshi numbers become the 11-digit local form (01XXXXXXXXX), with or
+    without +880/00880/880 in front. Other numbers are accepted in
+    international form (+ and 8 to 15 digits) and kept as +digits.
+    """
+    number = _SEPARATORS.sub('', (value or '').translate(_BENGALI_DIGITS))
+    international = number.startswith('+')
+    if international:
+        number = number[1:]
+    elif number.startswith('00'):
+        number, international = number[2:], True
+    if not number.isascii() or not number.isdigit():
+        return None
+    if number.startswith(_COUNTRY_CODE) and _LOCAL_MOBILE.match('0' + number[len(_COUNTRY_CODE):]):
+        return '0' + number[len(_COUNTRY_CODE):]
+    if not international:
+        if _LOCAL_MOBILE.match(number):
+            return number
+        if _LOCAL_MOBILE.match('0' + number):
+            return '0' + number
+        return None
+    return '+' + number if 8 <= len(number) <= 15 else None
+
+
+def insert_registration(db, full_name, address, mobile_number, reference):
+    """Inserts a registration unless its mobile number is taken. Returns True if it was inserted.
+
+    Does not commit.
+    """
+    return db.execute(INSERT_REGISTRATION, (full_name, address, mobile_number, reference)).rowcount == 1
+
+
+class RegistrationWriter:
+    """Background thread that group-commits registrations for one worker process.
+
+    ``submit`` returns a Future that resolves to True (registered) or False
+    (mobile number already registered) once the registration is committed.
+    A Future cancelled before the writer reaches it is never written. If the
+    thread itself fails (e.g. it cannot open its connection), everything
+    queued fails with the error and the next ``submit`` starts a new thread.
+    """
+
+    def __init__(self, connect, batch_size=100):
+        self._connect = connect
+        self.batch_size = batch_size
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, full_name, address, mobile_number, reference):
+        future = Future()
+        self._queue.put(((full_name, address, mobile_number, reference), future))
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='registration-writer', daemon=True)
+                self._thread.start()
+        return future
+
+    def _run(self):
+        batch = []
+        try:
+            connection = self._connect()
+            while True:
+                batch = [self._queue.get()]
+                # Whatever queued up while the last batch was being committed
+                while len(batch) < self.batch_size:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                self._write(connection, batch)
+                batch = []
+        except Exception as error:
+            with self._lock:
+                # Under the lock, so a submit either lands here or starts a new thread
+                while True:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                self._thread = None
+            _fail(batch, error)
+
+    def _write(self, connection, batch):
+        # Skips the registrations whose submitter gave up waiting
+        batch = [entry for entry in batch if entry[1].set_running_or_notify_cancel()]
+        if not batch:
+            return
+        try:
+            connection.execute('BEGIN IMMEDIATE')
+            results = [insert_registration(connection, *values) for values, _ in batch]
+            connection.commit()
+        except Exception as error:
+            if connection.in_transaction:
+                connection.rollback()
+            _fail(batch, error)
+            return
+        for (_, future), inserted in zip(batch, results):
+            future.set_result(inserted)
+
+
+def _fail(batch, error):
+    for _, future in batch:
+        if future.running() or future.set_running_or_notify_cancel():
+            future.set_exception(error)
+
+
+def _id_list(ids):
+    """Returns ids as a JSON array for ``json_each``, rejecting anything but integers."""
+    if not all(isinstance(registration_id, int) and not isinstance(registration_id, bool) for registration_id in ids):
+        raise ValueError('Registration ids must be integers')
+    return json.dumps(sorted(set(ids)))
+
+
+def approve_many(db, ids):
+    """Approves the given registrations that have a voucher number. Returns a summary dict.
+
+    Like approve_registration, registrations without a voucher are left
+    pending; they are listed under ``without_voucher``.
+    """
+    id_list = _id_list(ids)
+    db.execute('BEGIN IMMEDIATE')
+    try:
+        rows = db.execute('''
+            SELECT id, is_approved, COALESCE(voucher_number, '') != '' AS has_voucher
+            FROM event_registrations WHERE id IN (SELECT value FROM json_each(?))
+        ''', (id_list,)).fetchall()
+        approved = db.execute('''
+            UPDATE event_registrations SET is_approved = 1, approved_date = CURRENT_TIMESTAMP
+            WHERE id IN (SELECT value FROM json_each(?))
+              AND NOT is_approved AND COALESCE(voucher_number, '') != ''
+        ''', (id_list,)).rowcount
+        db.commit()
+    except BaseException:
+        db.rollback()
+        raise
+    found = {row[0] for row in rows}
+    return {
+        'approved': approved,
+        'already_approved': sum(1 for row in rows if row[1]),
+        'without_voucher': [row[0] for row in rows if not row[1] and not row[2]],
+        'not_found': sorted(set(ids) - found),
+    }
+
+
+def delete_many(db, ids):
+    """Deletes the given registrations. Returns a summary dict."""
+    id_list = _id_list(ids)
+    db.execute('BEGIN IMMEDIATE')
+    try:
+        found = [row[0] for row in db.execute(
+            'SELECT id FROM event_registrations WHERE id IN (SELECT value FROM json_each(?))', (id_list,)
+        )]
+        deleted = db.execute(
+            'DELETE FROM event_registrations WHERE id IN (SELECT value FROM json_each(?))', (id_list,)
+        ).rowcount
+        db.commit()
+    except BaseException:
+        db.rollback()
+        raise
+    return {'deleted': deleted, 'not_found': sorted(set(ids) - set(found))}
+
+
+def assign_vouchers(db, assignments, approve=False):
+    """Assigns voucher numbers to many registrations at once, all or nothing.
+
+    assignments are dicts with ``voucher_number`` and either ``id`` or
+    ``mobile_number`` (normalized here), plus an optional ``line`` used in
+    problem reports (the row number of an imported file). Vouchers may move
+    between the registrations in the batch, e.g. two registrations may swap
+    theirs. With approve, the registrations are approved as well.
+
+    Returns a summary dict; if any assignment is invalid nothing is changed
+    and the summary lists the problems instead.
+    """
+    rows = []
+    problems = []
+    for index, assignment in enumerate(assignments, 1):
+        line = assignment.get('line', index)
+        voucher_number = str(assignment.get('voucher_number') or '').strip()
+        registration_id = assignment.get('id')
+        mobile_number = None
+        if registration_id is None:
+            mobile_number = normalize_mobile(str(assignment.get('mobile_number') or ''))
+            if mobile_number is None:
+                problems.append({'line': line, 'problem': 'invalid mobile number'})
+                continue
+        elif not isinstance(registration_id, int) or isinstance(registration_id, bool):
+            problems.append({'line': line, 'problem': 'invalid registration id'})
+            continue
+        if not voucher_number:
+            problems.append({'line': line, 'problem': 'missing voucher number'})
+            continue
+        rows.append((line, registration_id, mobile_number, voucher_number))
+    if problems:
+        return _problem_summary(len(assignments), problems)
+
+    db.execute('BEGIN IMMEDIATE')
+    try:
+        db.execute('''
+            CREATE TEMP TABLE voucher_assignments (
+                line INTEGER PRIMARY KEY,
+                registration_id INTEGER,
+                mobile_number TEXT,
+                voucher_number TEXT NOT NULL
+            )
+        ''')
+        db.executemany('INSERT INTO voucher_assignments VALUES (?, ?, ?, ?)', rows)
+        db.execute('''
+            UPDATE voucher_assignments SET registration_id = (
+                SELECT id FROM event_registrations r WHERE r.mobile_number = voucher_assignments.mobile_number
+            ) WHERE registration_id IS NULL
+        ''')
+        db.execute('CREATE INDEX temp.voucher_assignments_registration ON voucher_assignments (registration_id)')
+        db.execute('CREATE INDEX temp.voucher_assignments_voucher ON voucher_assignments (voucher_number)')
+
+        # Every conflict within the batch or with stored vouchers, in one pass
+        problems = [dict(line=row[0], problem=row[1]) for row in db.execute('''
+            SELECT a.line, CASE
+                WHEN r.id IS NULL THEN
+                    CASE WHEN a.mobile_number IS NULL THEN 'registration not found' ELSE 'mobile number not registered' END
+                WHEN (SELECT COUNT(*) FROM voucher_assignments b WHERE b.voucher_number = a.voucher_number) > 1
+                    THEN 'voucher number repeated'
+                WHEN (SELECT COUNT(*) FROM voucher_assignments b WHERE b.registration_id = a.registration_id) > 1
+                    THEN 'registration repeated'
+                WHEN EXISTS (
+                    SELECT 1 FROM event_registrations o
+                    WHERE o.voucher_number = a.voucher_number AND o.id != r.id
+                      AND o.id NOT IN (SELECT registration_id FROM voucher_assignments WHERE registration_id IS NOT NULL)
+                ) THEN 'voucher number already used'
+            END AS problem
+            FROM voucher_assignments a
+            LEFT JOIN event_registrations r ON r.id = a.registration_id
+            WHERE problem IS NOT NULL
+            ORDER BY a.line
+        ''')]
+        if problems:
+            db.rollback()
+            return _problem_summary(len(assignments), problems)
+
+        # Clear first: the UNIQUE constraint is checked row by row, so swapped
+        # vouchers would otherwise collide halfway through
+        db.execute('''
+            UPDATE event_registrations SET voucher_number = NULL
+            WHERE id IN (SELECT registration_id FROM voucher_assignments)
+        ''')
+        assigned = db.execute('''
+            UPDATE event_registrations SET voucher_number = a.voucher_number
+            FROM voucher_assignments a WHERE a.registration_id = event_registrations.id
+        ''').rowcount
+        approved = 0
+        if approve:
+            approved = db.execute('''
+                UPDATE event_registrations SET is_approved = 1, approved_date = CURRENT_TIMESTAMP
+                WHERE id IN (SELECT registration_id FROM voucher_assignments) AND NOT is_approved
+            ''').rowcount
+        db.commit()
+    except BaseException:
+        if db.in_transaction:
+            db.rollback()
+        raise
+    finally:
+        db.execute('DROP TABLE IF EXISTS temp.voucher_assignments')
+    return {'ok': True, 'rows': len(assignments), 'assigned': assigned, 'approved': approved}
+
+
+def _problem_summary(row_count, problems):
+    return {
+        'ok': False,
+        'rows': row_count,
+        'problem_count': len(problems),
+        'problems': problems[:MAX_REPORTED_PROBLEMS],
+    }
+
+
+def _column_key(title):
+    return re.sub(r'[\s_]', '', str(title or '')).lower()
+
+
+def _cell_text(value):
+    # Spreadsheets turn 01712345678 into the number 1712345678
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return '' if value is None else str(value).strip()
+
+
+def read_voucher_file(fileobj, extension):
+    """Reads (line, mobile_number, voucher_number) assignments from an uploaded CSV or XLSX file.
+
+    The columns are found by their titles in the first row (Mobile/Mobile
+    Number/Phone and Voucher/Voucher Number, as in the Excel export); without
+    recognizable titles the first two columns are mobile and voucher.
+    """
+    if extension == 'xlsx':
+        from openpyxl import load_workbook
+        workbook = load_workbook(fileobj, read_only=True, data_only=True)
+        try:
+            rows = [[_cell_text(value) for value in row] for row in workbook.active.iter_rows(values_only=True)]
+        finally:
+            workbook.close()
+    elif extension == 'csv':
+        text = fileobj.read().decode('utf-8-sig', errors='replace')
+        rows = [[cell.strip() for cell in row] for row in csv.reader(io.StringIO(text))]
+    else:
+        raise ValueError(f'Unsupported voucher file type: {extension}')
+
+    mobile_column, voucher_column, first = 0, 1, 0
+    if rows:
+        keys = [_column_key(title) for title in rows[0]]
+        mobile = next((i for i, key in enumerate(keys) if key in MOBILE_COLUMNS), None)
+        voucher = next((i for i, key in enumerate(keys) if key in VOUCHER_COLUMNS), None)
+        if mobile is not None and voucher is not None:
+            mobile_column, voucher_column, first = mobile, voucher, 1
+    assignments = []
+    for line, row in enumerate(rows[first:], first + 1):
+        if not any(row):
+            continue
+        cell = lambda column: row[column] if column < len(row) else ''
+        assignments.append({'line': line, 'mobile_number': cell(mobile_column), 'voucher_number': cell(voucher_column)})
+    return assignments
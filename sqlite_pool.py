@@ -0,0 +1,108 @@
+"""Per-process pool of tuned SQLite connections.
+
+Opening a connection costs a file open, schema parsing and cold statement and
+page caches. The pool keeps a handful of connections per worker so requests
+reuse them, together with their prepared statements (sqlite3's per-connection
+statement cache) and warm page cache.
+
+Every connection gets the same settings: WAL journal (readers no longer block
+the writer and vice versa), a busy timeout instead of immediate "database is
+locked" errors, and tuned synchronous/cache_size/mmap_size.
+
+The pool never blocks: if every idle connection is taken (e.g. by long-lived
+event streams) a new one is opened, and connections beyond ``size`` are
+closed when they come back. A pool inherited through fork() is discarded,
+because SQLite connections must not be shared between processes.
+"""
+import os
+import sqlite3
+import threading
+
+
+class ConnectionPool:
+    def __init__(self, database, size=8, journal_mode='WAL', busy_timeout=5000, synchronous='NORMAL',
+                 cache_size=-16000, mmap_size=64 * 1024 * 1024, cached_statements=256, row_factory=sqlite3.Row):
+        self.database = database
+        self.size = size
+        self.journal_mode = journal_mode
+        self.busy_timeout = busy_timeout
+        self.synchronous = synchronous
+        self.cache_size = cache_size
+        self.mmap_size = mmap_size
+        self.cached_statements = cached_statements
+        self.row_factory = row_factory
+        self._idle = []
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._journal_mode_set = False
+
+    @classmethod
+    def from_config(cls, config):
+        """Builds a pool from the app's DATABASE and SQLITE_* settings."""
+        return cls(
+            config['DATABASE'],
+            size=config['SQLITE_POOL_SIZE'],
+            journal_mode=config['SQLITE_JOURNAL_MODE'],
+            busy_timeout=config['SQLITE_BUSY_TIMEOUT'],
+            synchronous=config['SQLITE_SYNCHRONOUS'],
+            cache_size=config['SQLITE_CACHE_SIZE'],
+            mmap_size=config['SQLITE_MMAP_SIZE'],
+            cached_statements=config['SQLITE_CACHED_STATEMENTS'],
+        )
+
+    def connect(self):
+        """Opens a new connection with the pool's settings (not tracked by the pool)."""
+        connection = sqlite3.connect(
+            self.database,
+            timeout=self.busy_timeout / 1000,
+            cached_statements=self.cached_statements,
+            check_same_thread=False,
+        )
+        connection.row_factory = self.row_factory
+        if self.journal_mode and not self._journal_mode_set:
+            # Stored in the database file, so once per process is enough
+            connection.execute(f'PRAGMA journal_mode = {self.journal_mode}')
+            self._journal_mode_set = True
+        connection.execute(f'PRAGMA busy_timeout = {int(self.busy_timeout)}')
+        connection.execute(f'PRAGMA synchronous = {self.synchronous}')
+        connection.execute(f'PRAGMA cache_size = {int(self.cache_size)}')
+        connection.execute(f'PRAGMA mmap_size = {int(self.mmap_size)}')
+        connection.execute('PRAGMA temp_store = MEMORY')
+        return connection
+
+    def _check_pid(self):
+        if self._pid != os.getpid():
+            # Forked: the parent's connections belong to the parent
+            self._idle = []
+            self._lock = threading.Lock()
+            self._pid = os.getpid()
+
+    def acquire(self):
+        """Returns an idle connection, or a new one if none is idle."""
+        self._check_pid()
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return self.connect()
+
+    def release(self, connection):
+        """Returns a connection to the pool, rolling back anything left uncommitted."""
+        self._check_pid()
+        try:
+            if connection.in_transaction:
+                connection.rollback()
+        except sqlite3.Error:
+            connection.close()
+            return
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append(connection)
+                return
+        connection.close()
+
+    def close(self):
+        """Closes every idle connection."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
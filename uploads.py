@@ -0,0 +1,280 @@
+"""Content-addressed storage for admin uploads (notice PDFs, gallery images).
+
+A new upload is stored under the SHA-256 of its bytes, ``<hash>.<ext>``, so
+uploading the same file twice keeps one copy, a same-named upload can never
+overwrite another, and the stored file never changes and can be cached
+forever. Every stored file has a row in ``upload_blobs`` whose refcount is
+maintained by triggers on notices and gallery (see migrations.py). Files are only
+removed by ``collect_unused`` once nothing refers to them.
+
+File system changes happen inside the database write transaction, so a file
+being reused by one admin cannot be collected by another at the same time.
+
+Uploads reach us as an ``UploadStream``: Werkzeug's form parser writes the
+request body into it chunk by chunk, and it writes straight to a temp file in
+the upload folder while hashing, sniffing the type and enforcing the size
+limit. Storing the upload is then a rename, with no second copy.
+
+Stored PDFs get ``.gz`` (and ``.br``, when the optional ``brotli`` package is
+installed) siblings when compressing them is worthwhile, so /uploads can send
+them without compressing anything per request.
+"""
+import gzip
+import hashlib
+import os
+import re
+import tempfile
+
+from werkzeug.exceptions import RequestEntityTooLarge
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+HASH_LENGTH = 32
+CHUNK_SIZE = 64 * 1024
+
+# Leading bytes of each accepted file type; see sniff_kind
+SNIFF_BYTES = 16
+_SIGNATURES = [
+    (b'%PDF-', 'pdf'),
+    (b'\x89PNG\r\n\x1a\n', 'image'),
+    (b'\xff\xd8\xff', 'image'),
+]
+
+# Only these are worth precompressing (images are compressed already), and a
+# compressed copy is only kept when it is at least this much smaller.
+PRECOMPRESS_EXTENSIONS = {'pdf'}
+PRECOMPRESS_MIN_SAVING = 0.1
+# Preferred encoding first
+ENCODING_SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+# Content-addressed files and the images derived from them never change under the same name
+_IMMUTABLE_NAME = re.compile(r'^((variants|thumbnails)/)?[0-9a-f]{%d}(-\d+)?\.[a-z0-9]+$' % HASH_LENGTH)
+
+
+def is_immutable(filename):
+    """Tells whether a file in the upload folder is content-addressed (safe to cache forever)."""
+    return bool(_IMMUTABLE_NAME.match(filename))
+
+
+def name_etag(filename):
+    """Returns the ETag of a content-addressed file from its name alone, else None."""
+    return os.path.basename(filename) if is_immutable(filename) else None
+
+
+def sniff_kind(head):
+    """Returns 'pdf' or 'image' from the first bytes of a file, or None if it is neither."""
+    for signature, kind in _SIGNATURES:
+        if head.startswith(signature):
+            return kind
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image'
+    return None
+
+
+class UploadStream:
+    """Temp file an uploaded file is streamed into, hashed and sniffed on the way.
+
+    Raises RequestEntityTooLarge as soon as more than max_size bytes have
+    arrived. The temp file is removed on close unless it was moved into the
+    store by store_upload.
+    """
+
+    def __init__(self, directory, max_size=None):
+        fd, self.path = tempfile.mkstemp(dir=directory, suffix='.upload')
+        self._file = os.fdopen(fd, 'w+b')
+        self._digest = hashlib.sha256()
+        self._head = b''
+        self.max_size = max_size
+        self.size = 0
+
+    def write(self, data):
+        self.size += len(data)
+        if self.max_size is not None and self.size > self.max_size:
+            # The parser gives up without handing us to a FileStorage, so
+            # nothing else would close (and remove) the temp file
+            self.close()
+            raise RequestEntityTooLarge()
+        if len(self._head) < SNIFF_BYTES:
+            self._head += data[:SNIFF_BYTES - len(self._head)]
+        self._digest.update(data)
+        return self._file.write(data)
+
+    @property
+    def sha256(self):
+        return self._digest.hexdigest()
+
+    @property
+    def kind(self):
+        return sniff_kind(self._head)
+
+    def move_to(self, path):
+        """Atomically moves the finished file to path."""
+        self._file.close()
+        os.replace(self.path, path)
+        self.path = None
+
+    def close(self):
+        self._file.close()
+        if self.path is not None and os.path.exists(self.path):
+            os.remove(self.path)
+            self.path = None
+
+    def __getattr__(self, name):
+        # read, seek, tell, flush... for Werkzeug's FileStorage
+        return getattr(self._file, name)
+
+
+def file_kind(file):
+    """Returns the sniffed type ('pdf', 'image' or None) of an uploaded FileStorage."""
+    if isinstance(file.stream, UploadStream):
+        return file.stream.kind
+    position = file.stream.tell()
+    head = file.stream.read(SNIFF_BYTES)
+    file.stream.seek(position)
+    return sniff_kind(head)
+
+
+def _hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as source:
+        for chunk in iter(lambda: source.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def store_upload(db, upload_folder, file, extension):
+    """Stores an uploaded file by content and returns the name it is stored under.
+
+    Opens the write transaction: the caller inserts or updates the row that
+    uses the returned name (which bumps the refcount) and commits.
+    """
+    stream = file.stream
+    if not isinstance(stream, UploadStream):
+        # Not parsed by UploadRequest (e.g. built by hand): copy it over first
+        stream = UploadStream(upload_folder)
+        for chunk in iter(lambda: file.stream.read(CHUNK_SIZE), b''):
+            stream.write(chunk)
+    try:
+        sha256 = stream.sha256
+        db.execute('BEGIN IMMEDIATE')
+        existing = db.execute('SELECT filename FROM upload_blobs WHERE sha256 = ? LIMIT 1', (sha256,)).fetchone()
+        filename = existing[0] if existing else f'{sha256[:HASH_LENGTH]}.{extension.lower()}'
+        db.execute(
+            'INSERT OR IGNORE INTO upload_blobs (filename, sha256, size) VALUES (?, ?, ?)',
+            (filename, sha256, stream.size)
+        )
+        path = os.path.join(upload_folder, filename)
+        if os.path.exists(path):
+            stream.close()
+        else:
+            stream.move_to(path)
+    except BaseException:
+        if db.in_transaction:
+            db.rollback()
+        raise
+    finally:
+        if stream is not file.stream:
+            stream.close()
+    return filename
+
+
+def precompress(path):
+    """Writes compressed siblings of a stored file when they save enough space.
+
+    Can take seconds for a large PDF, so call it after committing.
+    """
+    if path.rsplit('.', 1)[-1].lower() not in PRECOMPRESS_EXTENSIONS or has_precompressed(path):
+        return
+    try:
+        size = os.path.getsize(path)
+    except FileNotFoundError:
+        # Already collected again
+        return
+    compressors = {'gzip': lambda output: gzip.GzipFile(fileobj=output, mode='wb', compresslevel=9, mtime=0)}
+    if brotli is not None:
+        compressors['br'] = lambda output: _BrotliWriter(output)
+    for encoding, open_compressor in compressors.items():
+        target = path + ENCODING_SUFFIXES[encoding]
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as output, open(path, 'rb') as source:
+                compressor = open_compressor(output)
+                for chunk in iter(lambda: source.read(CHUNK_SIZE), b''):
+                    compressor.write(chunk)
+                compressor.close()
+            if os.path.getsize(temp_path) <= size * (1 - PRECOMPRESS_MIN_SAVING):
+                os.replace(temp_path, target)
+        except FileNotFoundError:
+            return
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+
+class _BrotliWriter:
+    def __init__(self, output):
+        self._output = output
+        self._compressor = brotli.Compressor(quality=11)
+
+    def write(self, data):
+        self._output.write(self._compressor.process(data))
+
+    def close(self):
+        self._output.write(self._compressor.finish())
+
+
+def precompressed(path, accept_encodings):
+    """Returns (path, encoding) of the best precompressed sibling the client accepts, or (path, None)."""
+    for encoding, suffix in ENCODING_SUFFIXES.items():
+        if accept_encodings[encoding] and os.path.isfile(path + suffix):
+            return path + suffix, encoding
+    return path, None
+
+
+def has_precompressed(path):
+    return any(os.path.isfile(path + suffix) for suffix in ENCODING_SUFFIXES.values())
+
+
+def collect_unused(db, upload_folder):
+    """Deletes files no notice or gallery image refers to any more and returns their names."""
+    db.execute('BEGIN IMMEDIATE')
+    try:
+        unused = [row[0] for row in db.execute('SELECT filename FROM upload_blobs WHERE refcount <= 0')]
+        db.execute('DELETE FROM upload_blobs WHERE refcount <= 0')
+        for filename in unused:
+            path = os.path.join(upload_folder, filename)
+            for sibling in [path] + [path + suffix for suffix in ENCODING_SUFFIXES.values()]:
+                try:
+                    os.remove(sibling)
+                except FileNotFoundError:
+                    pass
+        db.commit()
+    except BaseException:
+        db.rollback()
+        raise
+    return unused
+
+
+def register_existing(db, upload_folder):
+    """Adds files referenced by notices or gallery rows but not yet in upload_blobs.
+
+    Covers uploads made before the blob store existed; they keep their names.
+    """
+    missing = [row[0] for row in db.execute('''
+        SELECT filename FROM notices UNION SELECT filename FROM gallery
+        EXCEPT SELECT filename FROM upload_blobs
+    ''')]
+    for filename in missing:
+        path = os.path.join(upload_folder, filename)
+        if not os.path.isfile(path):
+            continue
+        db.execute(
+            '''INSERT OR IGNORE INTO upload_blobs (filename, sha256, size, refcount)
+               VALUES (?, ?, ?, (SELECT COUNT(*) FROM notices WHERE filename = ?) + (SELECT COUNT(*) FROM gallery WHERE filename = ?))''',
+            (filename, _hash_file(path), os.path.getsize(path), filename, filename)
+        )
+    db.commit()
+    return missing